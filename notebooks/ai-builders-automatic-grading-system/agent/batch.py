@@ -0,0 +1,234 @@
+#Concurrent cohort grading
+import asyncio
+import json
+import logging
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from agent.checkpoint import release_thread
+from agent.metrics import CohortMetrics, RunMetrics, invoke_with_metrics
+from agent.results import ResultsSink
+
+logger = logging.getLogger(__name__)
+
+TRANSIENT_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+TRANSIENT_ERROR_NAMES = {
+    'RateLimitError', 'APITimeoutError', 'APIConnectionError', 'InternalServerError',
+    'TimeoutError', 'ConnectionError', 'ReadTimeout', 'ConnectTimeout',
+}
+#Output tokens counted against tokens_per_minute for every call.
+COMPLETION_BUDGET = 500
+
+
+class TokenBucket:
+    """Asyncio token bucket refilled continuously at `per_minute` units."""
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1):
+        #Requests larger than the bucket would wait forever; let them through at full capacity.
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            self._refill()
+            while self.tokens < amount:
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= amount
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits, either may be None."""
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    async def acquire(self, requests: int = 1, tokens: int = 0):
+        if self.requests is not None:
+            await self.requests.acquire(requests)
+        if self.tokens is not None and tokens:
+            await self.tokens.acquire(tokens)
+
+
+def is_transient(error: BaseException) -> bool:
+    status = getattr(error, 'status_code', None) or getattr(getattr(error, 'response', None), 'status_code', None)
+    if status in TRANSIENT_STATUS_CODES:
+        return True
+    return any(cls.__name__ in TRANSIENT_ERROR_NAMES for cls in type(error).__mro__)
+
+
+def estimate_tokens(messages) -> int:
+    """Rough size of one chat model call: 4 chars per prompt token plus a completion budget."""
+    chars = sum(len(json.dumps(m.content) if not isinstance(m.content, str) else m.content)
+                for batch in messages for m in batch)
+    return chars // 4 + COMPLETION_BUDGET
+
+
+class RateLimitCallback(BaseCallbackHandler):
+    """Takes one request and the call's estimated tokens from a RateLimiter before every chat model call.
+
+    Nodes run on worker threads while the limiter lives on the event loop, so
+    the calling thread blocks until the loop grants the call. The wait counts
+    as queue time of `metrics`. LLM cache hits are charged too, the callback
+    runs before the cache lookup.
+    """
+
+    def __init__(self, limiter: RateLimiter, loop, token_estimator: Callable = estimate_tokens,
+                 metrics: Optional[RunMetrics] = None):
+        self.limiter = limiter
+        self.loop = loop
+        self.token_estimator = token_estimator
+        self.metrics = metrics
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        start = time.perf_counter()
+        asyncio.run_coroutine_threadsafe(
+            self.limiter.acquire(1, self.token_estimator(messages)), self.loop
+        ).result()
+        if self.metrics is not None:
+            self.metrics.queue_time += time.perf_counter() - start
+
+
+def grade_student(graph, exec_state: dict, recursion_limit: int = 10,
+                  metrics: Optional[RunMetrics] = None, queued_at: Optional[float] = None, callbacks=None):
+    config = {
+        "configurable": {"thread_id": str(uuid.uuid4()), "run_name": "AIBuildersDemo"},
+        "recursion_limit": recursion_limit,
+    }
+    if callbacks:
+        config["callbacks"] = list(callbacks)
+    try:
+        if metrics is None:
+            final_state = graph.invoke(exec_state, config)
+        else:
+            if queued_at is not None:
+                metrics.queue_time += time.perf_counter() - queued_at
+            final_state, _ = invoke_with_metrics(graph, exec_state, config, metrics)
+    finally:
+        release_thread(graph, config)
+    return final_state['current_knowledge_state']
+
+
+async def grade_cohort(
+    students,
+    graph_factory: Callable,
+    concurrency: int = 8,
+    requests_per_minute: Optional[float] = None,
+    tokens_per_minute: Optional[float] = None,
+    token_estimator: Callable = estimate_tokens,
+    max_retries: int = 3,
+    base_delay: float = 1.0,
+    max_delay: float = 30.0,
+    recursion_limit: int = 10,
+    metrics: Optional[CohortMetrics] = None,
+    sink: Optional[ResultsSink] = None,
+    return_results: bool = True,
+):
+    """Grade every student concurrently and return the results in input order.
+
+    `students` is either a dict {student_id: exec_state} or a list of exec
+    states; the result has the same shape. The graph is built once with
+    `graph_factory()` and shared, each student runs on its own thread id.
+    The nodes are synchronous, so students run in a dedicated pool of
+    `concurrency` threads rather than the event loop's default executor
+    (which is capped at a handful of workers).
+    Transient API errors are retried with full-jitter exponential backoff;
+    anything else (or retries running out) becomes {"ERROR": "..."} for that
+    student, like the notebook loop.
+    The rate limits are applied to every chat model call (retries, tool rounds
+    and reflection steps included), `token_estimator(messages)` giving the
+    tokens a call is charged.
+    Pass a CohortMetrics to collect per-student timings, queue time (waiting
+    for a slot or the rate limiter), tokens and call counts.
+    With a ResultsSink every result is appended to its file as soon as the
+    student is done, and students that already have a result there are not
+    graded again (their stored result is returned). The sink is keyed by the
+    dict's keys, so it needs dict input: list positions change when the list does.
+    For large runs pass return_results=False: results then only go to the
+    sink, nothing is kept in memory, and the return value is the counts
+    {"graded": ..., "failed": ..., "skipped": ...}. Read the grades back with
+    agent.results.results_frame(sink.path).
+    """
+    if sink is not None and not isinstance(students, dict):
+        raise ValueError("A ResultsSink needs students as a dict {key: exec_state}, got a list")
+    if not return_results and sink is None:
+        raise ValueError("return_results=False needs a ResultsSink to write the results to")
+    keys = list(students) if isinstance(students, dict) else list(range(len(students)))
+    if return_results:
+        stored = sink.load(key for key in keys if key in sink) if sink is not None else {}
+        pending = [key for key in keys if str(key) not in stored]
+    else:
+        stored = {}
+        pending = [key for key in keys if key not in sink]
+    skipped = len(keys) - len(pending)
+    if skipped:
+        logger.info("Skipping %d students already in %s", skipped, sink.path)
+    graph = graph_factory()
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+    limited = requests_per_minute or tokens_per_minute
+    loop = asyncio.get_running_loop()
+    pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='grade')
+    if metrics is not None:
+        metrics.started = time.perf_counter()
+
+    async def grade(key, exec_state):
+        student_metrics = metrics.student(key) if metrics is not None else None
+        callbacks = [RateLimitCallback(limiter, loop, token_estimator, student_metrics)] if limited else None
+        queued_at = time.perf_counter()
+        async with semaphore:
+            for attempt in range(max_retries + 1):
+                try:
+                    return await loop.run_in_executor(
+                        pool, grade_student, graph, exec_state, recursion_limit, student_metrics, queued_at,
+                        callbacks,
+                    )
+                except Exception as e:
+                    if attempt == max_retries or not is_transient(e):
+                        logger.warning("Grading %s failed: %r", key, e)
+                        return {"ERROR": repr(e)}
+                    delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+                    logger.info("Transient error for %s (%r), retrying in %.2fs", key, e, delay)
+                    await asyncio.sleep(delay)
+                    queued_at = time.perf_counter()
+
+    async def run(key):
+        result = await grade(key, students[key])
+        if sink is not None:
+            sink.write(key, result)
+        return result if return_results else 'ERROR' in result
+
+    try:
+        outcomes = await asyncio.gather(*(run(key) for key in pending))
+    finally:
+        pool.shutdown(wait=False)
+        if metrics is not None:
+            metrics.finish()
+    if not return_results:
+        failed = sum(outcomes)
+        return {'graded': len(pending) - failed, 'failed': failed, 'skipped': skipped}
+    graded = dict(zip(pending, outcomes))
+    results = [graded[key] if key in graded else stored[str(key)] for key in keys]
+    if isinstance(students, dict):
+        return dict(zip(keys, results))
+    return results
+
+
+def run_cohort(students, graph_factory: Callable, **kwargs):
+    """Blocking wrapper around grade_cohort for scripts (use `await grade_cohort` in notebooks)."""
+    return asyncio.run(grade_cohort(students, graph_factory, **kwargs))
@@ -0,0 +1,256 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from langchain_core.caches import BaseCache
+from langchain_core.globals import set_llm_cache
+from langchain_core.load import dumps, loads
+
+from agent.metrics import record
+
+LLM_CACHE_PATH = os.environ.get('LLM_CACHE_PATH', os.path.join('.cache', 'llm_cache.sqlite'))
+
+
+def content_key(*parts) -> str:
+    """Stable sha256 key for any combination of strings/settings."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+def stable_prompt(prompt: str) -> str:
+    """A serialized message list without its per-run parts, for cache keys.
+
+    add_messages gives every message a random id, model replies carry run ids
+    and the API picks random tool-call ids; none of them reach the model as
+    content. Ids are dropped (with the reply metadata) and tool-call ids are
+    renumbered in order of appearance, so identical conversations share a key.
+    """
+    try:
+        messages = json.loads(prompt)
+    except ValueError:
+        return prompt
+    if not isinstance(messages, list):
+        return prompt
+    call_ids = {}
+
+    def call_id(value):
+        return call_ids.setdefault(value, f"call_{len(call_ids)}")
+
+    for message in messages:
+        fields = message.get('kwargs') if isinstance(message, dict) else None
+        if not isinstance(fields, dict):
+            continue
+        for name in ('id', 'response_metadata', 'usage_metadata'):
+            fields.pop(name, None)
+        calls = [*(fields.get('tool_calls') or []), *(fields.get('invalid_tool_calls') or []),
+                 *((fields.get('additional_kwargs') or {}).get('tool_calls') or [])]
+        for call in calls:
+            if isinstance(call, dict) and call.get('id'):
+                call['id'] = call_id(call['id'])
+        if fields.get('tool_call_id'):
+            fields['tool_call_id'] = call_id(fields['tool_call_id'])
+    return json.dumps(messages, sort_keys=True)
+
+
+def _fresh_ids(generations):
+    #Cached replies would otherwise all carry the id of the run that stored them (and add_messages
+    #sets ids in place), so every hit gets copies without one.
+    return [
+        generation.model_copy(update={'message': generation.message.model_copy(update={'id': None})})
+        if getattr(generation, 'message', None) is not None else generation
+        for generation in generations
+    ]
+
+
+class LRUCache:
+    """Thread-safe LRU cache with single-flight creation.
+
+    Parallel callers asking for the same missing key wait for one build
+    instead of each running the factory.
+    """
+
+    def __init__(self, maxsize: int = 8):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def get_or_create(self, key, factory):
+        with self._lock:
+            if key in self._items:
+                self.hits += 1
+                self._items.move_to_end(key)
+                return self._items[key]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        try:
+            with key_lock:
+                value = self.get(key)
+                if value is not None:
+                    with self._lock:
+                        self.hits += 1
+                    return value
+                value = factory()
+                self.put(key, value)
+                with self._lock:
+                    self.misses += 1
+                return value
+        finally:
+            #Also when the factory raises, so a failed build does not leave its lock behind.
+            with self._lock:
+                if self._key_locks.get(key) is key_lock:
+                    self._key_locks.pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+
+class TieredLLMCache(BaseCache):
+    """LLM response cache with an in-memory LRU tier over a SQLite tier.
+
+    LangChain calls lookup/update with the serialized messages as `prompt` and
+    an `llm_string` made of the model, its parameters and any bound kwargs
+    (tools, tool_choice, structured-output schema), so the key covers all of
+    them; message and tool-call ids are left out (see stable_prompt). Entries
+    older than `ttl` seconds are treated as misses and dropped.
+    """
+
+    def __init__(self, path: Optional[str] = LLM_CACHE_PATH, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.path = path
+        self.ttl = ttl
+        self.memory = LRUCache(maxsize=maxsize)
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, value TEXT, created REAL)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def lookup(self, prompt: str, llm_string: str):
+        key = content_key(llm_string, stable_prompt(prompt))
+        entry = self.memory.get(key)
+        if entry is not None and not self._expired(entry[0]):
+            with self._lock:
+                self.memory_hits += 1
+            record(llm_cache_hits=1)
+            return _fresh_ids(entry[1])
+
+        if self.path is not None:
+            with self._lock:
+                row = self._connect().execute(
+                    "SELECT value, created FROM llm_cache WHERE key = ?", (key,)
+                ).fetchone()
+            if row is not None and not self._expired(row[1]):
+                generations = loads(row[0])
+                self.memory.put(key, (row[1], generations))
+                with self._lock:
+                    self.disk_hits += 1
+                record(llm_cache_hits=1)
+                return _fresh_ids(generations)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def update(self, prompt: str, llm_string: str, return_val) -> None:
+        key = content_key(llm_string, stable_prompt(prompt))
+        created = time.time()
+        self.memory.put(key, (created, return_val))
+        if self.path is not None:
+            with self._lock:
+                conn = self._connect()
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?)",
+                    (key, dumps(return_val), created),
+                )
+                conn.commit()
+
+    def evict_expired(self) -> int:
+        """Delete expired rows from disk, returns how many were removed."""
+        if self.ttl is None or self.path is None:
+            return 0
+        with self._lock:
+            conn = self._connect()
+            removed = conn.execute(
+                "DELETE FROM llm_cache WHERE created < ?", (time.time() - self.ttl,)
+            ).rowcount
+            conn.commit()
+        return removed
+
+    def clear(self, **kwargs) -> None:
+        self.memory.clear()
+        if self.path is not None:
+            with self._lock:
+                conn = self._connect()
+                conn.execute("DELETE FROM llm_cache")
+                conn.commit()
+
+    def stats(self) -> dict:
+        hits = self.memory_hits + self.disk_hits
+        total = hits + self.misses
+        return {
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': hits / total if total else 0.0,
+        }
+
+
+def enable_llm_cache(path: Optional[str] = LLM_CACHE_PATH, maxsize: int = 1024, ttl: Optional[float] = None) -> TieredLLMCache:
+    """Opt in to caching every chat model call made by the graphs.
+
+    path=None keeps the cache in memory only.
+    """
+    cache = TieredLLMCache(path=path, maxsize=maxsize, ttl=ttl)
+    cache.evict_expired()
+    set_llm_cache(cache)
+    return cache
+
+
+def disable_llm_cache():
+    set_llm_cache(None)
@@ -0,0 +1,133 @@
+#Checkpointer modes for the grading graphs: "memory", "sqlite" or "none"
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from langgraph.checkpoint.memory import MemorySaver
+
+CHECKPOINT_MODES = ("memory", "sqlite", "none")
+CHECKPOINT_DB = os.environ.get('CHECKPOINT_DB', os.path.join('.cache', 'checkpoints.sqlite'))
+
+
+class BoundedMemorySaver(MemorySaver):
+    """MemorySaver with retention limits.
+
+    Keeps at most `max_checkpoints_per_thread` checkpoints (and the channel
+    blobs they reference) per thread and at most `max_threads` threads, evicting
+    the least recently written thread first. Finished threads are dropped with
+    `release_thread`.
+    """
+
+    delete_finished = True
+
+    def __init__(self, max_threads: int = 256, max_checkpoints_per_thread: int = 2, **kwargs):
+        super().__init__(**kwargs)
+        self.max_threads = max_threads
+        self.max_checkpoints_per_thread = max_checkpoints_per_thread
+        self._threads = OrderedDict()
+        self._retention_lock = threading.Lock()
+
+    def _trim_thread(self, thread_id: str, checkpoint_ns: str):
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        keep = self.max_checkpoints_per_thread
+        if keep is None or len(checkpoints) <= keep:
+            return
+        #Checkpoint ids are time-ordered, the newest sort last.
+        for checkpoint_id in sorted(checkpoints)[:-keep]:
+            checkpoints.pop(checkpoint_id, None)
+            self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+
+        #The newest k checkpoints only reference the newest k versions of a channel.
+        versions = {}
+        for key in list(self.blobs):
+            if key[0] == thread_id and key[1] == checkpoint_ns:
+                versions.setdefault(key[2], []).append(key)
+        for keys in versions.values():
+            for key in sorted(keys, key=lambda k: k[3])[:-keep]:
+                self.blobs.pop(key, None)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        next_config = super().put(config, checkpoint, metadata, new_versions)
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        with self._retention_lock:
+            self._trim_thread(thread_id, checkpoint_ns)
+            self._threads[thread_id] = True
+            self._threads.move_to_end(thread_id)
+            evicted = []
+            while len(self._threads) > self.max_threads:
+                evicted.append(self._threads.popitem(last=False)[0])
+        for old_thread in evicted:
+            self.delete_thread(old_thread)
+        return next_config
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._retention_lock:
+            self._threads.pop(thread_id, None)
+        super().delete_thread(thread_id)
+
+
+def sqlite_checkpointer(path: str = CHECKPOINT_DB, keep_last: int = 1):
+    """SqliteSaver (msgpack-serialized checkpoints) that prunes every thread to its
+    last `keep_last` checkpoints after each write. Needs langgraph-checkpoint-sqlite.
+    """
+    try:
+        from langgraph.checkpoint.sqlite import SqliteSaver
+    except ImportError as e:
+        raise ImportError(
+            "checkpointer='sqlite' requires the langgraph-checkpoint-sqlite package"
+        ) from e
+
+    class PrunedSqliteSaver(SqliteSaver):
+        #Finished threads stay on disk (pruned) so runs can be inspected or resumed.
+        delete_finished = False
+
+        def put(self, config, checkpoint, metadata, new_versions):
+            next_config = super().put(config, checkpoint, metadata, new_versions)
+            if keep_last:
+                args = (str(config["configurable"]["thread_id"]), config["configurable"].get("checkpoint_ns", ""))
+                newest = (
+                    "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+                    "ORDER BY checkpoint_id DESC LIMIT ?"
+                )
+                with self.cursor() as cur:
+                    for table in ("writes", "checkpoints"):
+                        cur.execute(
+                            f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_ns = ? "
+                            f"AND checkpoint_id NOT IN ({newest})",
+                            (*args, *args, keep_last),
+                        )
+            return next_config
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return PrunedSqliteSaver(conn)
+
+
+def make_checkpointer(checkpointer="memory"):
+    """Resolve a graph factory's `checkpointer` argument.
+
+    Accepts one of CHECKPOINT_MODES or an already built saver; "none" returns
+    None, the fast path for stateless one-shot runs.
+    """
+    if not isinstance(checkpointer, str):
+        return checkpointer
+    if checkpointer == "memory":
+        return BoundedMemorySaver()
+    if checkpointer == "sqlite":
+        return sqlite_checkpointer()
+    if checkpointer == "none":
+        return None
+    raise ValueError(f"Unknown checkpointer mode {checkpointer!r}, expected one of {CHECKPOINT_MODES}")
+
+
+def release_thread(graph, config):
+    """Drop a finished thread's checkpoints when the saver supports it."""
+    saver = getattr(graph, 'checkpointer', None)
+    if getattr(saver, 'delete_finished', False):
+        saver.delete_thread(config["configurable"]["thread_id"])
@@ -0,0 +1,134 @@
+#Message-history compaction: digests of read tool results, stubs for superseded drafts, per-call token ceiling
+import functools
+import json
+import os
+from typing import List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+from langgraph.graph.message import add_messages
+
+from agent.context import PARAGRAPH_LABEL, _truncate, count_tokens
+from agent.metrics import record
+
+MESSAGE_TOKEN_CEILING = int(os.environ.get('MESSAGE_TOKEN_CEILING', 0))  # 0 = no ceiling
+DIGEST_TOKENS = int(os.environ.get('DIGEST_TOKENS', 60))
+DIGEST_PREFIX = "[digest] "
+SUPERSEDED_DRAFT = "[Superseded evaluation draft, see the latest evaluation below.]"
+ELIDED = "[elided]"
+#Role and framing tokens the API adds to every message.
+MESSAGE_OVERHEAD = 4
+
+
+def message_tokens(message: BaseMessage) -> int:
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content)
+    tool_calls = getattr(message, 'tool_calls', None)
+    return count_tokens(content) + (count_tokens(json.dumps(tool_calls)) if tool_calls else 0) + MESSAGE_OVERHEAD
+
+
+def history_tokens(messages: List[BaseMessage]) -> int:
+    return sum(message_tokens(m) for m in messages)
+
+
+def tool_digest(content: str) -> str:
+    """Short stand-in for a tool result the model has already read.
+
+    query_lesson results keep the question, the start of the answer and their
+    paragraph labels, so the paragraphs can still be cited (and looked up again
+    with cite_exact); other results are cut to DIGEST_TOKENS.
+    """
+    if content.startswith(DIGEST_PREFIX):
+        return content
+    try:
+        result = json.loads(content)
+    except ValueError:
+        result = None
+    if isinstance(result, dict) and 'messages' in result:
+        labels = result.get('paragraphs') or sorted(set(PARAGRAPH_LABEL.findall(result['messages'])), key=int)
+        labels = [label if str(label).startswith('P') else f"P{label}" for label in labels]
+        text = _truncate(result['messages'], DIGEST_TOKENS)
+        return DIGEST_PREFIX + text + (f" (paragraphs {', '.join(labels)})" if labels else "")
+    return DIGEST_PREFIX + _truncate(content, DIGEST_TOKENS)
+
+
+def _digested(message: ToolMessage) -> ToolMessage:
+    return message.model_copy(update={'content': tool_digest(message.content)})
+
+
+def compaction_updates(messages: List[BaseMessage]) -> List[BaseMessage]:
+    """Replacements (same message id) that compact a graph's message history.
+
+    - tool results followed by a later AI message have been read: digested;
+    - evaluation drafts (unnamed AI messages without tool calls) followed by a
+      newer draft are stubbed. Named messages such as reflection feedback and
+      the tool-call messages are kept, so the turn structure and tool-call ids
+      stay valid.
+    """
+    last_ai = max((i for i, m in enumerate(messages) if isinstance(m, AIMessage)), default=-1)
+    drafts = [i for i, m in enumerate(messages) if isinstance(m, AIMessage) and not m.tool_calls and not m.name]
+    updates = []
+    for i, message in enumerate(messages[:last_ai]):
+        if isinstance(message, ToolMessage) and not message.content.startswith(DIGEST_PREFIX):
+            updates.append(_digested(message))
+        elif i in drafts[:-1] and message.content != SUPERSEDED_DRAFT:
+            updates.append(message.model_copy(update={'content': SUPERSEDED_DRAFT}))
+    return updates
+
+
+def compacting(node):
+    """Wrap a graph node so the message history is compacted in the state before it runs.
+
+    The node sees the compacted history and the replacements are returned with
+    its own update, so compaction adds no graph step (and no recursion step).
+    """
+    @functools.wraps(node)
+    def wrapped(state, *args, **kwargs):
+        messages = state.get('messages') or []
+        updates = compaction_updates(messages)
+        if not updates:
+            return node(state, *args, **kwargs)
+        compacted = add_messages(messages, updates)
+        record(compacted_tokens=history_tokens(messages) - history_tokens(compacted))
+        result = node({**state, 'messages': compacted}, *args, **kwargs)
+        own = result.get('messages', [])
+        return {**result, 'messages': [*updates, *(own if isinstance(own, list) else [own])]}
+    return wrapped
+
+
+def _turns(messages: List[BaseMessage]) -> List[List[BaseMessage]]:
+    """Group an AI tool-call message with its tool results."""
+    turns = []
+    for message in messages:
+        if isinstance(message, ToolMessage) and turns:
+            turns[-1].append(message)
+        else:
+            turns.append([message])
+    return turns
+
+
+def fit_messages(prompt: List[BaseMessage], history: List[BaseMessage], ceiling: Optional[int] = None) -> List[BaseMessage]:
+    """prompt + history, cut towards `ceiling` tokens (MESSAGE_TOKEN_CEILING by default, 0 = no limit).
+
+    Over the ceiling the tool results of earlier turns are digested, then the
+    content of the oldest messages is elided. Messages are never dropped, so
+    tool-call ids still pair up and the model still sees which lookups it made.
+    The prompt and the last turn (e.g. tool results not read yet) are always
+    sent whole, so the ceiling is a best effort.
+    """
+    ceiling = MESSAGE_TOKEN_CEILING if ceiling is None else ceiling
+    prompt_tokens, before = history_tokens(prompt), history_tokens(history)
+    if not ceiling or prompt_tokens + before <= ceiling:
+        return prompt + history
+    turns = _turns(history)
+    earlier = [_digested(m) if isinstance(m, ToolMessage) else m for turn in turns[:-1] for m in turn]
+    last = turns[-1] if turns else []
+    total = prompt_tokens + history_tokens(earlier) + history_tokens(last)
+    for i, message in enumerate(earlier):
+        if total <= ceiling:
+            break
+        if message.content and message.content != ELIDED:
+            elided = message.model_copy(update={'content': ELIDED})
+            total -= message_tokens(message) - message_tokens(elided)
+            earlier[i] = elided
+    fitted = earlier + last
+    record(compacted_tokens=before - history_tokens(fitted))
+    return prompt + fitted
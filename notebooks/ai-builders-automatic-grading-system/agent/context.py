@@ -0,0 +1,108 @@
+#Token-budgeted lesson context with exact, checkable paragraph citations
+import os
+import re
+from typing import List, Optional
+
+from langchain_core.documents import Document
+
+from agent.cache import LRUCache, content_key
+from agent.retrievers import split_paragraphs
+
+CONTEXT_TOKEN_BUDGET = int(os.environ.get('CONTEXT_TOKEN_BUDGET', 600))
+CONTEXT_TOP_K = int(os.environ.get('CONTEXT_TOP_K', 4))
+PARAGRAPH_LABEL = re.compile(r"\bP(\d+)\b")
+
+_lesson_paragraphs = LRUCache(maxsize=16)
+_encoding = []
+
+
+def _get_encoding():
+    #Loaded on first use, the encoding file may have to be downloaded.
+    if not _encoding:
+        try:
+            import tiktoken
+            _encoding.append(tiktoken.get_encoding("o200k_base"))
+        except Exception:
+            #tiktoken is optional (or offline): fall back to ~4 chars per token.
+            _encoding.append(None)
+    return _encoding[0]
+
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _truncate(text: str, budget: int) -> str:
+    """Longest prefix of `text` within `budget` tokens, cut at a sentence end when possible."""
+    encoding = _get_encoding()
+    if encoding is None:
+        prefix = text[:budget * 4]
+    else:
+        prefix = encoding.decode(encoding.encode(text, disallowed_special=())[:budget])
+    #Token boundaries may not decode to an exact prefix; fall back to the character estimate.
+    if not text.startswith(prefix):
+        prefix = text[:budget * 4]
+    end = prefix.rfind('. ')
+    return prefix[:end + 1] if end > 0 else prefix
+
+
+def paragraph_label(doc: Document) -> str:
+    return f"P{doc.metadata['start_index']}"
+
+
+def pack_paragraphs(hits: List[Document], budget: int = CONTEXT_TOKEN_BUDGET) -> List[Document]:
+    """Best-first selection of retrieved paragraphs under a token budget.
+
+    Hits overlapping an already selected span are skipped; paragraphs that do
+    not fit are skipped in favour of smaller, lower ranked ones, except the top
+    hit, which is cut to the budget. The result is in lesson order and every
+    page_content is an exact slice of the lesson starting at start_index.
+    """
+    selected, spans, used = [], [], 0
+    for doc in hits:
+        start = doc.metadata['start_index']
+        end = start + len(doc.page_content)
+        if any(start < other_end and other_start < end for other_start, other_end in spans):
+            continue
+        tokens = count_tokens(doc.page_content)
+        if used + tokens > budget:
+            if selected:
+                continue
+            doc = Document(page_content=_truncate(doc.page_content, budget), metadata=doc.metadata)
+            tokens = count_tokens(doc.page_content)
+        selected.append(doc)
+        spans.append((start, end))
+        used += tokens
+    return sorted(selected, key=lambda d: d.metadata['start_index'])
+
+
+def format_paragraphs(paragraphs: List[Document]) -> str:
+    """Context block with one [P<start_index>] label per paragraph."""
+    return '\n\n'.join(f"[{paragraph_label(doc)}] {doc.page_content}" for doc in paragraphs)
+
+
+def lesson_paragraphs(lesson_doc: str) -> dict:
+    """{start_index: paragraph text} of a lesson, computed once per lesson."""
+    return _lesson_paragraphs.get_or_create(
+        content_key(lesson_doc),
+        lambda: {doc.metadata['start_index']: doc.page_content for doc in split_paragraphs(lesson_doc)},
+    )
+
+
+def cite_exact(knowledge_state: dict, lesson_doc: Optional[str]) -> dict:
+    """Replace paragraph labels (P<start_index>) in cited_paragraph by the exact lesson text.
+
+    Citations without a known label are left as the model wrote them.
+    """
+    if not lesson_doc or not isinstance(knowledge_state, dict):
+        return knowledge_state
+    paragraphs = lesson_paragraphs(lesson_doc)
+    for item in knowledge_state.get('evaluated_questions', []):
+        starts = [int(s) for s in PARAGRAPH_LABEL.findall(item.get('cited_paragraph') or '')]
+        texts = [paragraphs[s] for s in dict.fromkeys(starts) if s in paragraphs]
+        if texts:
+            item['cited_paragraph'] = '\n\n'.join(texts)
+    return knowledge_state
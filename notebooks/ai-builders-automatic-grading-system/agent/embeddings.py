@@ -0,0 +1,216 @@
+#Embedding cache: SQLite index + memory-mapped float32 matrix
+import os
+import sqlite3
+import threading
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from agent.cache import content_key
+from agent.metrics import record
+
+EMBEDDING_CACHE_DIR = os.environ.get('EMBEDDING_CACHE_DIR', os.path.join('.cache', 'embeddings'))
+
+
+class EmbeddingCache:
+    """Vectors keyed by (model, sha256(text)).
+
+    SQLite only stores the row number of each vector; the vectors themselves live
+    in one float32 matrix per model that is memory-mapped, so hits are returned
+    as views into the map without copying.
+    """
+
+    def __init__(self, cache_dir: str = EMBEDDING_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self._conn = None
+        self._matrices = {}
+        self._lock = threading.RLock()
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            conn = sqlite3.connect(os.path.join(self.cache_dir, 'index.sqlite'), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS matrices (model TEXT PRIMARY KEY, dim INTEGER)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS vectors ("
+                "model TEXT, text_hash TEXT, row INTEGER, PRIMARY KEY (model, text_hash))"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _matrix_path(self, model: str) -> str:
+        return os.path.join(self.cache_dir, f"{content_key(model)[:16]}.f32")
+
+    def _dim(self, model: str, dim: int = None):
+        """Vector size of `model`, registered as `dim` on the first put."""
+        row = self._connect().execute("SELECT dim FROM matrices WHERE model = ?", (model,)).fetchone()
+        if row is None and dim is not None:
+            self._connect().execute("INSERT INTO matrices VALUES (?, ?)", (model, dim))
+        return row[0] if row is not None else dim
+
+    def _matrix(self, model: str, dim: int, needed: int = 0, grow: bool = False):
+        """Memory map of `model` vectors, remapped when the file holds more than `needed` rows.
+
+        Only put (holding the write lock) grows the file, with `grow`; readers
+        map what is on disk, which may be fewer rows than `needed`.
+        """
+        matrix = self._matrices.get(model)
+        if matrix is not None and matrix.shape[0] >= needed:
+            return matrix
+        path = self._matrix_path(model)
+        #Another process may have grown the file already.
+        capacity = os.path.getsize(path) // (dim * 4) if os.path.exists(path) else 0
+        if grow and needed > capacity:
+            capacity = max(needed, capacity * 2, 1024)
+            with open(path, 'ab') as f:
+                f.truncate(capacity * dim * 4)
+        if not capacity:
+            return None
+        if matrix is not None:
+            matrix.flush()
+        #Views handed out earlier keep the old map alive, so remapping is safe.
+        matrix = np.memmap(path, dtype=np.float32, mode='r+', shape=(capacity, dim))
+        self._matrices[model] = matrix
+        return matrix
+
+    def get(self, model: str, text_hashes: List[str]) -> dict:
+        """Return {text_hash: vector view} for the hashes already cached."""
+        if not text_hashes:
+            return {}
+        with self._lock:
+            conn = self._connect()
+            rows = {}
+            for start in range(0, len(text_hashes), 500):
+                batch = text_hashes[start:start + 500]
+                placeholders = ','.join('?' * len(batch))
+                rows.update(conn.execute(
+                    f"SELECT text_hash, row FROM vectors WHERE model = ? AND text_hash IN ({placeholders})",
+                    (model, *batch),
+                ).fetchall())
+            dim = self._dim(model)
+            if not rows or dim is None:
+                return {}
+            matrix = self._matrix(model, dim, needed=max(rows.values()) + 1)
+            #Rows past the end of the file (e.g. the file was replaced) are misses, never zeros.
+            capacity = 0 if matrix is None else matrix.shape[0]
+            return {text_hash: matrix[row] for text_hash, row in rows.items() if row < capacity}
+
+    def put(self, model: str, text_hashes: List[str], vectors) -> dict:
+        """Store vectors and return views into the map for them.
+
+        Rows are allocated, written and mapped in one IMMEDIATE transaction, so
+        processes sharing the cache directory never get the same rows and readers
+        only see a mapping once its vector is on disk.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                dim = self._dim(model, dim=vectors.shape[1])
+                start = conn.execute(
+                    "SELECT COALESCE(MAX(row) + 1, 0) FROM vectors WHERE model = ?", (model,)
+                ).fetchone()[0]
+                matrix = self._matrix(model, dim, needed=start + len(vectors), grow=True)
+                matrix[start:start + len(vectors)] = vectors
+                matrix.flush()
+                conn.executemany(
+                    "INSERT OR REPLACE INTO vectors VALUES (?, ?, ?)",
+                    [(model, text_hash, start + i) for i, text_hash in enumerate(text_hashes)],
+                )
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            return {text_hash: matrix[start + i] for i, text_hash in enumerate(text_hashes)}
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that dedupes texts, serves hits from an EmbeddingCache
+    and sends the misses upstream in batches of `batch_size`.
+    `underlying` is an Embeddings or a zero-argument factory of one.
+    """
+
+    def __init__(self, underlying, model: str, cache: EmbeddingCache = None, batch_size: int = 512):
+        self._lock = threading.Lock()
+        self.underlying = underlying
+        self.model = model
+        self.cache = cache or EmbeddingCache()
+        self.batch_size = batch_size
+        self.hits = 0
+        self.misses = 0
+        self.upstream_calls = 0
+
+    @property
+    def underlying(self) -> Embeddings:
+        #May be given as a factory: the API client is then only built on the first cache miss.
+        with self._lock:
+            if not isinstance(self._underlying, Embeddings):
+                self._underlying = self._underlying()
+            return self._underlying
+
+    @underlying.setter
+    def underlying(self, value):
+        self._underlying = value
+
+    def embed_vectors(self, texts: List[str]) -> List[np.ndarray]:
+        """Embed texts, returning float32 views into the cache (no copies for hits)."""
+        hashes = [content_key(text) for text in texts]
+        found = self.cache.get(self.model, list(dict.fromkeys(hashes)))
+
+        missing = {}
+        for text, text_hash in zip(texts, hashes):
+            if text_hash not in found:
+                missing.setdefault(text_hash, text)
+
+        if missing:
+            miss_hashes = list(missing)
+            for start in range(0, len(miss_hashes), self.batch_size):
+                batch = miss_hashes[start:start + self.batch_size]
+                vectors = self.underlying.embed_documents([missing[h] for h in batch])
+                found.update(self.cache.put(self.model, batch, vectors))
+                with self._lock:
+                    self.upstream_calls += 1
+
+        with self._lock:
+            self.misses += len(missing)
+            self.hits += len(texts) - len(missing)
+        record(
+            embedding_calls=-(-len(missing) // self.batch_size),
+            embedding_cache_hits=len(texts) - len(missing),
+            embedding_cache_misses=len(missing),
+        )
+        return [found[text_hash] for text_hash in hashes]
+
+    def embed_array(self, texts: List[str]) -> np.ndarray:
+        """Embed texts into a single (n, dim) float32 matrix."""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack(self.embed_vectors(texts))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [vector.tolist() for vector in self.embed_vectors(texts)]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_vectors([text])[0].tolist()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {
+            'model': self.model,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hit_rate,
+            'upstream_calls': self.upstream_calls,
+        }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = self.upstream_calls = 0
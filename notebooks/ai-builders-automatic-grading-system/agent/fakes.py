@@ -0,0 +1,228 @@
+#Offline stand-ins for the OpenAI models, used by the batch runner and benchmarks.
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+from typing import Any, List, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from agent.prompts import NO_FEEDBACK_REPLY
+
+GRADES = "ABCDF"
+
+
+class FakeTransientError(Exception):
+    """Injected failure that looks like a retryable API error (HTTP 503)."""
+    status_code = 503
+
+
+def _stable_hash(text: str) -> int:
+    return int(hashlib.md5(text.encode('utf-8')).hexdigest()[:8], 16)
+
+
+def fake_grade(question: str, student_answer: str = "") -> str:
+    return GRADES[_stable_hash(question + student_answer) % len(GRADES)]
+
+
+def _text(message: BaseMessage) -> str:
+    return message.content if isinstance(message.content, str) else json.dumps(message.content)
+
+
+def _find_json(text: str, key: str):
+    """Return the first JSON value found after `key` in text, or None."""
+    decoder = json.JSONDecoder()
+    for match in re.finditer(re.escape(key), text):
+        start = text.find('[', match.end())
+        brace = text.find('{', match.end())
+        if brace != -1 and (start == -1 or brace < start):
+            start = brace
+        if start == -1:
+            continue
+        try:
+            return decoder.raw_decode(text[start:])[0]
+        except ValueError:
+            continue
+    return None
+
+
+def _open_questions(messages: List[BaseMessage]) -> list:
+    for message in messages:
+        questions = _find_json(_text(message), 'Open Questions:')
+        if isinstance(questions, list):
+            return questions
+    return []
+
+
+def _evaluation(messages: List[BaseMessage]) -> dict:
+    """Deterministic grades for the open questions found in the conversation."""
+    evaluated = []
+    #Cite the first lesson paragraph label (query_lesson result or excerpt) in the conversation.
+    labels = [
+        m.group(0) for m in (re.search(r"\bP\d+\b", _text(message)) for message in messages if message.type != 'system') if m
+    ]
+    for item in _open_questions(messages):
+        question = item.get('question', '')
+        evaluated.append({
+            'question': question,
+            'score': fake_grade(question, item.get('student_answer', '')),
+            'reason': f"Assessment of {', '.join(item.get('concepts_evaluated', [])) or 'the answer'}.",
+            'cited_paragraph': labels[0] if labels else f"Lesson excerpt about {question[:40]}",
+        })
+    if not evaluated:
+        #Formatter / feedback prompts only carry an earlier evaluation.
+        for message in reversed(messages):
+            previous = _find_json(_text(message), '"evaluated_questions"')
+            if isinstance(previous, list):
+                evaluated = previous
+                break
+    return {'evaluated_questions': evaluated}
+
+
+def _schema_args(tool: dict, messages: List[BaseMessage]) -> dict:
+    """Fill a structured-output schema from the conversation."""
+    params = tool['function']['parameters']
+    properties = params.get('properties', {})
+    if 'evaluated_questions' in properties:
+        return _evaluation(messages)
+    args = {}
+    for name, spec in properties.items():
+        if 'enum' in spec:
+            options = spec['enum']
+            #Routing schemas: go through the options once, then finish on the last one.
+            ai_turns = sum(isinstance(m, AIMessage) for m in messages)
+            args[name] = options[min(ai_turns, len(options)) - 1] if ai_turns else options[0]
+        elif spec.get('type') == 'array':
+            args[name] = []
+        elif spec.get('type') in ('integer', 'number'):
+            args[name] = 0
+        else:
+            args[name] = ""
+    return args
+
+
+class FakeChatModel(BaseChatModel):
+    """Deterministic chat model with configurable latency, jitter and failure injection.
+
+    Each call sleeps `latency` plus up to `jitter` seconds (drawn from `seed`).
+
+    It understands the grading prompts well enough to return a valid evaluation
+    JSON, issue query_lesson tool calls (`tool_rounds` times) when that tool is
+    bound, and fill any structured-output schema.
+    """
+
+    model_name: str = "fake"
+    latency: float = 0.0
+    jitter: float = 0.0
+    failure_rate: float = 0.0
+    tool_calls_per_turn: int = 2
+    tool_rounds: int = 1
+    reply_chars: int = 0
+    seed: int = 0
+    calls: int = 0
+
+    def model_post_init(self, __context: Any) -> None:
+        self._random = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-grading-chat"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {'model_name': self.model_name}
+
+    def bind_tools(self, tools, tool_choice=None, **kwargs):
+        formatted = [convert_to_openai_tool(t) for t in tools]
+        return self.bind(tools=formatted, tool_choice=tool_choice, **kwargs)
+
+    def _respond(self, messages: List[BaseMessage], tools: Optional[list] = None, tool_choice=None) -> AIMessage:
+        self.calls += 1
+        if self.failure_rate and self._random.random() < self.failure_rate:
+            raise FakeTransientError("injected transient failure")
+
+        tools = tools or []
+        if tool_choice and len(tools) == 1:
+            tool = tools[0]
+            message = AIMessage(content="", tool_calls=[{
+                'name': tool['function']['name'],
+                'args': _schema_args(tool, messages),
+                'id': f"call_{self.calls}",
+            }])
+        elif tools and sum(isinstance(m, AIMessage) and bool(m.tool_calls) for m in messages) < self.tool_rounds:
+            questions = _open_questions(messages)[:self.tool_calls_per_turn]
+            message = AIMessage(content="", tool_calls=[{
+                'name': tools[0]['function']['name'],
+                'args': {'question': f"What does the lesson say about {q.get('question', '')}"},
+                'id': f"call_{self.calls}_{i}",
+            } for i, q in enumerate(questions)])
+            if not message.tool_calls:
+                message = AIMessage(content=json.dumps(_evaluation(messages)))
+        elif messages and 'evaluated_questions' in _text(messages[0]):
+            #Evaluator prompts describe the output JSON in the system message.
+            message = AIMessage(content=json.dumps(_evaluation(messages)))
+        elif not self.reply_chars and messages and NO_FEEDBACK_REPLY in _text(messages[0]):
+            #The reflection prompt asks for this exact reply when there is nothing to add.
+            message = AIMessage(content=NO_FEEDBACK_REPLY)
+        else:
+            message = AIMessage(content="The lesson covers this point; no further feedback." + self._quote(messages))
+
+        prompt_tokens = sum(len(_text(m)) for m in messages) // 4
+        completion_tokens = (len(_text(message)) + len(json.dumps(message.tool_calls))) // 4
+        message.usage_metadata = {
+            'input_tokens': prompt_tokens,
+            'output_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+        }
+        return message
+
+    def _quote(self, messages: List[BaseMessage]) -> str:
+        #Free-text replies restate up to `reply_chars` of the prompt, like a real answer quoting the lesson.
+        if not self.reply_chars or not messages:
+            return ""
+        return " " + _text(messages[-1])[-self.reply_chars:]
+
+    def _delay(self) -> float:
+        return self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+
+    def _generate(self, messages, stop=None, run_manager=None, tools=None, tool_choice=None, **kwargs) -> ChatResult:
+        delay = self._delay()
+        if delay:
+            time.sleep(delay)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages, tools, tool_choice))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, tools=None, tool_choice=None, **kwargs) -> ChatResult:
+        delay = self._delay()
+        if delay:
+            await asyncio.sleep(delay)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages, tools, tool_choice))])
+
+
+class FakeEmbeddings(Embeddings):
+    """Deterministic hash-based embeddings (no network), `size` dimensions.
+    `latency` seconds are slept per request to stand in for the API round trip.
+    """
+
+    def __init__(self, size: int = 64, latency: float = 0.0):
+        self.size = size
+        self.latency = latency
+
+    def _embed(self, text: str) -> List[float]:
+        digest = hashlib.sha256(text.encode('utf-8')).digest()
+        return [(digest[i % len(digest)] - 128) / 128.0 for i in range(self.size)]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._embed(text)
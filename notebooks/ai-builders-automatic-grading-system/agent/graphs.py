@@ -1,7 +1,13 @@
+import json
+import logging
+import threading
+import time
 import uuid
+from contextlib import nullcontext
+from langchain_core.messages import AIMessageChunk
 from langgraph.graph import StateGraph
-from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import END, START, StateGraph
+from langgraph.types import Send
 
 from .nodes import (
     basic_rag_call_evaluator,
@@ -12,18 +18,40 @@ from .nodes import (
     format_cks,
     tool_node_eval,
     supervisor,
+    local_supervisor,
     evaluator_with_feedback,
-    format_cks_reflection
+    format_cks_reflection,
+    parse_cks,
+    parse_cks_reflection,
+    shard_questions,
+    grade_shard,
+    merge_shards,
+    precomputed_call_evaluator
     )
 
 from .state import OverallState
+from .checkpoint import make_checkpointer, release_thread
+from .parsing import GradeStreamParser
+from .metrics import collecting, with_metrics
+from .compaction import compacting
+
+logger = logging.getLogger(__name__)
+
+def basic_rag_graph(checkpointer="memory", single_pass=False, retriever=None, compaction=True):
+    """`retriever` picks the query_lesson index ("dense", "bm25" or "hybrid"),
+    a run can override it with configurable={"retriever": ...}.
+    With `compaction` the tool results of earlier rounds are replaced by digests
+    before each evaluator call (see agent.compaction).
+    """
+    memory = make_checkpointer(checkpointer)
+
+    def eval_tools(state, config):
+        return tool_node_eval(state, config, retriever=retriever)
 
-def basic_rag_graph():
-    memory = MemorySaver()
     workflow = StateGraph(OverallState)
-    workflow.add_node("call_evaluator", basic_rag_call_evaluator)
-    workflow.add_node("eval_tools", tool_node_eval)
-    workflow.add_node("format_cks", format_cks)
+    workflow.add_node("call_evaluator", compacting(basic_rag_call_evaluator) if compaction else basic_rag_call_evaluator)
+    workflow.add_node("eval_tools", eval_tools)
+    workflow.add_node("format_cks", parse_cks if single_pass else format_cks)
 
     workflow.add_edge(START, "call_evaluator")
     workflow.add_conditional_edges("call_evaluator", should_continue_eval, ["eval_tools", "format_cks"])
@@ -31,11 +59,11 @@ def basic_rag_graph():
     workflow.add_edge("format_cks", END)
     return workflow.compile(checkpointer=memory)
 
-def one_shot_graph():
-    memory = MemorySaver()
+def one_shot_graph(checkpointer="memory", single_pass=False):
+    memory = make_checkpointer(checkpointer)
     workflow = StateGraph(OverallState)
     workflow.add_node("call_evaluator", one_shot_call_evaluator)
-    workflow.add_node("format_cks", format_cks)
+    workflow.add_node("format_cks", parse_cks if single_pass else format_cks)
 
     workflow.add_edge(START, "call_evaluator")
     workflow.add_edge("call_evaluator", "format_cks")
@@ -43,13 +71,23 @@ def one_shot_graph():
 
     return workflow.compile(checkpointer=memory)
 
-def one_shot_with_reflection_graph():
-    memory = MemorySaver()
+ROUTING_MODES = ("llm", "local")
+
+def one_shot_with_reflection_graph(checkpointer="memory", single_pass=False, routing="llm", compaction=True):
+    """routing="local" lets deterministic rules pick the supervisor's next worker
+    and only calls the LLM supervisor when they cannot decide (see route_reflection).
+    With `compaction` superseded evaluation drafts are stubbed before each
+    supervisor step (see agent.compaction).
+    """
+    if routing not in ROUTING_MODES:
+        raise ValueError(f"Unknown routing mode {routing!r}, expected one of {ROUTING_MODES}")
+    memory = make_checkpointer(checkpointer)
     workflow = StateGraph(OverallState)
     workflow.add_node("call_evaluator", one_shot_call_evaluator)
-    workflow.add_node("format_cks", format_cks_reflection)
+    workflow.add_node("format_cks", parse_cks_reflection if single_pass else format_cks_reflection)
     workflow.add_node("call_reflection", call_reflection)
-    workflow.add_node("supervisor", supervisor)
+    route = local_supervisor if routing == "local" else supervisor
+    workflow.add_node("supervisor", compacting(route) if compaction else route)
     workflow.add_node("evaluator_with_feedback", evaluator_with_feedback)
 
     workflow.add_edge(START, "call_evaluator")
@@ -60,10 +98,86 @@ def one_shot_with_reflection_graph():
     workflow.add_edge("format_cks", END)
     return workflow.compile(checkpointer=memory)
 
+def precomputed_rag_graph(checkpointer="memory", single_pass=False):
+    """RAG grading without retrieval at grading time.
+
+    Expects state['question_context'] from agent.precompute (see
+    attach_question_context); the evaluator reads the lesson excerpts and
+    reference answers from it instead of calling query_lesson.
+    """
+    memory = make_checkpointer(checkpointer)
+    workflow = StateGraph(OverallState)
+    workflow.add_node("call_evaluator", precomputed_call_evaluator)
+    workflow.add_node("format_cks", parse_cks if single_pass else format_cks)
+
+    workflow.add_edge(START, "call_evaluator")
+    workflow.add_edge("call_evaluator", "format_cks")
+    workflow.add_edge("format_cks", END)
+    return workflow.compile(checkpointer=memory)
+
+def sharded_one_shot_graph(shard_size=3, checkpointer="memory"):
+    """One-shot grading fanned out over shards of at most `shard_size` questions.
+
+    Questions sharing a concept are kept in the same shard; shards are graded in
+    parallel (LangGraph Send) and merged back in submission order, so prompt
+    size and latency no longer grow with the length of the submission.
+    """
+    if not isinstance(shard_size, int) or shard_size < 1:
+        raise ValueError(f"Invalid shard_size {shard_size!r}, expected a positive integer")
+    memory = make_checkpointer(checkpointer)
+
+    def fan_out_shards(state):
+        questions = state['user_input']['open_questions']
+        sends = []
+        for shard_index, indices in enumerate(shard_questions(questions, shard_size)):
+            shard = [questions[i] for i in indices]
+            sends.append(Send("grade_shard", {
+                'shard_index': shard_index,
+                'user_input': {'open_questions': shard},
+                'concepts_to_evaluate': sorted({c for q in shard for c in q.get('concepts_evaluated', [])}),
+                'blooms_state': state['blooms_state'],
+                'messages': [],
+            }))
+        return sends or ["merge_shards"]
+
+    workflow = StateGraph(OverallState)
+    workflow.add_node("grade_shard", grade_shard)
+    workflow.add_node("merge_shards", merge_shards)
+
+    workflow.add_conditional_edges(START, fan_out_shards, ["grade_shard", "merge_shards"])
+    workflow.add_edge("grade_shard", "merge_shards")
+    workflow.add_edge("merge_shards", END)
+    return workflow.compile(checkpointer=memory)
+
 def basic_rag_with_reflection_graph():
     return NotImplementedError
 
-def execute_graph(exec_state, graph):
+GRAPHS = {
+    "one_shot": one_shot_graph,
+    "basic_rag": basic_rag_graph,
+    "one_shot_with_reflection": one_shot_with_reflection_graph,
+    "precomputed_rag": precomputed_rag_graph,
+    "sharded_one_shot": sharded_one_shot_graph,
+}
+_compiled = {}
+_compiled_lock = threading.Lock()
+
+def compiled_graph(name, **options):
+    """Graph `name` (a GRAPHS key) compiled once per process for each set of factory options.
+
+    Compiled graphs are safe to share between concurrent runs as long as each
+    run uses its own thread_id.
+    """
+    if name not in GRAPHS:
+        raise ValueError(f"Unknown graph {name!r}, expected one of {tuple(GRAPHS)}")
+    key = (name, tuple(sorted(options.items())))
+    with _compiled_lock:
+        if key not in _compiled:
+            _compiled[key] = GRAPHS[name](**options)
+        return _compiled[key]
+
+def execute_graph(exec_state, graph, metrics=None):
+    """Grade one submission; pass a RunMetrics (agent.metrics) to collect timings and counts."""
     i = 0
     unique_id = uuid.uuid4()
 
@@ -71,17 +185,105 @@ def execute_graph(exec_state, graph):
             "configurable": { "thread_id": unique_id, "run_name": "AIBuildersDemo"}, 
             "recursion_limit": 10
             }
+    if metrics is not None:
+        config = with_metrics(config, metrics)
 
-    for chunk in graph.stream(exec_state , config, stream_mode="values"):
-        try:
-            chunk["messages"][-1].pretty_print()
-        except:
-            pass
-        i += 1
-        if i == 10:
-            break
+    #The last "values" chunk is the final state, so this also works without a checkpointer.
+    final_state = {}
+    with collecting(metrics) if metrics is not None else nullcontext():
+        for chunk in graph.stream(exec_state , config, stream_mode="values"):
+            final_state = chunk
+            if logger.isEnabledFor(logging.DEBUG) and chunk.get("messages"):
+                logger.debug("graph step %d\n%s", i, chunk["messages"][-1].pretty_repr(), extra={'step': i})
+            i += 1
+            if i == 10:
+                break
 
-    final_state = graph.get_state(config).values
+    release_thread(graph, config)
     knowledge_state = final_state['current_knowledge_state']
     
-    return knowledge_state
\ No newline at end of file
+    return knowledge_state
+
+#Nodes whose model output carries grades: free-text JSON or structured-output tool call args.
+GRADE_NODES = ("call_evaluator", "evaluator_with_feedback", "format_cks")
+
+class _GradeEvents:
+    """Turns (stream_mode, payload) pairs from graph.stream into grade/progress events."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.parsers = {}
+        self.seen = {}
+        self.knowledge_state = None
+
+    def _event(self, kind, **data):
+        return {'event': kind, 'elapsed': time.perf_counter() - self.start, **data}
+
+    def _texts(self, message):
+        if isinstance(message.content, str) and message.content:
+            yield message.content
+        for chunk in getattr(message, 'tool_call_chunks', None) or []:
+            if chunk.get('args'):
+                yield chunk['args']
+        if not isinstance(message, AIMessageChunk):
+            for call in getattr(message, 'tool_calls', None) or []:
+                yield json.dumps(call['args'])
+
+    def handle(self, mode, payload):
+        if mode == "updates":
+            for node, update in (payload or {}).items():
+                if isinstance(update, dict) and update.get('current_knowledge_state'):
+                    self.knowledge_state = update['current_knowledge_state']
+                yield self._event('progress', node=node)
+            return
+
+        message, metadata = payload
+        node = metadata.get('langgraph_node')
+        if node not in GRADE_NODES:
+            return
+        #A new model run in the same node (e.g. another evaluator turn) gets a fresh parser.
+        run_key = (node, metadata.get('langgraph_step'), getattr(message, 'id', None))
+        parser = self.parsers.setdefault(run_key, GradeStreamParser())
+        for text in self._texts(message):
+            for grade in parser.feed(text):
+                if self.seen.get(grade.question) != grade:
+                    self.seen[grade.question] = grade
+                    yield self._event('grade', node=node, grade=grade)
+
+    def done(self):
+        return self._event('done', current_knowledge_state=self.knowledge_state)
+
+def _stream_config(recursion_limit):
+    return {
+        "configurable": {"thread_id": uuid.uuid4(), "run_name": "AIBuildersDemo"},
+        "recursion_limit": recursion_limit,
+    }
+
+def stream_grades(exec_state, graph, recursion_limit=10):
+    """Run the graph and yield events as soon as they are available:
+
+    {'event': 'grade', 'node', 'grade': SingleQuestionFormat, 'elapsed'} for
+    each question once its JSON object has been streamed (again if a later node
+    changes it), {'event': 'progress', 'node', 'elapsed'} after every node, and
+    a final {'event': 'done', 'current_knowledge_state', 'elapsed'}.
+    """
+    config = _stream_config(recursion_limit)
+    events = _GradeEvents()
+    try:
+        for mode, payload in graph.stream(exec_state, config, stream_mode=["messages", "updates"]):
+            yield from events.handle(mode, payload)
+    finally:
+        release_thread(graph, config)
+    yield events.done()
+
+async def astream_grades(exec_state, graph, recursion_limit=10):
+    """Async iterator version of stream_grades."""
+    config = _stream_config(recursion_limit)
+    events = _GradeEvents()
+    try:
+        async for mode, payload in graph.astream(exec_state, config, stream_mode=["messages", "updates"]):
+            for event in events.handle(mode, payload):
+                yield event
+    finally:
+        release_thread(graph, config)
+    yield events.done()
@@ -0,0 +1,270 @@
+#Grading metrics: node timings, tokens, call counts and cache hits per student and cohort
+import contextvars
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+COUNTERS = {
+    'llm_calls': "Chat model calls (cache hits included).",
+    'prompt_tokens': "Prompt tokens reported by the chat models.",
+    'completion_tokens': "Completion tokens reported by the chat models.",
+    'llm_cache_hits': "Chat model calls answered by the LLM cache.",
+    'embedding_calls': "Embedding requests sent upstream.",
+    'embedding_cache_hits': "Texts served by the embedding cache.",
+    'embedding_cache_misses': "Texts embedded upstream.",
+    'tool_calls': "Tool calls.",
+    'reflection_steps': "Reflection steps taken.",
+    'supervisor_calls_skipped': "Reflection supervisor decisions made by local rules.",
+    'compacted_tokens': "Message-history tokens removed by compaction and the per-call ceiling.",
+    'errors': "Failed nodes, tools and model calls.",
+}
+
+_current = contextvars.ContextVar('grading_metrics', default=None)
+
+
+class RunMetrics:
+    """Metrics of one graph run (one student).
+
+    `nodes`, `tools` and `llm` hold {name: {'calls', 'seconds'}}; wall_time is
+    the time spent inside the graph and queue_time the time the student waited
+    for a worker slot or the rate limiter before that.
+    """
+
+    def __init__(self):
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.nodes = {}
+        self.tools = {}
+        self.llm = {}
+        self.wall_time = 0.0
+        self.queue_time = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                self.counters[name] += value
+
+    def add_timing(self, group: str, name: str, seconds: float, calls: int = 1):
+        with self._lock:
+            entry = getattr(self, group).setdefault(name, {'calls': 0, 'seconds': 0.0})
+            entry['calls'] += calls
+            entry['seconds'] += seconds
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                'wall_time': self.wall_time,
+                'queue_time': self.queue_time,
+                **self.counters,
+                'nodes': {name: dict(entry) for name, entry in self.nodes.items()},
+                'tools': {name: dict(entry) for name, entry in self.tools.items()},
+                'llm': {name: dict(entry) for name, entry in self.llm.items()},
+            }
+
+
+def record(**counts):
+    """Add to the counters of the run being collected in this context, if any."""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.add(**counts)
+
+
+def record_timing(group: str, name: str, seconds: float, calls: int = 1):
+    """Add a timing ('nodes', 'tools' or 'llm') to the run being collected in this context."""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.add_timing(group, name, seconds, calls)
+
+
+@contextmanager
+def collecting(metrics: RunMetrics):
+    """Attribute record() calls made in this context (and the graph's node threads) to `metrics`."""
+    token = _current.set(metrics)
+    start = time.perf_counter()
+    try:
+        yield metrics
+    finally:
+        metrics.wall_time += time.perf_counter() - start
+        _current.reset(token)
+
+
+class MetricsCallback(BaseCallbackHandler):
+    """Times graph nodes, tools and model calls and counts tokens into a RunMetrics."""
+
+    def __init__(self, metrics: RunMetrics):
+        self.metrics = metrics
+        self._started = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id, group, name):
+        with self._lock:
+            self._started[run_id] = (group, name, time.perf_counter())
+
+    def _end(self, run_id, error=False):
+        with self._lock:
+            started = self._started.pop(run_id, None)
+        if started is None:
+            return None
+        group, name, start = started
+        self.metrics.add_timing(group, name, time.perf_counter() - start)
+        if error:
+            self.metrics.add(errors=1)
+        return group, name
+
+    def on_chain_start(self, serialized, inputs, *, run_id, metadata=None, **kwargs):
+        node = (metadata or {}).get('langgraph_node')
+        #Only the node's own run, not the runnables it calls or the routing functions.
+        if node is not None and node != '__start__' and kwargs.get('name') == node:
+            self._start(run_id, 'nodes', node)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        ended = self._end(run_id)
+        if ended == ('nodes', 'call_reflection'):
+            self.metrics.add(reflection_steps=1)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=True)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        name = (metadata or {}).get('ls_model_name') or kwargs.get('name') or 'chat_model'
+        self._start(run_id, 'llm', name)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+        name = (metadata or {}).get('ls_model_name') or kwargs.get('name') or 'llm'
+        self._start(run_id, 'llm', name)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._end(run_id)
+        prompt_tokens = completion_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, 'message', None), 'usage_metadata', None) or {}
+                prompt_tokens += usage.get('input_tokens', 0)
+                completion_tokens += usage.get('output_tokens', 0)
+        self.metrics.add(llm_calls=1, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=True)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._start(run_id, 'tools', (serialized or {}).get('name') or kwargs.get('name') or 'tool')
+        self.metrics.add(tool_calls=1)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=True)
+
+
+def with_metrics(config: dict, metrics: RunMetrics) -> dict:
+    """Copy of a run config that also reports into `metrics`."""
+    return {**config, 'callbacks': [*(config.get('callbacks') or []), MetricsCallback(metrics)]}
+
+
+def invoke_with_metrics(graph, exec_state: dict, config: dict, metrics: Optional[RunMetrics] = None):
+    """graph.invoke that returns (final_state, RunMetrics)."""
+    metrics = metrics if metrics is not None else RunMetrics()
+    with collecting(metrics):
+        final_state = graph.invoke(exec_state, with_metrics(config, metrics))
+    return final_state, metrics
+
+
+def _quantile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class CohortMetrics:
+    """RunMetrics of every student, with cohort totals and latency quantiles."""
+
+    QUANTILES = (0.5, 0.95, 0.99)
+
+    def __init__(self):
+        self.students = {}
+        self.started = time.perf_counter()
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def student(self, student_id) -> RunMetrics:
+        with self._lock:
+            return self.students.setdefault(student_id, RunMetrics())
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    def summary(self) -> dict:
+        runs = [m.to_dict() for m in self.students.values()]
+        totals = {name: sum(run[name] for run in runs) for name in COUNTERS}
+        groups = {}
+        for group in ('nodes', 'tools', 'llm'):
+            merged = {}
+            for run in runs:
+                for name, entry in run[group].items():
+                    target = merged.setdefault(name, {'calls': 0, 'seconds': 0.0})
+                    target['calls'] += entry['calls']
+                    target['seconds'] += entry['seconds']
+            groups[group] = merged
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        walls = [run['wall_time'] for run in runs]
+        queues = [run['queue_time'] for run in runs]
+        count = len(runs)
+        return {
+            'students': count,
+            'elapsed': elapsed,
+            'students_per_second': count / elapsed if elapsed else 0.0,
+            **totals,
+            'per_student': {name: totals[name] / count if count else 0.0 for name in COUNTERS},
+            'wall_time': {f"p{int(q * 100)}": _quantile(walls, q) for q in self.QUANTILES},
+            'queue_time': {f"p{int(q * 100)}": _quantile(queues, q) for q in self.QUANTILES},
+            **groups,
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            'cohort': self.summary(),
+            'students': {str(student_id): m.to_dict() for student_id, m in self.students.items()},
+        }
+
+    def to_json(self, path: Optional[str] = None, indent: int = 2) -> str:
+        text = json.dumps(self.to_dict(), indent=indent)
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
+
+    def to_prometheus(self, prefix: str = 'grading') -> str:
+        """Cohort totals in the Prometheus text exposition format."""
+        summary = self.summary()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for labels, value in samples:
+                label_text = ','.join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"{prefix}_{name}{{{label_text}}} {value}" if label_text else f"{prefix}_{name} {value}")
+
+        metric('students_total', 'counter', "Students graded.", [({}, summary['students'])])
+        for name, help_text in COUNTERS.items():
+            metric(f"{name}_total", 'counter', help_text, [({}, summary[name])])
+        for group, label in (('nodes', 'node'), ('tools', 'tool'), ('llm', 'model')):
+            entries = summary[group]
+            metric(f"{label}_calls_total", 'counter', f"Calls per {label}.",
+                   [({label: name}, entry['calls']) for name, entry in sorted(entries.items())])
+            metric(f"{label}_seconds_total", 'counter', f"Seconds spent per {label}.",
+                   [({label: name}, round(entry['seconds'], 6)) for name, entry in sorted(entries.items())])
+        for field in ('wall_time', 'queue_time'):
+            values = [m.wall_time if field == 'wall_time' else m.queue_time for m in self.students.values()]
+            name = f"student_{field.replace('_time', '')}_seconds"
+            samples = [({'quantile': q}, round(_quantile(values, q), 6)) for q in self.QUANTILES]
+            metric(name, 'summary', f"Per-student {field.replace('_', ' ')}.", samples)
+            lines.append(f"{prefix}_{name}_sum {round(sum(values), 6)}")
+            lines.append(f"{prefix}_{name}_count {len(values)}")
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,124 @@
+import os
+import threading
+
+import httpx
+
+POOL_MAX_CONNECTIONS = int(os.environ.get('OPENAI_POOL_MAX_CONNECTIONS', 100))
+POOL_MAX_KEEPALIVE = int(os.environ.get('OPENAI_POOL_MAX_KEEPALIVE', 20))
+POOL_KEEPALIVE_EXPIRY = float(os.environ.get('OPENAI_POOL_KEEPALIVE_EXPIRY', 30))
+REQUEST_TIMEOUT = float(os.environ.get('OPENAI_REQUEST_TIMEOUT', 120))
+
+_env_loaded = []
+
+
+def load_env():
+    """Read .env into os.environ once; done when the first API client is built, not at import."""
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded.append(True)
+
+
+class ModelRegistry:
+    """Creates every chat model variant once per process.
+
+    A variant is a model name plus optional bound tools or a structured-output
+    schema; variants share one pooled keep-alive HTTP client (sync and async),
+    so concurrent grading reuses sockets instead of opening new ones per node
+    call. Lookups are guarded by a lock and the resulting runnables are safe to
+    invoke from threads and asyncio.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = POOL_MAX_CONNECTIONS,
+        max_keepalive_connections: int = POOL_MAX_KEEPALIVE,
+        keepalive_expiry: float = POOL_KEEPALIVE_EXPIRY,
+        timeout: float = REQUEST_TIMEOUT,
+        **model_kwargs,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = timeout
+        self.model_kwargs = model_kwargs
+        #Optional override, e.g. a FakeChatModel for offline runs.
+        self.factory = None
+        self._variants = {}
+        self._http_client = None
+        self._http_async_client = None
+        self._lock = threading.RLock()
+
+    @property
+    def http_client(self) -> httpx.Client:
+        with self._lock:
+            if self._http_client is None:
+                self._http_client = httpx.Client(limits=self.limits, timeout=self.timeout)
+            return self._http_client
+
+    @property
+    def http_async_client(self) -> httpx.AsyncClient:
+        with self._lock:
+            if self._http_async_client is None:
+                self._http_async_client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout)
+            return self._http_async_client
+
+    def _base(self, model: str):
+        if self.factory is not None:
+            return self.factory(model)
+        from langchain_openai import ChatOpenAI
+        load_env()
+        return ChatOpenAI(
+            model=model,
+            api_key=os.environ.get('OPENAI_API_KEY'),
+            http_client=self.http_client,
+            http_async_client=self.http_async_client,
+            **self.model_kwargs,
+        )
+
+    def get(self, model: str, tools=None, schema=None):
+        tool_names = tuple(getattr(t, 'name', t) for t in tools or ())
+        key = (model, tool_names, schema)
+        with self._lock:
+            variant = self._variants.get(key)
+            if variant is None:
+                base = self._variants.get((model, (), None))
+                if base is None:
+                    base = self._variants[(model, (), None)] = self._base(model)
+                if schema is not None:
+                    variant = base.with_structured_output(schema)
+                elif tools:
+                    variant = base.bind_tools(tools)
+                else:
+                    variant = base
+                self._variants[key] = variant
+            return variant
+
+    def set_factory(self, factory=None):
+        with self._lock:
+            self.factory = factory
+            self._variants.clear()
+
+    def close(self):
+        with self._lock:
+            self._variants.clear()
+            if self._http_client is not None:
+                self._http_client.close()
+                self._http_client = None
+            #The async client is left to the garbage collector; closing it needs a running loop.
+            self._http_async_client = None
+
+
+registry = ModelRegistry()
+
+def set_chat_model_factory(factory=None):
+    """Route every chat model used by the nodes/tools through `factory(model_name)`.
+    Pass None to go back to ChatOpenAI.
+    """
+    registry.set_factory(factory)
+
+def chat_model(model: str, tools=None, schema=None):
+    """Shared model variant: plain, bound to `tools`, or with structured output `schema`."""
+    return registry.get(model, tools=tools, schema=schema)
@@ -1,11 +1,15 @@
-import os
 import json
+import logging
+import threading
+import time
 from pydantic import BaseModel
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import SystemMessage, HumanMessage
-from typing import List, Literal
+from agent.models import chat_model
+from langchain_core.messages import SystemMessage, HumanMessage, ToolMessage, AIMessage
+from typing import Literal
 from langgraph.prebuilt import ToolNode
-from agent.tools import query_lesson
+from langchain_core.runnables.config import patch_config
+from agent.state import SingleQuestionDeck
+from agent.parsing import parse_deck
 from agent.prompts import (
     EVALUATOR_SYSTEM_PROMPT_BASIC_RAG,
     EVALUATOR_SYSTEM_PROMPT_ONE_SHOT,
@@ -13,17 +17,64 @@ from agent.prompts import (
     SINGLE_QUESTIONS_FORMATTER_SYSTEM_PROMPT,
     EVALUATOR_REFLECTION_PROMPT,
     SUPERVISOR_PROMPT,
-    EVALUATOR_SYSTEM_PROMPT_ONE_SHOT_FEEDBACK
+    EVALUATOR_SYSTEM_PROMPT_ONE_SHOT_FEEDBACK,
+    EVALUATOR_SYSTEM_PROMPT_PRECOMPUTED,
+    EVALUATOR_USER_PROMPT_PRECOMPUTED,
+    NO_FEEDBACK_REPLY,
 )
-from agent.tools import query_lesson
+from agent.tools import query_lesson, batch_query_lesson, retriever_kind
+from agent.context import cite_exact
+from agent.compaction import fit_messages
+from agent.precompute import format_excerpts
+from agent.metrics import record, record_timing
 
-tool_node_eval = ToolNode([query_lesson])
+logger = logging.getLogger(__name__)
+
+tool_node_single = ToolNode([query_lesson])
+
+def tool_node_eval(state, config, retriever=None):
+    """Run the evaluator's tool calls, batching every query_lesson call of the turn.
+
+    The N questions share one index search (one embedding request for the dense
+    retrievers) and concurrent generation (see batch_query_lesson); each answer
+    goes back in the ToolMessage of its own tool call. Other tools fall back to
+    the ToolNode. `retriever` is the graph's default index, a run can override
+    it with configurable={"retriever": ...}.
+    """
+    kind = retriever_kind(config, retriever)
+    last_message = state['messages'][-1]
+    rag_calls = [call for call in last_message.tool_calls if call['name'] == query_lesson.name]
+    if len(rag_calls) != len(last_message.tool_calls):
+        return tool_node_single.invoke(state, patch_config(config, configurable={**config.get('configurable', {}), 'retriever': kind}))
+
+    start = time.perf_counter()
+    try:
+        results = batch_query_lesson(
+            [call['args']['question'] for call in rag_calls], state['lesson_doc'], retriever=kind
+        )
+        contents = [json.dumps(result) for result in results]
+        status = 'success'
+    except Exception as e:
+        #Same behaviour as ToolNode(handle_tool_errors=True): report back to the model.
+        contents = [f"Error: {repr(e)}\n Please fix your mistakes."] * len(rag_calls)
+        status = 'error'
+        record(errors=1)
+    #The batched calls bypass the tool's callbacks, so they are counted here.
+    record(tool_calls=len(rag_calls))
+    record_timing('tools', query_lesson.name, time.perf_counter() - start, calls=len(rag_calls))
+
+    return {'messages': [
+        ToolMessage(content=content, name=call['name'], tool_call_id=call['id'], status=status)
+        for call, content in zip(rag_calls, contents)
+    ]}
+
+class RouteResponse(BaseModel):
+    next: Literal["evaluator_with_feedback","call_reflection", "format_cks"]
 
 def basic_rag_call_evaluator(state):
     """Use RAG to review if the content is correct
     """
-    model = ChatOpenAI(model="gpt-4o-mini", api_key=os.environ.get('OPENAI_API_KEY'))
-    evaluator_tools = [query_lesson]
+    model = chat_model("gpt-4o-mini", tools=[query_lesson])
     messages = [
         SystemMessage(content=EVALUATOR_SYSTEM_PROMPT_BASIC_RAG.format(
             blooms_state=state['blooms_state'],
@@ -33,12 +84,11 @@ def basic_rag_call_evaluator(state):
             open_questions=json.dumps(state['user_input']['open_questions'])
             ))
     ]
-    model = model.bind_tools(evaluator_tools)
-    llm_response = model.invoke(messages + state['messages'])
+    llm_response = model.invoke(fit_messages(messages, state['messages']))
     return {'messages': llm_response, 'first_submission': llm_response.content}
 
 def one_shot_call_evaluator(state):
-    model = ChatOpenAI(model="gpt-4o", api_key=os.environ.get('OPENAI_API_KEY'))
+    model = chat_model("gpt-4o")
 
     messages = [
         SystemMessage(content=EVALUATOR_SYSTEM_PROMPT_ONE_SHOT.format(
@@ -50,7 +100,34 @@ def one_shot_call_evaluator(state):
             ))
     ]
 
-    llm_response = model.invoke(messages + state['messages'])
+    llm_response = model.invoke(fit_messages(messages, state['messages']))
+    return {'messages': llm_response, 'first_submission': llm_response.content}
+
+def precomputed_call_evaluator(state):
+    """Grade with lesson context looked up from state['question_context'] (no retrieval calls)."""
+    model = chat_model("gpt-4o-mini")
+    question_context = state.get('question_context') or {}
+
+    #Paragraphs shared by several questions are sent once, in lesson order.
+    excerpts, questions = {}, []
+    for question in state['user_input']['open_questions']:
+        entry = question_context.get(str(question.get('id')), {})
+        for chunk in entry.get('chunks', []):
+            excerpts.setdefault(chunk['start_index'], chunk)
+        refs = [f"P{chunk['start_index']}" for chunk in entry.get('chunks', [])]
+        questions.append({**question, 'reference_answer': entry.get('reference_answer'), 'excerpts': refs})
+
+    messages = [
+        SystemMessage(content=EVALUATOR_SYSTEM_PROMPT_PRECOMPUTED.format(
+            blooms_state=state['blooms_state'],
+            concepts_to_evaluate=', '.join(state['concepts_to_evaluate'])
+            )),
+        HumanMessage(content=EVALUATOR_USER_PROMPT_PRECOMPUTED.format(
+            open_questions=json.dumps(questions),
+            excerpts=format_excerpts([excerpts[start] for start in sorted(excerpts)])
+            ))
+    ]
+    llm_response = model.invoke(fit_messages(messages, state['messages']))
     return {'messages': llm_response, 'first_submission': llm_response.content}
 
 def should_continue_eval(state):
@@ -63,90 +140,203 @@ def should_continue_eval(state):
 
 def format_cks(state):
     #Based on the last messages let's give a format to the output.
-    class SingleQuestionFormat(BaseModel):
-        question: str
-        score: str
-        reason: str
-        cited_paragraph: str
-    class SingleQuestionDeck(BaseModel):
-        evaluated_questions: List[SingleQuestionFormat]
-
-    last_message = state['messages'][-1]
+    #Only the content: the message repr carries a per-run id, which would defeat the LLM cache.
+    last_message = state['messages'][-1].content
     messages = [SystemMessage(content=SINGLE_QUESTIONS_FORMATTER_SYSTEM_PROMPT),
                 HumanMessage(content=f"""Message to format: {last_message}""")]
 
-    gpt_mini_model = ChatOpenAI(model="gpt-4o-mini", api_key=os.environ.get('OPENAI_API_KEY'))
-    structured_model = gpt_mini_model.with_structured_output(SingleQuestionDeck)
+    structured_model = chat_model("gpt-4o-mini", schema=SingleQuestionDeck)
     response = structured_model.invoke(messages)
 
-    return {'current_knowledge_state': response.dict()}
+    return {'current_knowledge_state': cite_exact(response.dict(), state.get('lesson_doc'))}
 
 def format_cks_reflection(state):
-    class SingleQuestionFormat(BaseModel):
-        question: str
-        score: str
-        reason: str
-        cited_paragraph: str
-    class SingleQuestionDeck(BaseModel):
-        evaluated_questions: List[SingleQuestionFormat]
-
     last_message = state['messages'][-1].content
     
     to_format = last_message + state['first_submission']
     messages = [SystemMessage(content=SINGLE_QUESTIONS_FORMATTER_SYSTEM_PROMPT),
                 HumanMessage(content=f"""Message to format: {to_format}""")]
 
-    gpt_mini_model = ChatOpenAI(model="gpt-4o-mini", api_key=os.environ.get('OPENAI_API_KEY'))
-    structured_model = gpt_mini_model.with_structured_output(SingleQuestionDeck)
+    structured_model = chat_model("gpt-4o-mini", schema=SingleQuestionDeck)
     response = structured_model.invoke(messages)
 
-    return {'current_knowledge_state': response.dict()}
+    return {'current_knowledge_state': cite_exact(response.dict(), state.get('lesson_doc'))}
+
+#Single-pass mode: parse the evaluator's JSON locally, the formatter LLM is only a fallback.
+single_pass_stats = {'parsed': 0, 'fallback': 0}
+_single_pass_lock = threading.Lock()
+
+def _count_single_pass(outcome):
+    with _single_pass_lock:
+        single_pass_stats[outcome] += 1
+
+def single_pass_report():
+    total = single_pass_stats['parsed'] + single_pass_stats['fallback']
+    return {**single_pass_stats, 'fallback_rate': single_pass_stats['fallback'] / total if total else 0.0}
+
+def _expected_questions(state):
+    return [q['question'] for q in state['user_input']['open_questions']]
+
+def parse_cks(state):
+    deck = parse_deck(state['messages'][-1].content, _expected_questions(state))
+    if deck is None:
+        _count_single_pass('fallback')
+        return format_cks(state)
+    _count_single_pass('parsed')
+    return {'current_knowledge_state': cite_exact(deck.dict(), state.get('lesson_doc'))}
+
+def parse_cks_reflection(state):
+    #The last message may be reflection feedback; use the newest complete evaluation.
+    expected = _expected_questions(state)
+    for message in reversed(state['messages']):
+        if isinstance(message, AIMessage):
+            deck = parse_deck(message.content, expected)
+            if deck is not None:
+                _count_single_pass('parsed')
+                return {'current_knowledge_state': cite_exact(deck.dict(), state.get('lesson_doc'))}
+    _count_single_pass('fallback')
+    return format_cks_reflection(state)
+
+#Map-reduce over question shards
+def shard_questions(questions, shard_size):
+    """Split questions into shards of at most `shard_size`, keeping questions that
+    share a concept together where possible. Returns lists of question indices."""
+    parent = list(range(len(questions)))
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    first_with_concept = {}
+    for i, question in enumerate(questions):
+        for concept in question.get('concepts_evaluated', []):
+            if concept in first_with_concept:
+                parent[find(i)] = find(first_with_concept[concept])
+            else:
+                first_with_concept[concept] = i
+
+    groups = {}
+    for i in range(len(questions)):
+        groups.setdefault(find(i), []).append(i)
+
+    shards, current = [], []
+    for group in sorted(groups.values(), key=lambda g: g[0]):
+        for start in range(0, len(group), shard_size):
+            piece = group[start:start + shard_size]
+            if len(current) + len(piece) > shard_size:
+                shards.append(current)
+                current = []
+            current = current + piece
+    if current:
+        shards.append(current)
+    return shards
+
+def grade_shard(state):
+    """Grade one shard (sent by the fan-out edge) with the one-shot evaluator."""
+    llm_response = one_shot_call_evaluator(state)['messages']
+    deck = parse_deck(llm_response.content, _expected_questions(state))
+    if deck is None:
+        _count_single_pass('fallback')
+        evaluated = format_cks({'messages': [llm_response]})['current_knowledge_state']['evaluated_questions']
+    else:
+        _count_single_pass('parsed')
+        evaluated = deck.dict()['evaluated_questions']
+    return {'shard_results': [{'shard_index': state['shard_index'], 'evaluated_questions': evaluated}]}
+
+def merge_shards(state):
+    """Merge shard decks back into the submission's question order."""
+    order = {' '.join(q['question'].split()): i for i, q in enumerate(state['user_input']['open_questions'])}
+    items = []
+    for result in sorted(state.get('shard_results', []), key=lambda r: r['shard_index']):
+        for item in result['evaluated_questions']:
+            items.append(item)
+    items.sort(key=lambda item: order.get(' '.join(item['question'].split()), len(order)))
+    return {'current_knowledge_state': {'evaluated_questions': items}}
 
 def call_reflection(state):
     new_step = state['reflection_steps'] + 1
-    model = ChatOpenAI(model="gpt-4o-mini", api_key=os.environ.get('OPENAI_API_KEY'))
+    model = chat_model("gpt-4o-mini")
     last_message = state['messages'][-1].content
     messages = [
         SystemMessage(content=EVALUATOR_REFLECTION_PROMPT),
         HumanMessage(content=f"The evaluation is the following: {last_message}")
         ]
     llm_response = model.invoke(messages)
+    #Tagged so local routing can tell feedback from an evaluation.
+    llm_response.name = REFLECTION_MESSAGE_NAME
     return {'messages': llm_response, 'reflection_steps': new_step}
 
 def supervisor(state):
-    class RouteResponse(BaseModel):
-        next: Literal["evaluator_with_feedback","call_reflection", "format_cks"]
-
-    model = ChatOpenAI(model='gpt-4o-mini',  api_key=os.environ.get('OPENAI_API_KEY'))
-    structured_model = model.with_structured_output(RouteResponse)
+    structured_model = chat_model('gpt-4o-mini', schema=RouteResponse)
     messages = [SystemMessage(content=SUPERVISOR_PROMPT)]
-    response = structured_model.invoke(messages + state['messages'])
+    response = structured_model.invoke(fit_messages(messages, state['messages']))
     final_reponse = response.dict()['next']
-    print(final_reponse)
+    logger.debug("supervisor route", extra={'next': final_reponse})
     return {'next': final_reponse}
 
 def evaluator_with_feedback(state):
-    model = ChatOpenAI(model="gpt-4o-mini", api_key=os.environ.get('OPENAI_API_KEY'))
-    evaluator_tools = [query_lesson]
+    model = chat_model("gpt-4o-mini", tools=[query_lesson])
 
     last_message = state['messages'][-1].content
 
     messages = [
         SystemMessage(content=EVALUATOR_SYSTEM_PROMPT_ONE_SHOT_FEEDBACK.format(
             blooms_state=state['blooms_state'],
-            concepts_to_evaluate=', '.join(state['concepts_to_evaluate'],
-            first_submission=state['first_submission'])
+            concepts_to_evaluate=', '.join(state['concepts_to_evaluate']),
+            first_submission=state['first_submission']
             )),
         HumanMessage(content=last_message)
     ]
-    
-    model = model.bind_tools(evaluator_tools)
+
     llm_response = model.invoke(messages)
 
     return {'messages': llm_response}
 
+#Local routing for the reflection loop: rules first, the LLM supervisor only when they cannot decide.
+MAX_REFLECTION_STEPS = 3
+REFLECTION_MESSAGE_NAME = "call_reflection"
+supervisor_stats = {'local': 0, 'llm': 0}
+_supervisor_lock = threading.Lock()
+
+def supervisor_report():
+    total = supervisor_stats['local'] + supervisor_stats['llm']
+    return {**supervisor_stats, 'skipped_rate': supervisor_stats['local'] / total if total else 0.0}
+
+def route_reflection(state):
+    """Next worker decided from the state alone, or None when it is ambiguous.
+
+    A complete evaluation (parses and grades every question) goes to
+    call_reflection, or to format_cks once the step cap is reached. Reflection
+    replying exactly NO_FEEDBACK_REPLY goes to format_cks. Any other feedback,
+    tool calls, empty messages and broken or partial evaluations are left to
+    the LLM supervisor: free text is not classified locally.
+    """
+    last_message = state['messages'][-1]
+    if not isinstance(last_message, AIMessage) or last_message.tool_calls:
+        return None
+    content = last_message.content if isinstance(last_message.content, str) else ''
+    if not content.strip():
+        return None
+    if last_message.name == REFLECTION_MESSAGE_NAME:
+        return 'format_cks' if content.strip().strip('.').upper() == NO_FEEDBACK_REPLY else None
+    if parse_deck(content, _expected_questions(state)) is not None:
+        return 'format_cks' if state['reflection_steps'] >= MAX_REFLECTION_STEPS else 'call_reflection'
+    return None
+
+def local_supervisor(state):
+    route = route_reflection(state)
+    if route is None:
+        with _supervisor_lock:
+            supervisor_stats['llm'] += 1
+        return supervisor(state)
+    with _supervisor_lock:
+        supervisor_stats['local'] += 1
+    record(supervisor_calls_skipped=1)
+    logger.debug("supervisor route", extra={'next': route, 'routing': 'local'})
+    return {'next': route}
+
 def should_continue_reflection(state):
-    if state['next'] == 'format_cks' or state['reflection_steps'] > 2:
+    if state['next'] == 'format_cks' or state['reflection_steps'] >= MAX_REFLECTION_STEPS:
         return 'format_cks'
     else:
         return state['next']
\ No newline at end of file
@@ -0,0 +1,142 @@
+#Parsing of the evaluator's JSON output
+import json
+from typing import List, Optional
+
+from pydantic import ValidationError
+
+from agent.state import SingleQuestionDeck, SingleQuestionFormat
+
+DECK_KEY = '"evaluated_questions"'
+VALID_SCORES = set("ABCDEF")
+
+
+def to_grade(item) -> Optional[SingleQuestionFormat]:
+    """Validate one evaluated item; reason/cited_paragraph may be missing."""
+    if not isinstance(item, dict) or 'question' not in item or 'score' not in item:
+        return None
+    item = {'reason': '', 'cited_paragraph': '', **item}
+    try:
+        return SingleQuestionFormat(**{k: str(v) for k, v in item.items() if k in SingleQuestionFormat.model_fields})
+    except ValidationError:
+        return None
+
+
+class GradeStreamParser:
+    """Incremental parser for streamed evaluator output.
+
+    Feed it text chunks as they arrive; every time an object inside the
+    "evaluated_questions" array is closed it is returned as a
+    SingleQuestionFormat, without waiting for the rest of the JSON. Text before
+    the JSON (strategy notes, code fences) is skipped.
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.pos = 0
+        self.in_array = False
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.item_start = None
+
+    def feed(self, text: str) -> List[SingleQuestionFormat]:
+        self.buffer += text
+        grades = []
+        while self.pos < len(self.buffer):
+            if not self.in_array:
+                key = self.buffer.find(DECK_KEY, self.pos)
+                if key == -1:
+                    #Keep a tail in case the key is split across chunks.
+                    self.pos = max(self.pos, len(self.buffer) - len(DECK_KEY))
+                    break
+                bracket = self.buffer.find('[', key + len(DECK_KEY))
+                if bracket == -1:
+                    self.pos = key
+                    break
+                self.in_array = True
+                self.pos = bracket + 1
+                continue
+
+            char = self.buffer[self.pos]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char == '{':
+                if self.depth == 0:
+                    self.item_start = self.pos
+                self.depth += 1
+            elif char == '}':
+                self.depth -= 1
+                if self.depth == 0 and self.item_start is not None:
+                    try:
+                        grade = to_grade(json.loads(self.buffer[self.item_start:self.pos + 1]))
+                    except ValueError:
+                        grade = None
+                    if grade is not None:
+                        grades.append(grade)
+                    self.item_start = None
+            elif char == ']' and self.depth == 0:
+                #Array closed; a later deck (e.g. a revised one) starts a new search.
+                self.in_array = False
+            self.pos += 1
+        return grades
+
+
+def _json_candidates(text: str):
+    """JSON objects embedded in text: fenced blocks first, then any '{' that decodes."""
+    decoder = json.JSONDecoder()
+    for fence in ('```json', '```'):
+        start = text.find(fence)
+        while start != -1:
+            end = text.find('```', start + len(fence))
+            if end == -1:
+                break
+            try:
+                yield json.loads(text[start + len(fence):end])
+            except ValueError:
+                pass
+            start = text.find(fence, end + 3)
+    start = text.find('{')
+    while start != -1:
+        try:
+            yield decoder.raw_decode(text, start)[0]
+        except ValueError:
+            pass
+        start = text.find('{', start + 1)
+
+
+def parse_deck(text: str, expected_questions: Optional[List[str]] = None) -> Optional[SingleQuestionDeck]:
+    """Strict local parse of an evaluator reply into a SingleQuestionDeck.
+
+    The reply must contain a JSON object with "evaluated_questions" that
+    validates against the schema, one A-F letter per score and, when
+    `expected_questions` is given, an entry for every one of them. Returns None
+    otherwise so the caller can fall back to the formatter LLM.
+    """
+    if not isinstance(text, str) or 'evaluated_questions' not in text:
+        return None
+    for candidate in _json_candidates(text):
+        if not isinstance(candidate, dict) or 'evaluated_questions' not in candidate:
+            continue
+        try:
+            deck = SingleQuestionDeck.model_validate(candidate)
+        except ValidationError:
+            continue
+        if not deck.evaluated_questions:
+            continue
+        if any(item.score.strip().upper() not in VALID_SCORES for item in deck.evaluated_questions):
+            continue
+        if expected_questions is not None:
+            graded = {' '.join(item.question.split()) for item in deck.evaluated_questions}
+            if any(' '.join(q.split()) not in graded for q in expected_questions):
+                continue
+        for item in deck.evaluated_questions:
+            item.score = item.score.strip().upper()
+        return deck
+    return None
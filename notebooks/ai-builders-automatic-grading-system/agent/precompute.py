@@ -0,0 +1,122 @@
+#Retrieval precomputed once per lesson and question bank, shared by every student
+import json
+import os
+from typing import Iterable, List
+from uuid import uuid4
+
+from agent.cache import content_key
+from agent.context import CONTEXT_TOKEN_BUDGET, CONTEXT_TOP_K, pack_paragraphs
+from agent.models import chat_model
+from agent.retrievers import DEFAULT_RETRIEVER
+from agent.tools import get_retriever, lesson_key, rag_messages
+
+QUESTION_CONTEXT_DIR = os.environ.get('QUESTION_CONTEXT_DIR', os.path.join('.cache', 'question_context'))
+
+
+def question_bank_from_cohort(cohort: dict) -> List[dict]:
+    """Distinct questions (by id) of a {student_id: [question, ...]} benchmark file."""
+    bank = {}
+    for questions in cohort.values():
+        for question in questions:
+            bank.setdefault(question['id'], {
+                'id': question['id'],
+                'question': question['question'],
+                'concepts_evaluated': question.get('concepts_evaluated', []),
+            })
+    return list(bank.values())
+
+
+def _search(retriever, texts: List[str], top_k: int, budget: int) -> List[List[dict]]:
+    """Packed top-k paragraphs ({start_index, text}) for each text, with one index query."""
+    return [
+        [{'start_index': doc.metadata['start_index'], 'text': doc.page_content} for doc in pack_paragraphs(hits, budget)]
+        for hits in retriever.search_many(texts, top_k)
+    ]
+
+
+def build_question_context(lesson_doc: str, question_bank: Iterable[dict], top_k: int = CONTEXT_TOP_K,
+                           reference_answers: bool = True, max_concurrency: int = 8, retriever: str = None,
+                           budget: int = CONTEXT_TOKEN_BUDGET) -> dict:
+    """Map every question id and concept of the bank to its top lesson paragraphs.
+
+    With `reference_answers`, a reference answer is generated once per distinct
+    question text from those paragraphs (at most `budget` tokens each). The result is cached on disk, keyed by the
+    lesson, the bank and the settings (including the `retriever` kind), so a
+    cohort pays retrieval once per distinct question instead of once per
+    student and question.
+    """
+    question_bank = sorted(question_bank, key=lambda q: str(q['id']))
+    key = content_key(
+        lesson_key(lesson_doc), top_k, budget, reference_answers, retriever or DEFAULT_RETRIEVER,
+        json.dumps([[q['id'], q['question']] for q in question_bank]),
+    )
+    path = os.path.join(QUESTION_CONTEXT_DIR, f"{key}.json")
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+
+    #Question ids are per student answer; the same question text is retrieved once.
+    texts = list(dict.fromkeys(q['question'] for q in question_bank))
+    index = get_retriever(lesson_doc, retriever)
+    text_chunks = _search(index, texts, top_k, budget)
+    concepts = sorted({c for q in question_bank for c in q.get('concepts_evaluated', [])})
+    concept_chunks = _search(index, [c.replace('_', ' ') for c in concepts], top_k, budget)
+
+    answers = [None] * len(texts)
+    if reference_answers and texts:
+        replies = chat_model("gpt-4o-mini").batch(
+            [rag_messages(text, format_excerpts(chunks)) for text, chunks in zip(texts, text_chunks)],
+            config={'max_concurrency': max_concurrency},
+        )
+        answers = [reply.content for reply in replies]
+
+    context = {
+        'lesson_key': lesson_key(lesson_doc),
+        'references': {
+            content_key(text): {'question': text, 'chunks': chunks, 'reference_answer': answer}
+            for text, chunks, answer in zip(texts, text_chunks, answers)
+        },
+        'questions': {
+            str(q['id']): {'ref': content_key(q['question']), 'concepts': q.get('concepts_evaluated', [])}
+            for q in question_bank
+        },
+        'concepts': dict(zip(concepts, concept_chunks)),
+    }
+
+    os.makedirs(QUESTION_CONTEXT_DIR, exist_ok=True)
+    #Unique per builder: two workers warming the same bank must not share a temp file.
+    tmp_path = f"{path}.{uuid4().hex}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(context, f)
+    os.replace(tmp_path, path)
+    return context
+
+
+def format_excerpts(chunks: List[dict]) -> str:
+    """Precomputed paragraphs as a context block labelled like format_paragraphs."""
+    return '\n\n'.join(f"[P{chunk['start_index']}] {chunk['text']}" for chunk in chunks)
+
+
+def context_for_questions(context: dict, questions: List[dict]) -> dict:
+    """The slice of a precomputed context needed by one submission.
+
+    Keeps the per-student state (and its checkpoints) small; questions missing
+    from the bank fall back to the chunks of their concepts.
+    """
+    selected = {}
+    for question in questions:
+        known = context['questions'].get(str(question.get('id')))
+        ref = known['ref'] if known else content_key(question['question'])
+        entry = context['references'].get(ref)
+        if entry is None:
+            chunks = []
+            for concept in question.get('concepts_evaluated', []):
+                chunks += [c for c in context['concepts'].get(concept, []) if c not in chunks]
+            entry = {'question': question['question'], 'chunks': chunks, 'reference_answer': None}
+        selected[str(question.get('id'))] = entry
+    return selected
+
+
+def attach_question_context(exec_state: dict, context: dict) -> dict:
+    questions = exec_state['user_input']['open_questions']
+    return {**exec_state, 'question_context': context_for_questions(context, questions)}
@@ -23,7 +23,7 @@ Output Requirements:
 	•	"question": the exact question text
 	•	"score": one letter (A–F)
 	•	"reason": a concise explanation linking the score to the rubric and the evaluated concepts
-	•	"cited_paragraph": a relevant paragraph from the lesson (obtained via query_lesson), if applicable
+	•	"cited_paragraph": the label of the relevant lesson paragraph returned by query_lesson (e.g. "P1234"), if applicable
 
 No additional instructions or actions should be provided after producing the JSON.
 Do not correct grammar or address concepts not listed for evaluation.
@@ -44,7 +44,7 @@ Output Requirements:
 	•	"question": the exact question text
 	•	"score": one letter (A–F)
 	•	"reason": a concise explanation linking the score to the rubric and the evaluated concepts
-	•	"cited_paragraph": a relevant paragraph from the lesson (obtained via query_lesson), if applicable
+	•	"cited_paragraph": a relevant paragraph from the lesson (obtained via query_lesson), if applicable. Keep paragraph labels such as "P1234" exactly as written.
 
 Remember that each question have to be unique. Make sure there are not repeated scores and integrate all the submission.
 """
@@ -120,6 +120,9 @@ The user is about to give you feedback and you have to integrate that feedback a
 each questions is unique.
 """
 
+#Whole reply of the reflection step when it has nothing to add, see route_reflection.
+NO_FEEDBACK_REPLY = "NO FURTHER FEEDBACK"
+
 EVALUATOR_REFLECTION_PROMPT = """Evaluate the coherence and accuracy of the evaluation you will be given.
 These evaluations are tailored to be fair and aligned with the following rubric:
 
@@ -132,10 +135,52 @@ Score each question using:
 
 Assess this explanation again and try to find some gaps in the understanding of the evaluator that has give the grades.
 Focus first solely in the grade assigned and if everything is good provide a feedback on the reason why is evaluated like that.
-If everything seems to be correct just answer to the user explaining that you don't have any feedback to include in any question so far.
+If everything seems to be correct answer exactly NO FURTHER FEEDBACK, with nothing else.
 """
 
 SUPERVISOR_PROMPT = """You are a supervisor tasked with managing a conversation between the following workers: "evaluator_with_feedback", "call_reflection" and "format_cks" 
 Given the following user request, respond with the worker to act next. Each worker will perform a task and respond with their results and status. When finished, respond with "format_cks" which 
 is the next task after these two workers finish their work.
-"""
\ No newline at end of file
+"""
+
+EVALUATOR_SYSTEM_PROMPT_PRECOMPUTED = """You are an assistant that evaluates a set of open-ended questions at a specified Bloom’s taxonomy level: {blooms_state}.
+Evaluation Steps:
+	1.	Outline a clear strategy to assess the student’s knowledge at the given Bloom’s level.
+
+    2.	The relevant lesson excerpts and a reference answer for every question were retrieved beforehand and are given with the questions. Base the evaluation on them.
+
+    3.	Evaluate all questions at once if doing so does not reduce quality:
+	•	Identify related concepts across the questions.
+	•	Compare each answer with its reference answer and lesson excerpts.
+	•	Determine where the student’s understanding falls short of the {blooms_state} criteria.
+	•	Highlight specific conceptual gaps.
+
+	4.	Score each question using:
+	•	A (Excellent): Thorough, nuanced understanding.
+	•	B (Good): Mostly correct with minor gaps.
+	•	C (Fair): Partial understanding with notable gaps.
+	•	D (Needs Improvement): Limited comprehension; multiple errors.
+	•	F (Poor): Fundamentally incorrect; fails basic criteria.
+
+Output Requirements:
+	•	Provide one final JSON object with the key "evaluated_questions" mapping to a list of evaluated items.
+	•	Each item in the list must have:
+	•	"question": the exact question text
+	•	"score": one letter (A–F)
+	•	"reason": a concise explanation linking the score to the rubric and the evaluated concepts
+	•	"cited_paragraph": the label of the relevant lesson excerpt (e.g. "P1234"), if applicable
+
+No additional instructions or actions should be provided after producing the JSON.
+Do not correct grammar or address concepts not listed for evaluation.
+
+Concepts to Evaluate:
+
+{concepts_to_evaluate}
+"""
+
+EVALUATOR_USER_PROMPT_PRECOMPUTED = """Here are the questions you have to evaluate for the user:
+Open Questions: {open_questions}
+
+Lesson excerpts:
+{excerpts}
+"""
@@ -0,0 +1,119 @@
+#Append-only results of cohort runs: one JSON line per graded student, resumable and loadable by column
+import json
+import os
+import threading
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+QUESTION_FIELDS = ('question', 'score', 'reason', 'cited_paragraph')
+
+
+def _is_error(result) -> bool:
+    return not isinstance(result, dict) or 'ERROR' in result
+
+
+def iter_results(path: str) -> Iterator[Tuple[str, dict]]:
+    """(key, result) of every line of a results file, in write order.
+
+    A student graded twice appears twice, the last line wins. A line cut short
+    by a crash while it was written is skipped.
+    """
+    if not os.path.exists(path):
+        return
+    with open(path) as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue
+            yield row['key'], row['result']
+
+
+class ResultsSink:
+    """Appends each student's current_knowledge_state to a JSONL file as soon as it is graded.
+
+    Lines are {"key": ..., "result": ...}; keys are stored as strings. Failed
+    students ({"ERROR": ...}) are written too but do not count as done, so a
+    rerun grades them again. Only the keys are kept in memory.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.done = set()
+        for key, result in iter_results(path):
+            if _is_error(result):
+                self.done.discard(key)
+            else:
+                self.done.add(key)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        #A line cut short by a crash must not swallow the next one.
+        if os.path.exists(path) and os.path.getsize(path):
+            with open(path, 'rb+') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    f.write(b'\n')
+
+    def __contains__(self, key) -> bool:
+        return str(key) in self.done
+
+    def write(self, key, result):
+        line = json.dumps({'key': str(key), 'result': result})
+        with self._lock:
+            #One write per line and a flush, so a crash loses at most the line being written.
+            with open(self.path, 'a') as f:
+                f.write(line + '\n')
+                f.flush()
+            if _is_error(result):
+                self.done.discard(str(key))
+            else:
+                self.done.add(str(key))
+
+    def load(self, keys: Iterable) -> dict:
+        """{key: result} of the given keys found in the file, last line per key."""
+        wanted = {str(key) for key in keys}
+        return {key: result for key, result in iter_results(self.path) if key in wanted}
+
+
+def load_results(path: str) -> dict:
+    """{key: result} of a JSONL results file or of a notebook *_final_responses.json file."""
+    if path.endswith('.jsonl'):
+        return dict(iter_results(path))
+    with open(path) as f:
+        return json.load(f)
+
+
+def results_frame(path: str, columns: Optional[List[str]] = None, lesson: str = 'lesson_1') -> pd.DataFrame:
+    """One row per graded question: key, lesson, student_id, question, score, reason, cited_paragraph.
+
+    Reads a JSONL results file line by line, or a Parquet file written by
+    to_parquet. Only `columns` are built (all by default); keys of the form
+    "lesson_<n>/<student_id>" are split, bare keys get `lesson`. Failed
+    students have no rows.
+    """
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path, columns=columns)
+    names = ['key', 'lesson', 'student_id', *QUESTION_FIELDS]
+    wanted = columns or names
+    #First pass keeps only the line number of each key's last result, the second builds the columns.
+    last = {key: i for i, (key, _) in enumerate(iter_results(path))}
+    data = {name: [] for name in wanted}
+    for i, (key, result) in enumerate(iter_results(path)):
+        if last[key] != i or _is_error(result):
+            continue
+        student_lesson, _, student_id = key.rpartition('/')
+        row = {'key': key, 'lesson': student_lesson or lesson, 'student_id': student_id}
+        for item in result.get('evaluated_questions', []):
+            for name in wanted:
+                data[name].append(row[name] if name in row else item.get(name, ''))
+    return pd.DataFrame(data, columns=wanted)
+
+
+def to_parquet(jsonl_path: str, parquet_path: Optional[str] = None, lesson: str = 'lesson_1') -> str:
+    """Write the question rows of a JSONL results file as Parquet (needs pyarrow or fastparquet)."""
+    parquet_path = parquet_path or os.path.splitext(jsonl_path)[0] + '.parquet'
+    results_frame(jsonl_path, lesson=lesson).to_parquet(parquet_path, index=False)
+    return parquet_path
@@ -0,0 +1,187 @@
+#Lesson retrievers: dense (FAISS), lexical (BM25) and hybrid
+import os
+import re
+from abc import ABC, abstractmethod
+from typing import List
+
+import numpy as np
+from langchain_core.documents import Document
+
+RETRIEVERS = ("dense", "bm25", "hybrid")
+DEFAULT_RETRIEVER = os.environ.get('RETRIEVER', 'dense')
+MIN_PARAGRAPH_CHARS = 200
+HYBRID_ALPHA = 0.5
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:\+\+)?")
+
+
+def tokenize(text: str) -> List[str]:
+    #Keeps "c++" as one token, it is the subject of half the lessons.
+    return _TOKEN.findall(text.lower())
+
+
+def split_paragraphs(lesson_doc: str, min_chars: int = MIN_PARAGRAPH_CHARS) -> List[Document]:
+    """Blank-line separated paragraphs with their start_index in the lesson.
+
+    Paragraphs shorter than `min_chars` (headings, one-line transitions) are
+    merged into the next one so every chunk carries some content.
+    """
+    documents = []
+    pending_start = None
+    for match in re.finditer(r"\S(?:.|\n(?!\s*\n))*", lesson_doc):
+        start = match.start() if pending_start is None else pending_start
+        if match.end() - start < min_chars:
+            pending_start = start
+            continue
+        documents.append(Document(page_content=lesson_doc[start:match.end()], metadata={'start_index': start}))
+        pending_start = None
+    if pending_start is not None:
+        if documents:
+            start = documents[-1].metadata['start_index']
+            documents[-1] = Document(page_content=lesson_doc[start:].rstrip(), metadata={'start_index': start})
+        else:
+            documents.append(Document(page_content=lesson_doc[pending_start:].rstrip(), metadata={'start_index': pending_start}))
+    return documents
+
+
+def _unit(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+
+def _minmax(scores: np.ndarray) -> np.ndarray:
+    low = scores.min(axis=1, keepdims=True)
+    span = scores.max(axis=1, keepdims=True) - low
+    return np.where(span > 0, (scores - low) / np.where(span > 0, span, 1), 0.0)
+
+
+class Retriever(ABC):
+    """Top-k lesson chunks for a batch of queries.
+
+    Subclasses implement `search_many`; results are Documents whose metadata
+    holds the chunk's `start_index` and its `score`.
+    """
+
+    @abstractmethod
+    def search_many(self, queries: List[str], k: int = 1) -> List[List[Document]]:
+        ...
+
+    def search(self, query: str, k: int = 1) -> List[Document]:
+        return self.search_many([query], k)[0]
+
+    def query_similarity(self, queries: List[str]) -> np.ndarray:
+        """Pairwise query similarity, used to spot near-duplicate questions."""
+        vocabulary = {}
+        rows = [[vocabulary.setdefault(t, len(vocabulary)) for t in tokenize(q)] for q in queries]
+        counts = np.zeros((len(queries), max(len(vocabulary), 1)), dtype=np.float32)
+        for i, row in enumerate(rows):
+            np.add.at(counts[i], row, 1)
+        unit = _unit(counts)
+        return unit @ unit.T
+
+
+def _top_k(documents: List[Document], scores: np.ndarray, k: int) -> List[List[Document]]:
+    k = min(k, scores.shape[1])
+    top = np.argsort(-scores, axis=1, kind='stable')[:, :k]
+    return [
+        [Document(page_content=documents[j].page_content,
+                  metadata={**documents[j].metadata, 'score': float(row_scores[j])})
+         for j in row]
+        for row, row_scores in zip(top, scores)
+    ]
+
+
+class BM25Retriever(Retriever):
+    """Okapi BM25 over paragraph chunks, as one dense (paragraphs x vocabulary) matrix.
+
+    The per-term weights are computed when the index is built, so scoring a
+    batch of queries is a single matrix product; no network calls.
+    """
+
+    def __init__(self, documents: List[Document], k1: float = 1.5, b: float = 0.75):
+        self.documents = documents
+        tokens = [tokenize(d.page_content) for d in documents]
+        self.vocabulary = {}
+        for doc_tokens in tokens:
+            for token in doc_tokens:
+                self.vocabulary.setdefault(token, len(self.vocabulary))
+
+        tf = np.zeros((len(documents), len(self.vocabulary)), dtype=np.float32)
+        for i, doc_tokens in enumerate(tokens):
+            np.add.at(tf[i], [self.vocabulary[t] for t in doc_tokens], 1)
+        lengths = tf.sum(axis=1, keepdims=True)
+        document_frequency = (tf > 0).sum(axis=0)
+        idf = np.log(1 + (len(documents) - document_frequency + 0.5) / (document_frequency + 0.5))
+        norm = k1 * (1 - b + b * lengths / max(float(lengths.mean()), 1.0))
+        self.weights = (idf * tf * (k1 + 1) / (tf + norm)).astype(np.float32)
+
+    def query_matrix(self, queries: List[str]) -> np.ndarray:
+        counts = np.zeros((len(queries), len(self.vocabulary)), dtype=np.float32)
+        for i, query in enumerate(queries):
+            ids = [self.vocabulary[t] for t in tokenize(query) if t in self.vocabulary]
+            np.add.at(counts[i], ids, 1)
+        return counts
+
+    def scores(self, queries: List[str]) -> np.ndarray:
+        return self.query_matrix(queries) @ self.weights.T
+
+    def search_many(self, queries: List[str], k: int = 1) -> List[List[Document]]:
+        if not queries:
+            return []
+        return _top_k(self.documents, self.scores(queries), k)
+
+
+class DenseRetriever(Retriever):
+    """The FAISS store built by agent.tools.create_load_vector_store."""
+
+    def __init__(self, vector_store, embeddings):
+        self.vector_store = vector_store
+        self.embeddings = embeddings
+
+    def search_many(self, queries: List[str], k: int = 1) -> List[List[Document]]:
+        if not queries:
+            return []
+        vectors = np.ascontiguousarray(self.embeddings.embed_array(queries), dtype=np.float32)
+        distances, indices = self.vector_store.index.search(vectors, k)
+        store = self.vector_store
+        results = []
+        for row, row_distances in zip(indices, distances):
+            hits = []
+            for i, distance in zip(row, row_distances):
+                if i == -1:
+                    continue
+                doc = store.docstore.search(store.index_to_docstore_id[i])
+                hits.append(Document(page_content=doc.page_content, metadata={**doc.metadata, 'score': float(distance)}))
+            results.append(hits)
+        return results
+
+    def query_similarity(self, queries: List[str]) -> np.ndarray:
+        unit = _unit(self.embeddings.embed_array(queries))
+        return unit @ unit.T
+
+
+class HybridRetriever(Retriever):
+    """BM25 and embedding cosine over the same paragraphs, fused per query.
+
+    Both score rows are min-max scaled and mixed as
+    alpha * lexical + (1 - alpha) * dense. Paragraph vectors are embedded once
+    when the index is built; queries still need an embedding (cached).
+    """
+
+    def __init__(self, documents: List[Document], embeddings, alpha: float = HYBRID_ALPHA):
+        self.documents = documents
+        self.embeddings = embeddings
+        self.alpha = alpha
+        self.lexical = BM25Retriever(documents)
+        self.vectors = _unit(embeddings.embed_array([d.page_content for d in documents]))
+
+    def search_many(self, queries: List[str], k: int = 1) -> List[List[Document]]:
+        if not queries:
+            return []
+        dense = _unit(self.embeddings.embed_array(queries)) @ self.vectors.T
+        scores = self.alpha * _minmax(self.lexical.scores(queries)) + (1 - self.alpha) * _minmax(dense)
+        return _top_k(self.documents, scores, k)
+
+    def query_similarity(self, queries: List[str]) -> np.ndarray:
+        unit = _unit(self.embeddings.embed_array(queries))
+        return unit @ unit.T
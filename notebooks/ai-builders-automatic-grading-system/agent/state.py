@@ -1,4 +1,6 @@
-from typing import TypedDict, Annotated, Optional
+import operator
+from typing import TypedDict, Annotated, Optional, List
+from pydantic import BaseModel
 from langgraph.graph.message import add_messages
 
 class OverallState(TypedDict):
@@ -11,6 +13,18 @@ class OverallState(TypedDict):
     reflection_steps: Optional[int]
     scratchpad: Optional[dict]
     first_submission: Optional[str]
+    question_context: Optional[dict]  # Precomputed lesson context by question id
 
     current_knowledge_state: dict
-    messages: Annotated[list, add_messages]  # General messages
\ No newline at end of file
+    messages: Annotated[list, add_messages]  # General messages
+    shard_results: Annotated[list, operator.add]  # Per-shard decks in the sharded graph
+
+#Structured output of the formatter nodes
+class SingleQuestionFormat(BaseModel):
+    question: str
+    score: str
+    reason: str
+    cited_paragraph: str
+
+class SingleQuestionDeck(BaseModel):
+    evaluated_questions: List[SingleQuestionFormat]
@@ -1,106 +1,199 @@
 #RAG Related Tools
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-import faiss
 import os
+import shutil
 import logging
 from uuid import uuid4
-from dotenv import load_dotenv
-load_dotenv()
 from langchain_core.tools import tool
 from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.runnables import RunnableConfig
 from langgraph.prebuilt import InjectedState
-from langchain_openai import ChatOpenAI
-from typing import Annotated
+from agent.models import chat_model, load_env
+from typing import Annotated, List
 import os
 import json
 
+from agent.cache import LRUCache, content_key
+from agent.context import CONTEXT_TOKEN_BUDGET, CONTEXT_TOP_K, format_paragraphs, pack_paragraphs, paragraph_label
+from agent.embeddings import CachedEmbeddings
+from agent.retrievers import (
+    DEFAULT_RETRIEVER, MIN_PARAGRAPH_CHARS, RETRIEVERS, BM25Retriever, DenseRetriever, HybridRetriever,
+    split_paragraphs
+)
 
-from langchain_community.docstore.in_memory import InMemoryDocstore
-from langchain_community.vectorstores import FAISS
-from langchain_openai import OpenAIEmbeddings
+logger = logging.getLogger(__name__)
 
 #Objects:
-embeddings = OpenAIEmbeddings(model="text-embedding-3-large",
-                              api_key=os.environ.get('OPENAI_API_KEY'))
+EMBEDDING_MODEL = "text-embedding-3-large"
+NEAR_DUPLICATE_SIMILARITY = 0.95
+RAG_PROMPT = """
+        You are a helpful AI assistant, please respond to the users query to the best of your ability!
+        You should response to the user in a way that is clear, concise and is aligned with the context. 
+        Remember that all the questions are going to be attached to the given context.
+        """
+VECTOR_STORE_DIR = os.environ.get('VECTOR_STORE_DIR', os.path.join('.cache', 'vector_stores'))
 
-#Retrieval function
-def create_load_vector_store(lessonid: str, lesson_doc: str):
+def _openai_embeddings():
+    from langchain_openai import OpenAIEmbeddings
+    load_env()
+    return OpenAIEmbeddings(model=EMBEDDING_MODEL, api_key=os.environ.get('OPENAI_API_KEY'))
 
-    #We are setting the document as long as possible for this.
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=5_000, chunk_overlap=1_500, add_start_index=True
-    )
+#Every embedding goes through the local cache; only misses reach OpenAI, in batches.
+#The client (and langchain_openai) is only loaded on the first miss.
+embeddings = CachedEmbeddings(_openai_embeddings, model=EMBEDDING_MODEL)
 
-    all_splits = text_splitter.create_documents([lesson_doc])
+#One index per distinct lesson text, shared by every tool call in the process.
+vector_stores = LRUCache(maxsize=int(os.environ.get('VECTOR_STORE_CACHE_SIZE', 8)))
+retrievers = LRUCache(maxsize=int(os.environ.get('VECTOR_STORE_CACHE_SIZE', 8)))
 
-    if f'{lessonid}_index' not in os.listdir():
-        
-        uuids = [str(uuid4()) for _ in range(len(all_splits))]
-        #define vector store:
-        index = faiss.IndexFlatL2(len(embeddings.embed_query("hello berlin ai builders!")))
+def lesson_key(lesson_doc: str) -> str:
+    return content_key(EMBEDDING_MODEL, 'paragraphs', MIN_PARAGRAPH_CHARS, lesson_doc)
 
-        vector_store = FAISS(
-            embedding_function=embeddings,
-            index=index,
-            docstore=InMemoryDocstore(),
-            index_to_docstore_id={},
-        )
+def _build_vector_store(lesson_doc: str, path: str):
+    #faiss and langchain_community are only needed by the dense retriever.
+    from langchain_community.vectorstores import FAISS
 
-        uuids = [str(uuid4()) for _ in range(len(all_splits))]
-        vector_store.add_documents(documents=all_splits, ids=uuids)
+    if os.path.isdir(path):
+        return FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
 
-        return vector_store
+    #Paragraph-level chunks with their start_index, packed per query under a token budget.
+    all_splits = split_paragraphs(lesson_doc)
 
-    else:
-        vector_store = FAISS.load_local(
-            f'{lessonid}_index',
-            embeddings,
-            allow_dangerous_deserialization=True
-        )
+    #The index dimension is taken from the chunk embeddings, no probe query needed.
+    uuids = [str(uuid4()) for _ in range(len(all_splits))]
+    vector_store = FAISS.from_documents(all_splits, embeddings, ids=uuids)
 
-        return vector_store
-    
-def retrieve_result(query:str, vector_store) -> str:
+    #Write to a temp folder and rename so concurrent processes never read a half-written index.
+    tmp_path = f"{path}.{uuid4().hex}.tmp"
+    vector_store.save_local(tmp_path)
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+    return vector_store
 
-    results = vector_store.similarity_search(
-        query,
-        k=3,
+def rag_messages(question: str, context: str) -> list:
+    system_prompt = SystemMessage(RAG_PROMPT)
+    human_msg = HumanMessage(
+        content=f"""
+            Context: {context} Question to answer: {question}"
+        """
     )
+    return [system_prompt, human_msg]
+
+#Retrieval function
+def create_load_vector_store(lesson_doc: str):
+    """Return the FAISS store of a lesson's paragraphs, building it at most once.
+
+    Stores are kept in a process-wide LRU keyed by a hash of the lesson text and
+    paragraph settings, and persisted under VECTOR_STORE_DIR so restarts skip the
+    embedding step as well.
+    """
+    key = lesson_key(lesson_doc)
+    path = os.path.join(VECTOR_STORE_DIR, key)
+    os.makedirs(VECTOR_STORE_DIR, exist_ok=True)
+    return vector_stores.get_or_create(key, lambda: _build_vector_store(lesson_doc, path))
+    
+def _build_retriever(lesson_doc: str, kind: str):
+    if kind == "dense":
+        return DenseRetriever(create_load_vector_store(lesson_doc), embeddings)
+    if kind == "bm25":
+        return BM25Retriever(split_paragraphs(lesson_doc))
+    if kind == "hybrid":
+        return HybridRetriever(split_paragraphs(lesson_doc), embeddings)
+    raise ValueError(f"Unknown retriever {kind!r}, expected one of {RETRIEVERS}")
+
+def get_retriever(lesson_doc: str, kind: str = None):
+    """Retriever of the given kind ("dense", "bm25" or "hybrid") for a lesson, built once per process."""
+    kind = kind or DEFAULT_RETRIEVER
+    return retrievers.get_or_create(content_key(kind, lesson_key(lesson_doc)), lambda: _build_retriever(lesson_doc, kind))
+
+def retriever_kind(config: RunnableConfig = None, default: str = None) -> str:
+    """The retriever selected for a run with configurable={"retriever": ...},
+    else `default` (the graph's choice), else DEFAULT_RETRIEVER.
+    """
+    return ((config or {}).get('configurable') or {}).get('retriever') or default or DEFAULT_RETRIEVER
 
-    return results[0].page_content
+def retrieve_result(query:str, retriever, budget: int = CONTEXT_TOKEN_BUDGET) -> list:
+    """Top paragraphs for the query, deduped and packed under `budget` tokens."""
+    return pack_paragraphs(retriever.search(query, k=CONTEXT_TOP_K), budget)
+
+def _rag_result(question: str, answer: str, paragraphs: list) -> dict:
+    #Labels the evaluator can put in cited_paragraph; they are resolved to the exact lesson text.
+    return {'messages': f"Question: {question} Answer: {answer}", 'paragraphs': [paragraph_label(p) for p in paragraphs]}
 
 @tool()
-def query_lesson(question: str, state: Annotated[dict, InjectedState]): #Add a fixed parameter?
+def query_lesson(question: str, state: Annotated[dict, InjectedState], config: RunnableConfig): #Add a fixed parameter?
     """Ask a specific question regarding the lesson.
     This tool allows you to ask any question regarding the lesson being taught to the student. 
     It retrieves the relevant context from the lesson document and provides an AI-generated answer.
     Args:
         question (str): The question to ask in the context of the lesson.
     Returns:
-        dict: A dictionary containing the question and the generated answer in the scratchpad.
+        dict: A dictionary containing the question and the generated answer in the scratchpad,
+        plus the labels of the lesson paragraphs it is based on.
     Example:
         >>> query_lesson("What is the main topic covered in this lesson?")
     """
     lesson_document = state['lesson_doc']
     #Retrieval
-    vector_store = create_load_vector_store('lesson1', lesson_document)
-    context_retrieved = retrieve_result(question, vector_store)
+    retriever = get_retriever(lesson_document, retriever_kind(config))
+    paragraphs = retrieve_result(question, retriever)
     #Augmented:
-    rag_prompt = """
-        You are a helpful AI assistant, please respond to the users query to the best of your ability!
-        You should response to the user in a way that is clear, concise and is aligned with the context. 
-        Remember that all the questions are going to be attached to the given context.
-        """
-    system_prompt = SystemMessage(rag_prompt)
-    human_msg = HumanMessage(
-        content=f"""
-            Context: {context_retrieved} Question to answer: {question}"
-        """
-    )
+    messages = rag_messages(question, format_paragraphs(paragraphs))
     #Generation:
-    model = ChatOpenAI(model="gpt-4o-mini", api_key=os.environ.get('OPENAI_API_KEY'))
-    ai_msg = model.invoke([system_prompt, human_msg])
+    model = chat_model("gpt-4o-mini")
+    ai_msg = model.invoke(messages)
     answer = ai_msg.content
-    print(f"The answer: {answer}")
-    q_and_a_response = {'messages': f"Question: {question} Answer: {answer}"}
-    return q_and_a_response
\ No newline at end of file
+    logger.debug("query_lesson answer", extra={'question': question, 'answer': answer})
+    q_and_a_response = _rag_result(question, answer, paragraphs)
+    return q_and_a_response
+
+def _normalize_question(question: str) -> str:
+    return ' '.join(question.casefold().split())
+
+def batch_query_lesson(questions: List[str], lesson_doc: str, max_concurrency: int = 8, retriever: str = None) -> List[dict]:
+    """Answer several query_lesson questions in one pass.
+
+    Identical questions (ignoring case/whitespace) and near-identical ones
+    (cosine similarity >= NEAR_DUPLICATE_SIMILARITY) are answered once. All
+    remaining questions are searched with a single matrix query against the
+    lesson index (one embedding request for the dense retrievers) and generated
+    concurrently. Returns one query_lesson-shaped result per input question, in
+    order.
+    """
+    normalized = [_normalize_question(q) for q in questions]
+    unique = list(dict.fromkeys(normalized))
+    first_original = {}
+    for question, norm in zip(questions, normalized):
+        first_original.setdefault(norm, question)
+
+    index = get_retriever(lesson_doc, retriever)
+    similarity = index.query_similarity([first_original[norm] for norm in unique])
+
+    #Near-duplicates point at the first question they are similar to.
+    representative = list(range(len(unique)))
+    for i in range(len(unique)):
+        for j in range(i):
+            if representative[j] == j and similarity[i, j] >= NEAR_DUPLICATE_SIMILARITY:
+                representative[i] = j
+                break
+    to_answer = [i for i in range(len(unique)) if representative[i] == i]
+
+    #Retrieval: one matrix query for every distinct question.
+    hits = index.search_many([first_original[unique[i]] for i in to_answer], k=CONTEXT_TOP_K)
+    contexts = [pack_paragraphs(row) for row in hits]
+
+    #Generation: all answers concurrently.
+    model = chat_model("gpt-4o-mini")
+    replies = model.batch(
+        [rag_messages(first_original[unique[i]], format_paragraphs(context)) for i, context in zip(to_answer, contexts)],
+        config={'max_concurrency': max_concurrency},
+    )
+    answers = {i: (reply.content, context) for i, reply, context in zip(to_answer, replies, contexts)}
+
+    position = {norm: i for i, norm in enumerate(unique)}
+    return [
+        _rag_result(question, *answers[representative[position[norm]]])
+        for question, norm in zip(questions, normalized)
+    ]
\ No newline at end of file
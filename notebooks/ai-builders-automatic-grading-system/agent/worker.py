@@ -0,0 +1,177 @@
+"""Long-lived grading worker speaking JSON lines over stdin/stdout.
+
+    python -m agent.worker --graph one_shot basic_rag --concurrency 8 < requests.jsonl
+
+At startup the worker compiles every requested graph once, builds the lesson
+indexes of every data/lesson<n>.txt and the model clients, and then prints
+{"event": "ready", ...}. For precomputed_rag it also builds the question
+context of every lesson from its question bank,
+data/evals/open_questions_lesson_<n>_input.json.
+Each input line is a request
+
+    {"id": "s1", "graph": "one_shot", "lesson": 1, "open_questions": [...],
+     "concepts_to_evaluate": [...], "blooms_state": "understand", "options": {"single_pass": true}}
+
+(concepts default to the questions' concepts_evaluated, blooms_state to
+"understand", options are graph factory arguments). Requests are graded
+concurrently and answered as they finish, in any order:
+
+    {"id": "s1", "current_knowledge_state": {...}, "seconds": 1.23}
+    {"id": "s2", "error": "ValueError(...)", "seconds": 0.01}
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from agent import tools
+from agent.batch import grade_student
+from agent.context import count_tokens, lesson_paragraphs
+from agent.graphs import GRAPHS, compiled_graph
+from agent.models import chat_model, load_env
+from agent.precompute import attach_question_context, build_question_context, question_bank_from_cohort
+
+logger = logging.getLogger(__name__)
+
+#Graph factory arguments a request may set.
+GRAPH_OPTIONS = ("single_pass", "retriever", "routing", "compaction", "shard_size")
+WARM_MODELS = ("gpt-4o", "gpt-4o-mini")
+
+
+class GradingWorker:
+    """Compiled graphs and warm lesson indexes shared by every request of the process."""
+
+    def __init__(self, graphs=("one_shot",), data_dir="data", checkpointer="none", retriever=None,
+                 recursion_limit=10):
+        self.graphs = tuple(graphs)
+        self.data_dir = data_dir
+        self.checkpointer = checkpointer
+        self.retriever = retriever or tools.DEFAULT_RETRIEVER
+        self.recursion_limit = recursion_limit
+        self.lessons = {}
+        self.question_contexts = {}
+
+    def warm(self):
+        """Compile the graphs and build the lesson indexes; returns the seconds it took."""
+        start = time.perf_counter()
+        for name in self.graphs:
+            compiled_graph(name, **self._options(name, {}))
+        for path in sorted(glob.glob(os.path.join(self.data_dir, 'lesson*.txt'))):
+            lesson_id = re.search(r"lesson(\d+)\.txt$", path).group(1)
+            with open(path) as f:
+                self.lessons[lesson_id] = f.read()
+        for lesson_id, lesson_doc in self.lessons.items():
+            lesson_paragraphs(lesson_doc)
+            if {"basic_rag", "precomputed_rag"} & set(self.graphs):
+                tools.get_retriever(lesson_doc, self.retriever)
+            bank = os.path.join(self.data_dir, 'evals', f'open_questions_lesson_{lesson_id}_input.json')
+            if "precomputed_rag" in self.graphs and os.path.exists(bank):
+                with open(bank) as f:
+                    questions = question_bank_from_cohort(json.load(f))
+                self.question_contexts[lesson_id] = build_question_context(
+                    lesson_doc, questions, retriever=self.retriever
+                )
+        #Loads the tokenizer used by context packing and compaction, and the API clients.
+        count_tokens("")
+        for model in WARM_MODELS:
+            chat_model(model)
+        return time.perf_counter() - start
+
+    def exec_state(self, request: dict) -> dict:
+        lesson_id = str(request['lesson']).rpartition('_')[2]
+        if lesson_id not in self.lessons:
+            raise ValueError(f"Unknown lesson {request['lesson']!r}, expected one of {tuple(self.lessons)}")
+        questions = request['open_questions']
+        exec_state = dict(
+            user_input={'open_questions': questions},
+            concepts_to_evaluate=request.get('concepts_to_evaluate')
+            or sorted({c for q in questions for c in q.get('concepts_evaluated', [])}),
+            blooms_state=request.get('blooms_state', 'understand'),
+            lesson_doc=self.lessons[lesson_id],
+            reflection_steps=0,
+            messages=[],
+        )
+        if request.get('graph', self.graphs[0]) == "precomputed_rag":
+            if lesson_id not in self.question_contexts:
+                raise ValueError(f"No precomputed question context for lesson {request['lesson']!r}, "
+                                 f"expected one of {tuple(self.question_contexts)}")
+            exec_state = attach_question_context(exec_state, self.question_contexts[lesson_id])
+        return exec_state
+
+    def _options(self, name: str, options: dict) -> dict:
+        unknown = set(options) - set(GRAPH_OPTIONS)
+        if unknown:
+            raise ValueError(f"Unknown graph options {sorted(unknown)}, expected one of {GRAPH_OPTIONS}")
+        options = {'checkpointer': self.checkpointer, **options}
+        if name == "basic_rag":
+            #The index warmed at startup, unless the request picks another one.
+            options.setdefault('retriever', self.retriever)
+        return options
+
+    def graph(self, request: dict):
+        name = request.get('graph', self.graphs[0])
+        return compiled_graph(name, **self._options(name, request.get('options') or {}))
+
+    def grade(self, request: dict) -> dict:
+        """Response to one request; failures are reported in it, never raised."""
+        start = time.perf_counter()
+        response = {'id': request.get('id')}
+        try:
+            response['current_knowledge_state'] = grade_student(
+                self.graph(request), self.exec_state(request), self.recursion_limit
+            )
+        except Exception as e:
+            logger.warning("Request %s failed: %r", request.get('id'), e)
+            response['error'] = repr(e)
+        response['seconds'] = time.perf_counter() - start
+        return response
+
+    def serve(self, lines, out, concurrency=8):
+        """Grade JSON-line requests from `lines` on `concurrency` threads, writing responses to `out`."""
+        lock = threading.Lock()
+
+        def respond(response):
+            with lock:
+                out.write(json.dumps(response) + '\n')
+                out.flush()
+
+        def handle(line):
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError(f"Request must be a JSON object, got {type(request).__name__}")
+            except ValueError as e:
+                respond({'id': None, 'error': repr(e), 'seconds': 0.0})
+                return
+            respond(self.grade(request))
+
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='worker') as pool:
+            for line in lines:
+                if line.strip():
+                    pool.submit(handle, line)
+
+
+def main():
+    load_env()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--graph', choices=GRAPHS, nargs='*', default=['one_shot'], help="graphs to compile at startup")
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--checkpointer', choices=('memory', 'sqlite', 'none'), default='none')
+    parser.add_argument('--retriever', choices=tools.RETRIEVERS, default=None)
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+
+    worker = GradingWorker(args.graph, args.data_dir, args.checkpointer, args.retriever or os.environ.get('RETRIEVER'))
+    seconds = worker.warm()
+    print(json.dumps({'event': 'ready', 'seconds': seconds, 'graphs': list(worker.graphs),
+                      'lessons': sorted(worker.lessons)}), flush=True)
+    worker.serve(sys.stdin, sys.stdout, args.concurrency)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Memory held by the checkpointer after grading the full data/evals cohort.
+
+Runs every student of both lessons through one long-lived graph (as a grading
+worker would) with a zero-latency FakeChatModel, and reports the Python heap
+still allocated afterwards and the peak during the run, per checkpointer mode.
+
+    python -m benchmarks.checkpoint_memory --graph one_shot_with_reflection
+"""
+import argparse
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+
+from langgraph.checkpoint.memory import MemorySaver
+
+from agent import graphs
+from agent.checkpoint import sqlite_checkpointer
+from agent.fakes import FakeChatModel
+from agent.models import set_chat_model_factory
+from benchmarks.common import load_cohort
+
+GRAPHS = {
+    'one_shot': graphs.one_shot_graph,
+    'one_shot_with_reflection': graphs.one_shot_with_reflection_graph,
+}
+
+
+def measure(graph_factory, checkpointer, states) -> dict:
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    graph = graph_factory(checkpointer=checkpointer)
+    for exec_state in states:
+        graphs.execute_graph(exec_state, graph)
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'retained_kb': (retained - baseline) / 1024, 'peak_kb': (peak - baseline) / 1024, 'seconds': elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--graph', choices=GRAPHS, default='one_shot_with_reflection')
+    args = parser.parse_args()
+
+    set_chat_model_factory(lambda model: FakeChatModel(model_name=model))
+    states = list(load_cohort().values())
+    print(f"{len(states)} students, graph={args.graph}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        modes = {
+            'unbounded MemorySaver': MemorySaver(),
+            'memory': 'memory',
+            'sqlite': sqlite_checkpointer(os.path.join(tmp, 'checkpoints.sqlite')),
+            'none': 'none',
+        }
+        for name, checkpointer in modes.items():
+            result = measure(GRAPHS[args.graph], checkpointer, states)
+            print(f"{name:>22}: retained {result['retained_kb']:9.1f} KiB  "
+                  f"peak {result['peak_kb']:9.1f} KiB  {result['seconds']:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
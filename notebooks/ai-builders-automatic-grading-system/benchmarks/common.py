@@ -0,0 +1,98 @@
+"""Helpers shared by the benchmark scripts."""
+import glob
+import json
+import os
+import threading
+import uuid
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+
+def load_cohort(data_dir: str = 'data', reflection_steps: int = 0) -> dict:
+    """Every student of data/evals as {"lesson_<n>/<student_id>": exec_state}."""
+    states = {}
+    for path in sorted(glob.glob(os.path.join(data_dir, 'evals', 'open_questions_lesson_*_input.json'))):
+        lesson_id = os.path.basename(path).split('_')[3]
+        with open(os.path.join(data_dir, f'lesson{lesson_id}.txt')) as f:
+            lesson_doc = f.read()
+        with open(path) as f:
+            cohort = json.load(f)
+        for student_id, questions in cohort.items():
+            concepts = sorted({c for q in questions for c in q['concepts_evaluated']})
+            states[f"lesson_{lesson_id}/{student_id}"] = dict(
+                user_input={'open_questions': questions},
+                concepts_to_evaluate=concepts,
+                blooms_state='understand',
+                lesson_doc=lesson_doc,
+                reflection_steps=reflection_steps,
+                messages=[],
+            )
+    return states
+
+
+def load_cohort_csv(path: str = os.path.join('data', 'evaluator_questions_benchmark_12_2024.csv'),
+                    data_dir: str = 'data', reflection_steps: int = 0) -> dict:
+    """The benchmark CSV as {"lesson_<n>/<student_id>": exec_state}, like load_cohort."""
+    import ast
+    import pandas as pd
+
+    frame = pd.read_csv(path)
+    frame['id'] = frame.index
+    frame['concepts_evaluated'] = frame['concepts'].map(ast.literal_eval)
+    lessons = {}
+    states = {}
+    for (lesson, student_id), rows in frame.groupby(['lesson_id', 'student_id'], sort=False):
+        lesson_id = lesson.split('_')[1]
+        if lesson_id not in lessons:
+            with open(os.path.join(data_dir, f'lesson{lesson_id}.txt')) as f:
+                lessons[lesson_id] = f.read()
+        questions = rows[['id', 'question', 'student_answer', 'concepts_evaluated']].to_dict('records')
+        states[f"lesson_{lesson_id}/{student_id}"] = dict(
+            user_input={'open_questions': questions},
+            concepts_to_evaluate=sorted({c for q in questions for c in q['concepts_evaluated']}),
+            blooms_state='understand',
+            lesson_doc=lessons[lesson_id],
+            reflection_steps=reflection_steps,
+            messages=[],
+        )
+    return states
+
+
+class UsageCallback(BaseCallbackHandler):
+    """Counts chat model calls and the prompt/completion tokens they report."""
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    def on_llm_end(self, response, **kwargs):
+        with self._lock:
+            for generations in response.generations:
+                for generation in generations:
+                    usage = getattr(getattr(generation, 'message', None), 'usage_metadata', None) or {}
+                    self.calls += 1
+                    self.prompt_tokens += usage.get('input_tokens', 0)
+                    self.completion_tokens += usage.get('output_tokens', 0)
+
+
+def run_config(callbacks=None, recursion_limit: int = 10) -> dict:
+    return {
+        "configurable": {"thread_id": str(uuid.uuid4())},
+        "recursion_limit": recursion_limit,
+        "callbacks": callbacks or [],
+    }
+
+
+def use_offline_embeddings(cache_dir: str, latency: float = 0.0):
+    """Send the RAG tools' embedding misses to FakeEmbeddings, with caches under cache_dir."""
+    from agent import tools
+    from agent.embeddings import EmbeddingCache
+    from agent.fakes import FakeEmbeddings
+
+    tools.embeddings.underlying = FakeEmbeddings(latency=latency)
+    tools.embeddings.cache = EmbeddingCache(os.path.join(cache_dir, 'embeddings'))
+    tools.VECTOR_STORE_DIR = os.path.join(cache_dir, 'vector_stores')
+    tools.vector_stores.clear()
+    tools.retrievers.clear()
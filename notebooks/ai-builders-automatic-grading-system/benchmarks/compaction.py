@@ -0,0 +1,86 @@
+"""Prompt tokens per student with and without message-history compaction.
+
+    python -m benchmarks.compaction --rounds 1 2 3 4 --students 20
+    python -m benchmarks.compaction --ceiling 3000
+
+basic_rag is run with the fake evaluator doing 1..N query_lesson rounds (the
+fake RAG answers quote --reply-chars of their context, as real answers do), the
+reflection graph with the LLM supervisor. "history" counts the prompt tokens of
+the nodes that resend the message history (call_evaluator, supervisor); grades
+of the compacted runs are compared with the uncompacted ones.
+"""
+import argparse
+import tempfile
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from agent import compaction, graphs
+from agent.fakes import FakeChatModel
+from agent.metrics import invoke_with_metrics
+from agent.models import set_chat_model_factory
+from benchmarks.common import load_cohort, run_config, use_offline_embeddings
+
+
+class HistoryTokens(BaseCallbackHandler):
+    """Prompt tokens of the model calls made by the history-resending nodes."""
+
+    NODES = ('call_evaluator', 'supervisor')
+
+    def __init__(self):
+        self.tokens = 0
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        if (metadata or {}).get('langgraph_node') in self.NODES:
+            self.tokens += sum(compaction.history_tokens(batch) for batch in messages)
+
+
+def run(graph, states) -> dict:
+    totals = {'prompt_tokens': 0, 'llm_calls': 0, 'compacted_tokens': 0}
+    history = HistoryTokens()
+    grades = []
+    for exec_state in states:
+        final_state, metrics = invoke_with_metrics(graph, exec_state, run_config([history], recursion_limit=25))
+        for name in totals:
+            totals[name] += metrics.counters[name]
+        grades.append([q['score'] for q in final_state['current_knowledge_state']['evaluated_questions']])
+    totals['history_tokens'] = history.tokens
+    return {**{name: value / len(states) for name, value in totals.items()}, 'grades': grades}
+
+
+def report(label: str, full: dict, compacted: dict):
+    def saved(name):
+        return 1 - compacted[name] / full[name] if full[name] else 0.0
+    same = sum(a == b for a, b in zip(full['grades'], compacted['grades'])) / len(full['grades'])
+    print(f"{label:>34}: prompt tokens/student {full['prompt_tokens']:7.0f} -> {compacted['prompt_tokens']:7.0f} "
+          f"({saved('prompt_tokens'):5.1%} saved), history {full['history_tokens']:7.0f} -> "
+          f"{compacted['history_tokens']:7.0f} ({saved('history_tokens'):5.1%} saved)  "
+          f"{compacted['llm_calls']:.1f} LLM calls  same grades {same:.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, nargs='*', default=[1, 2, 3, 4], help="query_lesson rounds per evaluation")
+    parser.add_argument('--students', type=int, default=20)
+    parser.add_argument('--ceiling', type=int, default=0, help="per-call token ceiling of the compacted runs")
+    parser.add_argument('--reply-chars', type=int, default=800, help="length of the fake RAG answers")
+    args = parser.parse_args()
+
+    states = list(load_cohort().values())[:args.students]
+    with tempfile.TemporaryDirectory() as tmp:
+        use_offline_embeddings(tmp)
+        for rounds in args.rounds:
+            set_chat_model_factory(lambda model: FakeChatModel(
+                model_name=model, tool_rounds=rounds, reply_chars=args.reply_chars))
+            compaction.MESSAGE_TOKEN_CEILING = 0
+            full = run(graphs.basic_rag_graph(checkpointer="none", compaction=False), states)
+            compaction.MESSAGE_TOKEN_CEILING = args.ceiling
+            report(f"basic_rag, {rounds} tool round(s)", full, run(graphs.basic_rag_graph(checkpointer="none"), states))
+
+        set_chat_model_factory(lambda model: FakeChatModel(model_name=model))
+        compaction.MESSAGE_TOKEN_CEILING = 0
+        full = run(graphs.one_shot_with_reflection_graph(checkpointer="none", compaction=False), states)
+        compaction.MESSAGE_TOKEN_CEILING = args.ceiling
+        report("one_shot_with_reflection", full, run(graphs.one_shot_with_reflection_graph(checkpointer="none"), states))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+"""RAG context size per query: packed paragraphs vs the old 5 000/1 500 character chunks.
+
+    python -m benchmarks.context_packing --budget 600 --retriever bm25
+"""
+import argparse
+import statistics
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from agent import tools
+from agent.context import CONTEXT_TOKEN_BUDGET, count_tokens, format_paragraphs
+from benchmarks.retrieval import lessons
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--budget', type=int, default=CONTEXT_TOKEN_BUDGET)
+    parser.add_argument('--retriever', choices=tools.RETRIEVERS, default='bm25')
+    args = parser.parse_args()
+
+    #The chunking create_load_vector_store used before paragraphs: every query got one of these.
+    splitter = RecursiveCharacterTextSplitter(chunk_size=5_000, chunk_overlap=1_500)
+    for lesson_doc, queries in lessons().items():
+        old = [count_tokens(chunk) for chunk in splitter.split_text(lesson_doc)]
+        retriever = tools.get_retriever(lesson_doc, args.retriever)
+        packed = [tools.retrieve_result(query, retriever, args.budget) for query in queries]
+        sizes = [count_tokens(format_paragraphs(paragraphs)) for paragraphs in packed]
+        exact = all(lesson_doc[p.metadata['start_index']:].startswith(p.page_content) for ps in packed for p in ps)
+        print(f"{lesson_doc.splitlines()[0][:60]}\n"
+              f"  old chunks: {len(old)} chunks, {statistics.mean(old):6.0f} tokens of context per query\n"
+              f"  packed:     {statistics.mean(len(p) for p in packed):.1f} paragraphs, "
+              f"{statistics.mean(sizes):6.0f} tokens per query (max {max(sizes)}), exact spans: {exact}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""Offline throughput and accuracy benchmark of the grading graphs.
+
+    python -m benchmarks.harness --latency 0.2 --jitter 0.1 --failure-rate 0.02 --concurrency 8
+    python -m benchmarks.harness --graph one_shot --source csv --single-pass --history benchmarks/history.jsonl
+    python -m benchmarks.harness --results-dir results/  # rerun to resume
+
+Every graph replays the cohort (data/evals or the benchmark CSV) through
+grade_cohort with FakeChatModel/FakeEmbeddings, in its own process so peak RSS
+is per graph. Grades are scored against the ground truth with
+benchmarks.scoring; with the fake model they measure the pipeline (coverage,
+parse failures), not grading quality.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+GRAPHS = ('one_shot', 'basic_rag', 'one_shot_with_reflection')
+
+
+def _graph_factory(name: str, checkpointer: str, single_pass: bool):
+    from agent import graphs
+    factory = getattr(graphs, f"{name}_graph")
+    return lambda: factory(checkpointer=checkpointer, single_pass=single_pass)
+
+
+def run_graph(name: str, options: dict) -> dict:
+    """Grade the cohort with one graph; runs in a fresh process."""
+    from agent.batch import run_cohort
+    from agent.fakes import FakeChatModel
+    from agent.metrics import CohortMetrics
+    from agent.models import set_chat_model_factory
+    from agent.results import ResultsSink
+    from benchmarks.common import load_cohort, load_cohort_csv, use_offline_embeddings
+    from benchmarks.scoring import ground_truth, predictions, score
+
+    set_chat_model_factory(lambda model: FakeChatModel(
+        model_name=model, latency=options['latency'], jitter=options['jitter'],
+        failure_rate=options['failure_rate'], seed=options['seed'],
+    ))
+    states = load_cohort_csv() if options['source'] == 'csv' else load_cohort()
+    if options['students']:
+        states = dict(list(states.items())[:options['students']])
+
+    metrics = CohortMetrics()
+    sink = ResultsSink(os.path.join(options['results_dir'], f"{name}.jsonl")) if options['results_dir'] else None
+    with tempfile.TemporaryDirectory() as tmp:
+        use_offline_embeddings(tmp, latency=options['embed_latency'])
+        results = run_cohort(
+            states, _graph_factory(name, options['checkpointer'], options['single_pass']),
+            concurrency=options['concurrency'], max_retries=options['max_retries'],
+            base_delay=options['retry_delay'], metrics=metrics, sink=sink,
+        )
+    summary = metrics.summary()
+    truth = ground_truth(source=options['source'])
+    graded = truth['lesson'] + '/' + truth['student_id']
+    quality = score(predictions(results), truth[graded.isin(list(states))])
+    count = len(states)
+    return {
+        'graph': name,
+        'students': count,
+        'failed': sum(1 for r in results.values() if isinstance(r, dict) and 'ERROR' in r),
+        'elapsed_s': summary['elapsed'],
+        'students_per_s': summary['students_per_second'],
+        'latency_s': summary['wall_time'],
+        'queue_s': summary['queue_time'],
+        'llm_calls_per_student': summary['per_student']['llm_calls'],
+        'prompt_tokens_per_student': summary['per_student']['prompt_tokens'],
+        'completion_tokens_per_student': summary['per_student']['completion_tokens'],
+        'errors': summary['errors'],
+        #ru_maxrss is in KiB on Linux.
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        **{key: value for key, value in quality.items() if key != 'confusion'},
+    }
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--graph', choices=GRAPHS, nargs='*', default=list(GRAPHS))
+    parser.add_argument('--source', choices=('evals', 'csv'), default='evals')
+    parser.add_argument('--students', type=int, default=0, help="0 = the whole cohort")
+    parser.add_argument('--latency', type=float, default=0.2, help="fake chat model latency per call (s)")
+    parser.add_argument('--jitter', type=float, default=0.0, help="extra uniform random latency (s)")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="share of chat calls failing with a 503")
+    parser.add_argument('--embed-latency', type=float, default=0.05, help="fake embedding latency per request (s)")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--max-retries', type=int, default=3)
+    parser.add_argument('--retry-delay', type=float, default=0.1)
+    parser.add_argument('--checkpointer', choices=('memory', 'sqlite', 'none'), default='none')
+    parser.add_argument('--single-pass', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--history', help="append the results as JSON lines to this file")
+    parser.add_argument('--results-dir', help="write each graph's grades to <dir>/<graph>.jsonl and resume from it")
+    args = parser.parse_args()
+
+    options = {key: value for key, value in vars(args).items() if key not in ('graph', 'history')}
+    context = multiprocessing.get_context('spawn')
+    rows = []
+    for name in args.graph:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            row = pool.submit(run_graph, name, options).result()
+        rows.append(row)
+        latency = row['latency_s']
+        print(f"{name:>26}: {row['students_per_s']:6.2f} students/s  "
+              f"p50 {latency['p50']:6.2f}s  p95 {latency['p95']:6.2f}s  p99 {latency['p99']:6.2f}s  "
+              f"{row['llm_calls_per_student']:4.1f} LLM calls/student  peak RSS {row['peak_rss_mb']:6.1f} MB  "
+              f"failed {row['failed']}  accuracy {row['accuracy']:6.1%}  MAE {row['mae']:.2f}  "
+              f"coverage {row['coverage']:6.1%}")
+
+    if args.history:
+        directory = os.path.dirname(args.history)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        stamp = time.strftime('%Y-%m-%dT%H:%M:%S')
+        revision = _git_revision()
+        with open(args.history, 'a') as f:
+            for row in rows:
+                f.write(json.dumps({'time': stamp, 'revision': revision, 'options': options, **row}) + '\n')
+
+if __name__ == '__main__':
+    main()
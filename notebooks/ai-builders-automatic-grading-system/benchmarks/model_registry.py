@@ -0,0 +1,68 @@
+"""Per-call latency and socket count: fresh ChatOpenAI per node call vs the shared registry.
+
+    python -m benchmarks.model_registry --calls 400 --threads 16
+"""
+import argparse
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_openai import ChatOpenAI
+
+from agent.models import ModelRegistry
+from agent.state import SingleQuestionDeck
+from benchmarks.stub_server import StubOpenAIServer
+
+MESSAGES = [
+    SystemMessage(content="Format the evaluation."),
+    HumanMessage(content='Message to format: {"evaluated_questions": []}'),
+]
+
+
+def run(get_model, calls: int, threads: int) -> list:
+    def one(_):
+        start = time.perf_counter()
+        get_model().invoke(MESSAGES)
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(threads) as pool:
+        return list(pool.map(one, range(calls)))
+
+
+def report(name: str, latencies: list, server: StubOpenAIServer, wall: float):
+    latencies = sorted(latencies)
+    print(f"{name:>10}: wall {wall:6.2f}s  mean {statistics.mean(latencies) * 1000:7.2f}ms  "
+          f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:7.2f}ms  "
+          f"connections {server.connections:5d}  requests {server.requests}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--calls', type=int, default=400)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--latency', type=float, default=0.0, help="stub server latency in seconds")
+    args = parser.parse_args()
+    os.environ.setdefault('OPENAI_API_KEY', 'stub')
+
+    with StubOpenAIServer(latency=args.latency) as server:
+        def fresh():
+            #What every node did before: new client, new structured-output wrapper.
+            model = ChatOpenAI(model="gpt-4o-mini", base_url=server.base_url, api_key="stub")
+            return model.with_structured_output(SingleQuestionDeck)
+
+        start = time.perf_counter()
+        latencies = run(fresh, args.calls, args.threads)
+        report('fresh', latencies, server, time.perf_counter() - start)
+
+    with StubOpenAIServer(latency=args.latency) as server:
+        registry = ModelRegistry(base_url=server.base_url)
+        start = time.perf_counter()
+        latencies = run(lambda: registry.get("gpt-4o-mini", schema=SingleQuestionDeck), args.calls, args.threads)
+        report('registry', latencies, server, time.perf_counter() - start)
+        registry.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Resumable JSONL results vs the notebook's save-at-the-end JSON.
+
+    python -m benchmarks.results_sink --students 20 --copies 500
+
+1. Resume: grade half the cohort into a ResultsSink (the run "crashes"), then
+   rerun the whole cohort with the same sink and count the LLM calls.
+2. Analysis: load N copies of the cohort's grades and join them with the
+   ground truth, from one JSON dict (the notebook's format_dict_to_dataframe
+   row loop) and from the JSONL file (results_frame, selected columns).
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+from agent import graphs
+from agent.batch import run_cohort
+from agent.fakes import FakeChatModel
+from agent.metrics import CohortMetrics
+from agent.models import set_chat_model_factory
+from agent.results import ResultsSink, results_frame
+from benchmarks.common import load_cohort
+from benchmarks.scoring import ground_truth, graded_points, score
+
+
+def grade(states, sink) -> int:
+    metrics = CohortMetrics()
+    run_cohort(states, lambda: graphs.one_shot_graph(checkpointer="none", single_pass=True), metrics=metrics, sink=sink)
+    return metrics.summary()['llm_calls']
+
+
+def notebook_frame(results: dict) -> pd.DataFrame:
+    #format_dict_to_dataframe of experiments.ipynb, with the keys split like the harness does.
+    records = []
+    for key, state in results.items():
+        student_lesson, _, student_id = key.rpartition('/')
+        for question in state['evaluated_questions']:
+            record = question.copy()
+            record['lesson'] = student_lesson
+            record['student_id'] = student_id
+            records.append(record)
+    return pd.DataFrame(records)
+
+
+def measure(load):
+    tracemalloc.start()
+    start = time.perf_counter()
+    frame = load()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak / 2 ** 20, frame
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=20)
+    parser.add_argument('--copies', type=int, default=500, help="cohort copies in the analysis files")
+    args = parser.parse_args()
+
+    set_chat_model_factory(lambda model: FakeChatModel(model_name=model))
+    states = dict(list(load_cohort().items())[:args.students])
+    truth = ground_truth()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'grades.jsonl')
+        full = grade(states, None)
+        half = grade(dict(list(states.items())[:len(states) // 2]), ResultsSink(path))
+        resumed = grade(states, ResultsSink(path))
+        print(f"resume: uninterrupted run {full} LLM calls; interrupted at half {half} + resumed {resumed} "
+              f"= {half + resumed} LLM calls")
+
+        #Analysis files: every copy keeps the real lesson/student key, so the join is over real answers.
+        results = ResultsSink(path).load(states)
+        json_path, big_path = os.path.join(tmp, 'grades.json'), os.path.join(tmp, 'big.jsonl')
+        copies = {f"{key}#{i}": result for i in range(args.copies) for key, result in results.items()}
+        with open(json_path, 'w') as f:
+            json.dump(copies, f)
+        sink = ResultsSink(big_path)
+        for key, result in copies.items():
+            sink.write(key, result)
+        del copies
+        truth = truth.assign(student_id=truth['student_id'].astype(str))
+
+        def from_json():
+            with open(json_path) as f:
+                return notebook_frame(json.load(f))
+
+        def from_jsonl():
+            return results_frame(big_path, columns=['lesson', 'student_id', 'question', 'score'])
+
+        for label, load in (('notebook JSON', from_json), ('JSONL columns', from_jsonl)):
+            elapsed, peak, frame = measure(load)
+            start = time.perf_counter()
+            frame['student_id'] = frame['student_id'].str.split('#').str[0]
+            metrics = score(graded_points(frame), truth)
+            joined = time.perf_counter() - start
+            print(f"{label:>14}: {len(results) * args.copies} students loaded in {elapsed:6.2f}s "
+                  f"(peak {peak:7.1f} MiB), joined in {joined:6.2f}s, accuracy {metrics['accuracy']:.1%}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Retrieval latency and top-1 agreement of the bm25/hybrid retrievers against the FAISS path.
+
+    python -m benchmarks.retrieval --embed-latency 0.15
+    python -m benchmarks.retrieval --live      # real OpenAI embeddings, needs OPENAI_API_KEY
+
+Queries are the distinct questions and concepts of data/evals. A hit agrees
+when the retriever's best paragraph overlaps the best FAISS chunk. Offline
+embeddings are hash-based, so agreement is only meaningful with --live.
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from agent import tools
+from agent.embeddings import EmbeddingCache
+from benchmarks.common import use_offline_embeddings
+
+
+def lessons(data_dir: str = 'data') -> dict:
+    """{lesson_doc: [query, ...]} for every lesson with an eval file."""
+    queries = {}
+    for path in sorted(glob.glob(os.path.join(data_dir, 'evals', 'open_questions_lesson_*_input.json'))):
+        lesson_id = os.path.basename(path).split('_')[3]
+        with open(os.path.join(data_dir, f'lesson{lesson_id}.txt')) as f:
+            lesson_doc = f.read()
+        with open(path) as f:
+            cohort = json.load(f)
+        texts = [q['question'] for questions in cohort.values() for q in questions]
+        texts += [c.replace('_', ' ') for questions in cohort.values() for q in questions for c in q['concepts_evaluated']]
+        queries[lesson_doc] = list(dict.fromkeys(texts))
+    return queries
+
+
+def span(doc):
+    start = doc.metadata['start_index']
+    return start, start + len(doc.page_content)
+
+
+def overlaps(a, b) -> bool:
+    return span(a)[0] < span(b)[1] and span(b)[0] < span(a)[1]
+
+
+def measure(kind: str, lesson_doc: str, queries: list, cache_dir: str) -> dict:
+    #A fresh embedding cache per retriever, so hybrid does not reuse the query vectors of dense.
+    tools.embeddings.cache = EmbeddingCache(os.path.join(cache_dir, kind))
+    tools.retrievers.clear()
+    start = time.perf_counter()
+    retriever = tools.get_retriever(lesson_doc, kind)
+    build = time.perf_counter() - start
+
+    #One query at a time, like query_lesson; every query is a cache miss the first time.
+    latencies, hits = [], []
+    for query in queries:
+        start = time.perf_counter()
+        hits.append(retriever.search(query, k=1)[0])
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    retriever.search_many(queries, k=1)
+    batch = time.perf_counter() - start
+    return {'build_s': build, 'latencies': latencies, 'batch_s': batch, 'hits': hits}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--retriever', choices=tools.RETRIEVERS, nargs='*', default=list(tools.RETRIEVERS))
+    parser.add_argument('--embed-latency', type=float, default=0.15, help="fake embedding round trip (s)")
+    parser.add_argument('--live', action='store_true', help="use OpenAI embeddings instead of the fake ones")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if not args.live:
+            use_offline_embeddings(tmp, latency=args.embed_latency)
+        kinds = ['dense'] + [kind for kind in args.retriever if kind != 'dense']
+        for lesson_doc, queries in lessons().items():
+            print(f"{lesson_doc.splitlines()[0][:60]} ({len(lesson_doc)} chars, {len(queries)} queries)")
+            results = {kind: measure(kind, lesson_doc, queries, tmp) for kind in kinds}
+            for kind in kinds:
+                result = results[kind]
+                latencies = sorted(result['latencies'])
+                agreement = statistics.mean(
+                    overlaps(hit, dense_hit) for hit, dense_hit in zip(result['hits'], results['dense']['hits'])
+                )
+                print(f"{kind:>8}: build {result['build_s'] * 1000:8.1f} ms  "
+                      f"query p50 {latencies[len(latencies) // 2] * 1000:7.3f} ms  "
+                      f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:7.3f} ms  "
+                      f"batch {result['batch_s'] * 1000:6.2f} ms  "
+                      f"top-1 agreement with dense {agreement:.0%}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""Vectorized scoring of letter grades against the ground truth.
+
+    python -m benchmarks.scoring data/one_shot_final_responses.json data/graph_rag_final_responses.json
+
+Result files are {student_id: {"evaluated_questions": [...]}} (lesson 1 by
+default, see --lesson) or {"lesson_<n>/<student_id>": ...} as produced by the
+harness, or JSONL/Parquet files written by agent.results.
+"""
+import argparse
+import glob
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from agent.results import results_frame
+
+GRADE_POINTS = {'A': 5.0, 'B': 4.0, 'C': 3.0, 'D': 2.0, 'E': 1.0, 'F': 0.0}
+KEYS = ['lesson', 'student_id', 'question_key']
+
+
+def _question_key(questions: pd.Series) -> pd.Series:
+    return questions.astype(str).str.split().str.join(' ').str.casefold()
+
+
+def ground_truth(data_dir: str = 'data', source: str = 'evals') -> pd.DataFrame:
+    """One row per graded answer: lesson, student_id, question, y_true (0-5)."""
+    if source == 'csv':
+        frame = pd.read_csv(os.path.join(data_dir, 'evaluator_questions_benchmark_12_2024.csv'))
+        frame = frame.rename(columns={'lesson_id': 'lesson', 'score_number': 'y_true'})
+    else:
+        records = []
+        for path in sorted(glob.glob(os.path.join(data_dir, 'evals', 'open_questions_lesson_*_ground_truth.json'))):
+            lesson = f"lesson_{os.path.basename(path).split('_')[3]}"
+            with open(path) as f:
+                for student_id, questions in json.load(f).items():
+                    records += [
+                        {'lesson': lesson, 'student_id': student_id, 'question': q['question'], 'y_true': q['ground_truth_score']}
+                        for q in questions
+                    ]
+        frame = pd.DataFrame.from_records(records)
+    frame['question_key'] = _question_key(frame['question'])
+    return frame[['lesson', 'student_id', 'question', 'question_key', 'y_true']]
+
+
+def predictions(results: dict, lesson: str = 'lesson_1') -> pd.DataFrame:
+    """Flatten {student: knowledge_state} into lesson, student_id, question, score, y_pred.
+
+    Keys may be "lesson_<n>/<student_id>"; failed students ({"ERROR": ...}) have no rows.
+    """
+    records = []
+    for key, state in results.items():
+        student_lesson, _, student_id = key.rpartition('/')
+        for item in (state or {}).get('evaluated_questions', []) if isinstance(state, dict) else []:
+            records.append({
+                'lesson': student_lesson or lesson,
+                'student_id': student_id,
+                'question': item.get('question', ''),
+                'score': item.get('score', ''),
+            })
+    return graded_points(pd.DataFrame.from_records(records, columns=['lesson', 'student_id', 'question', 'score']))
+
+
+def graded_points(frame: pd.DataFrame) -> pd.DataFrame:
+    """Add question_key and y_pred to a frame of lesson, student_id, question, score rows."""
+    frame = frame.copy()
+    frame['question_key'] = _question_key(frame['question'])
+    frame['y_pred'] = frame['score'].astype(str).str.strip().str.upper().map(GRADE_POINTS)
+    #A question graded twice keeps its last grade, like the notebook merge.
+    return frame.drop_duplicates(KEYS, keep='last')
+
+
+def load_predictions(path: str, lesson: str = 'lesson_1') -> pd.DataFrame:
+    """predictions() of a results file: notebook JSON, or a JSONL/Parquet file of agent.results."""
+    if path.endswith(('.jsonl', '.parquet')):
+        return graded_points(results_frame(path, columns=['lesson', 'student_id', 'question', 'score'], lesson=lesson))
+    with open(path) as f:
+        return predictions(json.load(f), lesson=lesson)
+
+
+def score(predicted: pd.DataFrame, truth: pd.DataFrame) -> dict:
+    """Accuracy and error metrics of the predicted grades over the ground-truth rows.
+
+    Ground-truth answers without a (valid) prediction count against coverage
+    and are left out of the error metrics.
+    """
+    merged = truth.merge(predicted[KEYS + ['y_pred']], on=KEYS, how='left')
+    graded = merged['y_pred'].notna().to_numpy()
+    y_true = merged['y_true'].to_numpy(dtype=float)[graded]
+    y_pred = merged['y_pred'].to_numpy(dtype=float)[graded]
+    error = y_pred - y_true
+    confusion = pd.crosstab(
+        pd.Series(y_true, name='true'), pd.Series(y_pred, name='pred')
+    ) if graded.any() else pd.DataFrame()
+    return {
+        'answers': int(len(merged)),
+        'coverage': float(graded.mean()) if len(merged) else 0.0,
+        'accuracy': float(np.mean(error == 0)) if graded.any() else 0.0,
+        'within_one': float(np.mean(np.abs(error) <= 1)) if graded.any() else 0.0,
+        'mae': float(np.mean(np.abs(error))) if graded.any() else 0.0,
+        'rmse': float(np.sqrt(np.mean(error ** 2))) if graded.any() else 0.0,
+        'bias': float(np.mean(error)) if graded.any() else 0.0,
+        'confusion': {str(t): {str(p): int(n) for p, n in row.items()} for t, row in confusion.iterrows()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('results', nargs='+', help="graph output JSON, JSONL or Parquet files")
+    parser.add_argument('--lesson', default='lesson_1', help="lesson of files keyed by bare student ids")
+    parser.add_argument('--source', choices=('evals', 'csv'), default='evals')
+    args = parser.parse_args()
+
+    truth = ground_truth(source=args.source)
+    for path in args.results:
+        predicted = load_predictions(path, lesson=args.lesson)
+        lessons = set(predicted['lesson'])
+        metrics = score(predicted, truth[truth['lesson'].isin(lessons)])
+        print(f"{os.path.basename(path):>45}: accuracy {metrics['accuracy']:6.1%}  within one {metrics['within_one']:6.1%}  "
+              f"MAE {metrics['mae']:.2f}  RMSE {metrics['rmse']:.2f}  bias {metrics['bias']:+.2f}  "
+              f"coverage {metrics['coverage']:6.1%}")
+
+if __name__ == '__main__':
+    main()
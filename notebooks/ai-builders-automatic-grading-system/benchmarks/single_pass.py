@@ -0,0 +1,61 @@
+"""Single-pass (local JSON parse) vs formatter-LLM graphs: latency, LLM calls and tokens.
+
+    python -m benchmarks.single_pass --latency 0.2 --students 20
+"""
+import argparse
+import statistics
+import tempfile
+import time
+
+from agent import graphs, nodes
+from agent.fakes import FakeChatModel
+from agent.models import set_chat_model_factory
+from benchmarks.common import UsageCallback, load_cohort, run_config, use_offline_embeddings
+
+GRAPHS = {
+    'one_shot': graphs.one_shot_graph,
+    'basic_rag': graphs.basic_rag_graph,
+    'one_shot_with_reflection': graphs.one_shot_with_reflection_graph,
+}
+
+
+def run(graph_factory, states, single_pass: bool) -> dict:
+    graph = graph_factory(checkpointer="none", single_pass=single_pass)
+    usage = UsageCallback()
+    latencies = []
+    for exec_state in states:
+        start = time.perf_counter()
+        graph.invoke(exec_state, run_config([usage]))
+        latencies.append(time.perf_counter() - start)
+    return {
+        'mean_s': statistics.mean(latencies),
+        'calls': usage.calls / len(states),
+        'prompt_tokens': usage.prompt_tokens / len(states),
+        'completion_tokens': usage.completion_tokens / len(states),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--graph', choices=GRAPHS, nargs='*', default=['one_shot', 'basic_rag'])
+    parser.add_argument('--latency', type=float, default=0.2, help="fake model latency per call (s)")
+    parser.add_argument('--students', type=int, default=20)
+    args = parser.parse_args()
+
+    set_chat_model_factory(lambda model: FakeChatModel(model_name=model, latency=args.latency))
+    states = list(load_cohort().values())[:args.students]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        use_offline_embeddings(tmp)
+        for name in args.graph:
+            for single_pass in (False, True):
+                nodes.single_pass_stats.update(parsed=0, fallback=0)
+                result = run(GRAPHS[name], states, single_pass)
+                label = f"{name}{' single_pass' if single_pass else ''}"
+                extra = f"  fallback rate {nodes.single_pass_report()['fallback_rate']:.0%}" if single_pass else ''
+                print(f"{label:>36}: {result['mean_s'] * 1000:7.1f} ms/student  "
+                      f"{result['calls']:.1f} LLM calls  {result['prompt_tokens']:7.0f} prompt + "
+                      f"{result['completion_tokens']:6.0f} completion tokens{extra}")
+
+if __name__ == '__main__':
+    main()
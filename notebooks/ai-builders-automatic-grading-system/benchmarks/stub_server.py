@@ -0,0 +1,110 @@
+"""Local OpenAI-compatible HTTP stub for benchmarks.
+
+Chat completions are answered by FakeChatModel, so the grading graphs run end
+to end against it; embeddings are deterministic hash vectors. Point a client at
+`server.base_url` (e.g. ChatOpenAI(base_url=...)) to use it.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from langchain_openai.chat_models.base import _convert_dict_to_message, _convert_message_to_dict
+
+from agent.fakes import FakeChatModel, FakeEmbeddings
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    #Headers and body are separate writes; with Nagle on, keep-alive replies wait ~40 ms for a delayed ACK.
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, payload: dict):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        server = self.server
+        server.count_request()
+        if server.latency:
+            time.sleep(server.latency)
+
+        if self.path.endswith('/embeddings'):
+            inputs = request['input'] if isinstance(request['input'], list) else [request['input']]
+            self._send({
+                'object': 'list',
+                'model': request.get('model'),
+                'data': [{'object': 'embedding', 'index': i, 'embedding': server.embeddings.embed_query(str(text))}
+                         for i, text in enumerate(inputs)],
+                'usage': {'prompt_tokens': 1, 'total_tokens': 1},
+            })
+            return
+
+        messages = [_convert_dict_to_message(m) for m in request.get('messages', [])]
+        tools = request.get('tools')
+        tool_choice = request.get('tool_choice')
+        reply = server.model._respond(messages, tools, tool_choice)
+        usage = reply.usage_metadata or {}
+        self._send({
+            'id': f"chatcmpl-{server.requests}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request.get('model'),
+            'choices': [{'index': 0, 'message': _convert_message_to_dict(reply), 'finish_reason': 'stop'}],
+            'usage': {
+                'prompt_tokens': usage.get('input_tokens', 0),
+                'completion_tokens': usage.get('output_tokens', 0),
+                'total_tokens': usage.get('total_tokens', 0),
+            },
+        })
+
+
+class StubOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency: float = 0.0, port: int = 0):
+        super().__init__(('127.0.0.1', port), _Handler)
+        self.latency = latency
+        self.model = FakeChatModel()
+        self.embeddings = FakeEmbeddings()
+        self.connections = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def process_request(self, request, client_address):
+        #Called once per accepted TCP connection; keep-alive requests reuse it.
+        with self._lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,45 @@
+"""Reflection graph with the LLM supervisor vs local routing: latency, LLM calls, skipped supervisor calls.
+
+    python -m benchmarks.supervisor_routing --latency 0.2 --students 20
+"""
+import argparse
+import statistics
+
+from agent import graphs, nodes
+from agent.fakes import FakeChatModel
+from agent.metrics import invoke_with_metrics
+from agent.models import set_chat_model_factory
+from benchmarks.common import load_cohort, run_config
+
+
+def run(states, routing: str) -> dict:
+    graph = graphs.one_shot_with_reflection_graph(checkpointer="none", routing=routing)
+    runs = [invoke_with_metrics(graph, exec_state, run_config())[1].to_dict() for exec_state in states]
+    return {
+        'mean_s': statistics.mean(r['wall_time'] for r in runs),
+        'llm_calls': statistics.mean(r['llm_calls'] for r in runs),
+        'supervisor_llm_calls': statistics.mean(
+            r['nodes'].get('supervisor', {}).get('calls', 0) - r['supervisor_calls_skipped'] for r in runs
+        ),
+        'reflection_steps': statistics.mean(r['reflection_steps'] for r in runs),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--latency', type=float, default=0.2, help="fake model latency per call (s)")
+    parser.add_argument('--students', type=int, default=20)
+    args = parser.parse_args()
+
+    set_chat_model_factory(lambda model: FakeChatModel(model_name=model, latency=args.latency))
+    states = list(load_cohort().values())[:args.students]
+    for routing in graphs.ROUTING_MODES:
+        nodes.supervisor_stats.update(local=0, llm=0)
+        result = run(states, routing)
+        skipped = f"  supervisor calls skipped {nodes.supervisor_report()['skipped_rate']:.0%}" if routing == 'local' else ''
+        print(f"{routing:>6}: {result['mean_s'] * 1000:7.1f} ms/student  {result['llm_calls']:.1f} LLM calls "
+              f"({result['supervisor_llm_calls']:.1f} supervisor)  "
+              f"{result['reflection_steps']:.1f} reflection steps{skipped}")
+
+if __name__ == '__main__':
+    main()
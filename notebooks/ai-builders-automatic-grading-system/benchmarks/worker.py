@@ -0,0 +1,129 @@
+"""Cold start and per-request overhead: notebook-style grading vs the warm worker (agent.worker).
+
+    python -m benchmarks.worker --graph one_shot --students 20 --latency 0
+
+Both run in fresh processes against the local OpenAI stub (benchmarks.stub_server),
+so every model call goes over HTTP like in production, with the dense retriever
+swapped for BM25 (the stub has no tokenizer for OpenAIEmbeddings).
+
+- notebook: import agent.graphs, build the graph, execute_graph per student in a
+  loop, as the experiments notebook cells do;
+- worker: start `python -m agent.worker` until its ready line, then the same
+  students as JSON-line requests, one at a time and then all at once.
+
+With --latency 0 the request latencies are the per-request overhead.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import load_cohort
+from benchmarks.stub_server import StubOpenAIServer
+
+NOTEBOOK = """
+import json, sys, time
+start = time.perf_counter()
+from agent.graphs import *
+imported = time.perf_counter()
+graph = {graph}_graph()
+built = time.perf_counter()
+latencies = []
+for line in sys.stdin:
+    request = json.loads(line)
+    exec_state = dict(user_input={{'open_questions': request['open_questions']}},
+                      concepts_to_evaluate=sorted({{c for q in request['open_questions'] for c in q['concepts_evaluated']}}),
+                      blooms_state='understand', lesson_doc=open(f"data/lesson{{request['lesson']}}.txt").read(),
+                      reflection_steps=0, messages=[])
+    t = time.perf_counter()
+    execute_graph(exec_state, graph)
+    latencies.append(time.perf_counter() - t)
+print(json.dumps({{'import': imported - start, 'build': built - imported, 'latencies': latencies}}))
+"""
+
+
+def requests(graph: str, students: int) -> list:
+    return [
+        {'id': key, 'graph': graph, 'lesson': key.split('/')[0].split('_')[1],
+         'open_questions': state['user_input']['open_questions']}
+        for key, state in list(load_cohort().items())[:students]
+    ]
+
+
+def notebook(env, graph: str, batch: list) -> dict:
+    start = time.perf_counter()
+    done = subprocess.run(
+        [sys.executable, '-c', NOTEBOOK.format(graph=graph)], env=env, check=True, capture_output=True, text=True,
+        input=''.join(json.dumps(r) + '\n' for r in batch),
+    )
+    total = time.perf_counter() - start
+    result = json.loads(done.stdout.strip().splitlines()[-1])
+    #Cold start: process start to the first grade, as when a kernel is (re)started.
+    result['cold'] = total - sum(result['latencies'][1:])
+    result['throughput'] = len(batch) / sum(result['latencies'])
+    return result
+
+
+def worker(env, graph: str, batch: list, concurrency: int) -> dict:
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'agent.worker', '--graph', graph, '--concurrency', str(concurrency)],
+        env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, bufsize=1,
+    )
+    process.stdout.readline()
+    cold = time.perf_counter() - start
+
+    def send(lines):
+        for request in lines:
+            process.stdin.write(json.dumps(request) + '\n')
+        process.stdin.flush()
+        return [json.loads(process.stdout.readline()) for _ in lines]
+
+    latencies = []
+    for request in batch:
+        t = time.perf_counter()
+        response = send([request])[0]
+        assert 'error' not in response, response
+        latencies.append(time.perf_counter() - t)
+    t = time.perf_counter()
+    send(batch)
+    throughput = len(batch) / (time.perf_counter() - t)
+    process.stdin.close()
+    process.wait()
+    return {'cold': cold + latencies[0], 'ready': cold, 'latencies': latencies, 'throughput': throughput}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--graph', default='one_shot', choices=('one_shot', 'basic_rag', 'one_shot_with_reflection'))
+    parser.add_argument('--students', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.0, help="stub latency per model call (s)")
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+
+    batch = requests(args.graph, args.students)
+    with StubOpenAIServer(latency=args.latency) as server, tempfile.TemporaryDirectory() as tmp:
+        env = {
+            **os.environ, 'OPENAI_BASE_URL': server.base_url, 'OPENAI_API_KEY': 'stub', 'RETRIEVER': 'bm25',
+            'EMBEDDING_CACHE_DIR': os.path.join(tmp, 'embeddings'), 'VECTOR_STORE_DIR': os.path.join(tmp, 'indexes'),
+            'PYTHONWARNINGS': 'ignore',
+        }
+        server.requests = 0
+        nb = notebook(env, args.graph, batch)
+        calls = server.requests / len(batch)
+        wk = worker(env, args.graph, batch, args.concurrency)
+
+    print(f"{args.graph}: {calls:.1f} model calls of {args.latency * 1000:.0f} ms per student")
+    print(f"  notebook: cold start to first grade {nb['cold']:6.2f}s (import {nb['import']:.2f}s, "
+          f"build {nb['build'] * 1000:.1f} ms), first request {nb['latencies'][0] * 1000:6.1f} ms, "
+          f"median {statistics.median(nb['latencies'][1:]) * 1000:6.1f} ms  {nb['throughput']:6.1f} students/s")
+    print(f"    worker: cold start to first grade {wk['cold']:6.2f}s (ready after {wk['ready']:.2f}s), first request "
+          f"{wk['latencies'][0] * 1000:6.1f} ms, median {statistics.median(wk['latencies'][1:]) * 1000:6.1f} ms  "
+          f"{wk['throughput']:6.1f} students/s at concurrency {args.concurrency}")
+
+if __name__ == '__main__':
+    main()
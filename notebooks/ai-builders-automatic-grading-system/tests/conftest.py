@@ -0,0 +1,29 @@
+import os
+import sys
+
+import pytest
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(PROJECT_DIR, 'data')
+sys.path.insert(0, PROJECT_DIR)
+
+from agent.fakes import FakeChatModel
+from agent.models import set_chat_model_factory
+
+
+@pytest.fixture
+def fake_models():
+    """Route every chat model through FakeChatModel; yields the models created, to count their calls."""
+    created = []
+
+    def factory(model):
+        created.append(FakeChatModel(model_name=model))
+        return created[-1]
+
+    set_chat_model_factory(factory)
+    yield created
+    set_chat_model_factory(None)
+
+
+def upstream_calls(models) -> int:
+    return sum(model.calls for model in models)
@@ -0,0 +1,142 @@
+import asyncio
+import threading
+import time
+
+from agent import graphs
+from agent.batch import RateLimiter, TokenBucket, is_transient, run_cohort
+from agent.fakes import FakeChatModel, FakeTransientError
+from agent.models import set_chat_model_factory
+from benchmarks.common import load_cohort
+from conftest import DATA_DIR, upstream_calls
+
+
+def one_shot():
+    return graphs.one_shot_graph(checkpointer="none", single_pass=True)
+
+
+class FlakyGraph:
+    """Graph stand-in failing the first `failures` invocations of each student with `error`."""
+
+    def __init__(self, error, failures=1):
+        self.error = error
+        self.failures = failures
+        self.attempts = {}
+        self._lock = threading.Lock()
+
+    def invoke(self, exec_state, config):
+        student = exec_state['student']
+        with self._lock:
+            self.attempts[student] = self.attempts.get(student, 0) + 1
+            attempt = self.attempts[student]
+        if attempt <= self.failures:
+            raise self.error
+        return {'current_knowledge_state': {'student': student}}
+
+
+class CountingGraph:
+    """Wraps a compiled graph and records the most invocations running at once."""
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.running = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def invoke(self, exec_state, config):
+        with self._lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        try:
+            return self.graph.invoke(exec_state, config)
+        finally:
+            with self._lock:
+                self.running -= 1
+
+
+def test_results_come_back_in_input_order():
+    #Jitter makes students finish out of order.
+    set_chat_model_factory(lambda model: FakeChatModel(model_name=model, latency=0.001, jitter=0.02, seed=3))
+    try:
+        students = dict(list(load_cohort(DATA_DIR).items())[:12])
+        results = run_cohort(students, one_shot, concurrency=6)
+    finally:
+        set_chat_model_factory(None)
+    assert list(results) == list(students)
+    for key, state in students.items():
+        graded = [q['question'] for q in results[key]['evaluated_questions']]
+        assert graded == [q['question'] for q in state['user_input']['open_questions']]
+
+
+def test_list_input_returns_a_list_in_order():
+    graph = FlakyGraph(RuntimeError(), failures=0)
+    results = run_cohort([{'student': i} for i in range(5)], lambda: graph)
+    assert results == [{'student': i} for i in range(5)]
+
+
+def test_transient_errors_are_retried():
+    graph = FlakyGraph(FakeTransientError("503"), failures=2)
+    results = run_cohort({'s1': {'student': 's1'}}, lambda: graph, base_delay=0.001)
+    assert results == {'s1': {'student': 's1'}}
+    assert graph.attempts['s1'] == 3
+
+
+def test_non_transient_failure_becomes_error_result():
+    graph = FlakyGraph(ValueError("bad answer"))
+    results = run_cohort({'s1': {'student': 's1'}}, lambda: graph, base_delay=0.001)
+    assert results['s1'] == {'ERROR': repr(ValueError("bad answer"))}
+    assert graph.attempts['s1'] == 1
+
+
+def test_retries_running_out_becomes_error_result():
+    graph = FlakyGraph(FakeTransientError("503"), failures=10)
+    results = run_cohort({'s1': {'student': 's1'}}, lambda: graph, max_retries=2, base_delay=0.001)
+    assert 'ERROR' in results['s1']
+    assert graph.attempts['s1'] == 3
+
+
+def test_is_transient():
+    assert is_transient(FakeTransientError())
+    assert is_transient(TimeoutError())
+    assert not is_transient(ValueError())
+
+
+def test_concurrency_bound_holds():
+    set_chat_model_factory(lambda model: FakeChatModel(model_name=model, latency=0.01))
+    try:
+        graph = CountingGraph(one_shot())
+        students = dict(list(load_cohort(DATA_DIR).items())[:12])
+        results = run_cohort(students, lambda: graph, concurrency=3)
+    finally:
+        set_chat_model_factory(None)
+    assert not any('ERROR' in result for result in results.values())
+    assert 1 < graph.peak <= 3
+
+
+def test_rate_limiter_is_charged_per_model_call(monkeypatch, fake_models):
+    acquired = []
+    acquire = RateLimiter.acquire
+
+    async def counting(self, requests=1, tokens=0):
+        acquired.append((requests, tokens))
+        await acquire(self, requests, tokens)
+
+    monkeypatch.setattr(RateLimiter, 'acquire', counting)
+    students = dict(list(load_cohort(DATA_DIR).items())[:4])
+    results = run_cohort(students, lambda: graphs.basic_rag_graph(checkpointer="none", retriever="bm25"),
+                         requests_per_minute=10_000, tokens_per_minute=10_000_000)
+    assert not any('ERROR' in result for result in results.values())
+    #basic_rag makes a tool-call round and an evaluation per student, plus the parser.
+    assert len(acquired) == upstream_calls(fake_models) > len(students)
+    assert all(requests == 1 and tokens > 0 for requests, tokens in acquired)
+
+
+def test_token_bucket_waits_for_refill():
+    async def take(times):
+        bucket = TokenBucket(per_minute=1_200, capacity=1)
+        for _ in range(times):
+            await bucket.acquire()
+
+    start = time.perf_counter()
+    asyncio.run(take(4))
+    #The first request is free, the next three wait 50 ms each for a refill.
+    assert time.perf_counter() - start >= 0.14
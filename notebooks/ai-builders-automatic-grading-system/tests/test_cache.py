@@ -0,0 +1,82 @@
+import os
+import threading
+
+import pytest
+from langchain_core.load import dumps
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from agent import graphs
+from agent.batch import run_cohort
+from agent.cache import LRUCache, disable_llm_cache, enable_llm_cache, stable_prompt
+from benchmarks.common import load_cohort
+from conftest import DATA_DIR, upstream_calls
+
+
+def conversation(run):
+    return [
+        HumanMessage(content="Grade this", id=f"human-{run}"),
+        AIMessage(content="", id=f"run-{run}", tool_calls=[{'name': 'query_lesson', 'args': {'question': 'q'}, 'id': f"call_{run}"}]),
+        ToolMessage(content="lesson text", tool_call_id=f"call_{run}", id=f"tool-{run}"),
+    ]
+
+
+def test_stable_prompt_ignores_message_and_tool_call_ids():
+    assert stable_prompt(dumps(conversation(1))) == stable_prompt(dumps(conversation(2)))
+    changed = conversation(1)
+    changed[2] = ToolMessage(content="other text", tool_call_id="call_1")
+    assert stable_prompt(dumps(changed)) != stable_prompt(dumps(conversation(1)))
+
+
+def test_get_or_create_releases_key_lock_when_factory_fails():
+    cache = LRUCache()
+
+    def fail():
+        raise RuntimeError("build failed")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_create('key', fail)
+    assert cache._key_locks == {}
+    assert cache.get_or_create('key', lambda: 1) == 1
+    assert cache._key_locks == {}
+
+
+def test_get_or_create_builds_once():
+    cache = LRUCache()
+    builds = []
+    barrier = threading.Barrier(8)
+
+    def build():
+        builds.append(1)
+        return 'value'
+
+    def worker():
+        barrier.wait()
+        cache.get_or_create('key', build)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(builds) == 1
+
+
+@pytest.mark.parametrize('graph_factory', [
+    lambda: graphs.basic_rag_graph(checkpointer="none", retriever="bm25"),
+    lambda: graphs.one_shot_with_reflection_graph(checkpointer="none"),
+], ids=['basic_rag', 'reflection'])
+def test_second_run_makes_no_upstream_calls(tmp_path, fake_models, graph_factory):
+    students = load_cohort(DATA_DIR)
+    path = os.path.join(tmp_path, 'llm_cache.sqlite')
+    try:
+        enable_llm_cache(path=path)
+        first = run_cohort(students, graph_factory)
+        calls = upstream_calls(fake_models)
+        assert calls
+        #A new cache object: only the SQLite tier is shared with the first run.
+        enable_llm_cache(path=path)
+        second = run_cohort(students, graph_factory)
+    finally:
+        disable_llm_cache()
+    assert upstream_calls(fake_models) == calls
+    assert second == first
@@ -0,0 +1,73 @@
+from langgraph.checkpoint.memory import MemorySaver
+
+from agent import graphs
+from agent.checkpoint import BoundedMemorySaver, release_thread
+from benchmarks.common import load_cohort
+from conftest import DATA_DIR
+
+
+def config(thread_id):
+    return {'configurable': {'thread_id': thread_id}, 'recursion_limit': 20}
+
+
+def thread_keys(saver, thread_id):
+    return (
+        [k for k in saver.blobs if k[0] == thread_id],
+        [k for k in saver.writes if k[0] == thread_id],
+        saver.storage.get(thread_id, {}).get('', {}),
+    )
+
+
+def comparable(values):
+    #Message ids are random per run; compare what the model sees.
+    return {key: [(type(m).__name__, m.content) for m in value] if key == 'messages' else value
+            for key, value in values.items()}
+
+
+def paused_states(saver, exec_state, thread_id):
+    """State read back with get_state at every pause of a run interrupted after each node."""
+    graph = graphs.one_shot_with_reflection_graph(checkpointer=saver).builder.compile(
+        checkpointer=saver, interrupt_after='*'
+    )
+    states = []
+    graph.invoke(exec_state, config(thread_id))
+    while True:
+        snapshot = graph.get_state(config(thread_id))
+        states.append(comparable(snapshot.values))
+        if isinstance(saver, BoundedMemorySaver):
+            blobs, _, checkpoints = thread_keys(saver, thread_id)
+            assert len(checkpoints) <= 2
+            per_channel = {}
+            for key in blobs:
+                per_channel[key[2]] = per_channel.get(key[2], 0) + 1
+            assert max(per_channel.values()) <= 2
+            #The older retained checkpoint still reads back as the previous pause.
+            history = [comparable(h.values) for h in graph.get_state_history(config(thread_id))]
+            assert len(history) <= 2
+            if len(states) > 1:
+                assert history[1] == states[-2]
+        if not snapshot.next:
+            return states
+        graph.invoke(None, config(thread_id))
+
+
+def test_state_stays_coherent_while_checkpoints_are_trimmed(fake_models):
+    exec_state = next(iter(load_cohort(DATA_DIR).values()))
+    bounded = paused_states(BoundedMemorySaver(max_threads=1, max_checkpoints_per_thread=2), exec_state, 't1')
+    reference = paused_states(MemorySaver(), exec_state, 't1')
+    assert len(bounded) > 3
+    assert bounded == reference
+    assert 'current_knowledge_state' in bounded[-1]
+
+
+def test_least_recent_thread_is_evicted_and_release_empties_the_saver(fake_models):
+    saver = BoundedMemorySaver(max_threads=1, max_checkpoints_per_thread=2)
+    graph = graphs.one_shot_with_reflection_graph(checkpointer=saver)
+    first, second = list(load_cohort(DATA_DIR).values())[:2]
+    graph.invoke(first, config('t1'))
+    graph.invoke(second, config('t2'))
+    assert thread_keys(saver, 't1') == ([], [], {})
+    assert 'current_knowledge_state' in graph.get_state(config('t2')).values
+
+    release_thread(graph, config('t2'))
+    assert not saver.storage and not saver.blobs and not saver.writes
@@ -0,0 +1,69 @@
+import json
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from agent.compaction import (
+    DIGEST_PREFIX, ELIDED, SUPERSEDED_DRAFT, compaction_updates, fit_messages, history_tokens, tool_digest,
+)
+
+LOOKUP = json.dumps({'messages': "[P120] Pointers hold addresses. " * 40, 'paragraphs': ['P120']})
+
+
+def tool_round(n):
+    return [
+        AIMessage(content="", id=f"ai-{n}", tool_calls=[{'name': 'query_lesson', 'args': {'question': 'q'}, 'id': f"call_{n}"}]),
+        ToolMessage(content=LOOKUP, tool_call_id=f"call_{n}", id=f"tool-{n}"),
+    ]
+
+
+def history():
+    return [
+        HumanMessage(content="Grade these answers", id="human"),
+        *tool_round(1),
+        AIMessage(content="First draft", id="draft-1"),
+        AIMessage(content="Feedback", id="feedback", name="call_reflection"),
+        AIMessage(content="Second draft", id="draft-2"),
+    ]
+
+
+def test_tool_digest_keeps_paragraph_labels():
+    digest = tool_digest(LOOKUP)
+    assert digest.startswith(DIGEST_PREFIX) and digest.endswith("(paragraphs P120)")
+    assert len(digest) < len(LOOKUP)
+    assert tool_digest(digest) == digest
+
+
+def test_compaction_updates_digest_read_results_and_stub_superseded_drafts():
+    updates = {m.id: m for m in compaction_updates(history())}
+    assert set(updates) == {"tool-1", "draft-1"}
+    assert updates["tool-1"].content.startswith(DIGEST_PREFIX)
+    assert updates["tool-1"].tool_call_id == "call_1"
+    assert updates["draft-1"].content == SUPERSEDED_DRAFT
+
+
+def test_compaction_updates_leave_unread_results_and_are_idempotent():
+    messages = [HumanMessage(content="Grade", id="human"), *tool_round(1)]
+    #The last tool result has not been read by the model yet.
+    assert compaction_updates(messages) == []
+    compacted = history()
+    for update in compaction_updates(compacted):
+        compacted[[m.id for m in compacted].index(update.id)] = update
+    assert compaction_updates(compacted) == []
+
+
+def test_fit_messages_without_ceiling_is_a_no_op():
+    prompt = [HumanMessage(content="System prompt")]
+    assert fit_messages(prompt, history(), ceiling=0) == prompt + history()
+
+
+def test_fit_messages_cuts_earlier_turns_and_keeps_the_last():
+    prompt = [HumanMessage(content="System prompt")]
+    messages = [HumanMessage(content="Grade", id="human"), *tool_round(1), *tool_round(2)]
+    fitted = fit_messages(prompt, messages, ceiling=history_tokens(prompt) + 30)
+    assert len(fitted) == len(prompt) + len(messages)
+    assert [getattr(m, 'tool_call_id', None) for m in fitted] == [getattr(m, 'tool_call_id', None) for m in prompt + messages]
+    assert fitted[0] == prompt[0]
+    #The last round is sent whole, the earlier lookup is digested or elided.
+    assert fitted[-1].content == LOOKUP
+    assert fitted[3].content.startswith(DIGEST_PREFIX) or fitted[3].content == ELIDED
+    assert history_tokens(fitted) < history_tokens(prompt + messages)
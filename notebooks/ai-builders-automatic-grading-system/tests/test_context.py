@@ -0,0 +1,50 @@
+from langchain_core.documents import Document
+
+from agent.context import cite_exact, count_tokens, format_paragraphs, pack_paragraphs
+from agent.retrievers import split_paragraphs
+
+LESSON = "\n\n".join([
+    "Pointers store the address of another object. " * 5,
+    "Vectors manage a growable buffer of elements. " * 8,
+    "References are aliases that cannot be reseated. " * 6,
+])
+
+
+def hits():
+    return split_paragraphs(LESSON)
+
+
+def test_pack_paragraphs_respects_budget_and_lesson_order():
+    paragraphs = hits()
+    budget = count_tokens(paragraphs[2].page_content) + count_tokens(paragraphs[0].page_content)
+    packed = pack_paragraphs([paragraphs[2], paragraphs[1], paragraphs[0]], budget)
+    #The second hit does not fit next to the first, the smaller third one does; lesson order out.
+    assert packed == [paragraphs[0], paragraphs[2]]
+
+
+def test_pack_paragraphs_skips_overlaps_and_cuts_the_top_hit():
+    paragraphs = hits()
+    overlapping = Document(page_content=paragraphs[0].page_content[10:], metadata={'start_index': 10})
+    packed = pack_paragraphs([paragraphs[0], overlapping], budget=10_000)
+    assert packed == [paragraphs[0]]
+
+    cut = pack_paragraphs([paragraphs[1]], budget=5)
+    assert len(cut) == 1 and 0 < len(cut[0].page_content) < len(paragraphs[1].page_content)
+    start = cut[0].metadata['start_index']
+    assert LESSON[start:start + len(cut[0].page_content)] == cut[0].page_content
+
+
+def test_cite_exact_replaces_known_labels_only():
+    paragraphs = hits()
+    labels = [f"P{d.metadata['start_index']}" for d in paragraphs]
+    assert format_paragraphs(paragraphs[:1]).startswith(f"[{labels[0]}] Pointers")
+    state = {'evaluated_questions': [
+        {'question': 'Q1', 'cited_paragraph': f"{labels[1]}, {labels[0]} and {labels[1]}"},
+        {'question': 'Q2', 'cited_paragraph': "P99999"},
+        {'question': 'Q3', 'cited_paragraph': "the part about pointers"},
+    ]}
+    cited = cite_exact(state, LESSON)['evaluated_questions']
+    assert cited[0]['cited_paragraph'] == paragraphs[1].page_content + "\n\n" + paragraphs[0].page_content
+    assert cited[1]['cited_paragraph'] == "P99999"
+    assert cited[2]['cited_paragraph'] == "the part about pointers"
+    assert cite_exact(state, None) is state
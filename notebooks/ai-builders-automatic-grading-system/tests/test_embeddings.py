@@ -0,0 +1,36 @@
+import multiprocessing
+
+import numpy as np
+
+from agent.embeddings import EmbeddingCache
+
+
+def fill(cache_dir, worker):
+    cache = EmbeddingCache(cache_dir)
+    for batch in range(10):
+        hashes = [f"{worker}-{batch}-{i}" for i in range(5)]
+        cache.put('model', hashes, np.full((5, 3), worker * 100 + batch, dtype=np.float32))
+
+
+def test_processes_sharing_a_cache_never_get_the_same_rows(tmp_path):
+    processes = [multiprocessing.Process(target=fill, args=(str(tmp_path), worker)) for worker in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    hashes = [f"{w}-{b}-{i}" for w in range(4) for b in range(10) for i in range(5)]
+    found = EmbeddingCache(str(tmp_path)).get('model', hashes)
+    assert len(found) == len(hashes)
+    for text_hash, vector in found.items():
+        worker, batch, _ = map(int, text_hash.split('-'))
+        assert vector.tolist() == [worker * 100 + batch] * 3
+
+
+def test_rows_past_the_end_of_the_matrix_are_misses(tmp_path):
+    cache = EmbeddingCache(str(tmp_path))
+    cache.put('model', ['a', 'b'], np.ones((2, 3), dtype=np.float32))
+    assert set(cache.get('model', ['a', 'b', 'c'])) == {'a', 'b'}
+    #The matrix file lost its rows (e.g. replaced by an older copy).
+    with open(cache._matrix_path('model'), 'r+b') as f:
+        f.truncate(0)
+    assert EmbeddingCache(str(tmp_path)).get('model', ['a', 'b']) == {}
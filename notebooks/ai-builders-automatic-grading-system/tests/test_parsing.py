@@ -0,0 +1,71 @@
+import json
+
+from agent.parsing import GradeStreamParser, parse_deck
+
+DECK = {
+    'evaluated_questions': [
+        {'question': 'What is a "tensor"?', 'score': 'A', 'reason': 'Uses {braces} and ] in text', 'cited_paragraph': 'P1'},
+        {'question': 'Why normalise?', 'score': 'c', 'reason': 'Partly right', 'cited_paragraph': 'P2'},
+    ]
+}
+
+
+def stream(text, size):
+    parser = GradeStreamParser()
+    grades = []
+    for start in range(0, len(text), size):
+        grades += parser.feed(text[start:start + size])
+    return grades
+
+
+def test_stream_parser_yields_each_grade_whatever_the_chunking():
+    text = "Strategy notes first.\n```json\n" + json.dumps(DECK) + "\n```"
+    for size in (1, 3, 17, len(text)):
+        grades = stream(text, size)
+        assert [g.question for g in grades] == [q['question'] for q in DECK['evaluated_questions']]
+        assert grades[0].reason == 'Uses {braces} and ] in text'
+
+
+def test_stream_parser_yields_a_grade_before_the_deck_is_closed():
+    text = json.dumps(DECK)
+    first_closed = text.index('}, {') + 1
+    parser = GradeStreamParser()
+    assert [g.question for g in parser.feed(text[:first_closed])] == ['What is a "tensor"?']
+    assert [g.question for g in parser.feed(text[first_closed:])] == ['Why normalise?']
+
+
+def test_stream_parser_skips_invalid_items_and_fills_missing_fields():
+    text = json.dumps({'evaluated_questions': [{'question': 'Q1'}, {'question': 'Q2', 'score': 'B'}]})
+    grades = stream(text, 5)
+    assert [(g.question, g.score, g.reason) for g in grades] == [('Q2', 'B', '')]
+
+
+def test_stream_parser_follows_a_revised_deck():
+    first = json.dumps({'evaluated_questions': [{'question': 'Q1', 'score': 'B'}]})
+    revised = json.dumps({'evaluated_questions': [{'question': 'Q1', 'score': 'A'}]})
+    grades = stream(first + "\nRevised:\n" + revised, 4)
+    assert [g.score for g in grades] == ['B', 'A']
+
+
+def test_parse_deck_reads_fenced_json_and_normalises_scores():
+    text = "Notes.\n```json\n" + json.dumps(DECK) + "\n```"
+    deck = parse_deck(text, expected_questions=['What is a  "tensor"?', 'Why normalise?'])
+    assert [item.score for item in deck.evaluated_questions] == ['A', 'C']
+
+
+def test_parse_deck_rejects_scores_outside_the_grade_scale():
+    for score in ('G', 'B+', '5'):
+        deck = {'evaluated_questions': [{'question': 'Q1', 'score': score, 'reason': '', 'cited_paragraph': ''}]}
+        assert parse_deck(json.dumps(deck)) is None
+
+
+def test_parse_deck_rejects_missing_questions_and_non_decks():
+    assert parse_deck(json.dumps(DECK), expected_questions=['Why normalise?', 'Another question']) is None
+    assert parse_deck("No JSON at all") is None
+    assert parse_deck(json.dumps({'evaluated_questions': []})) is None
+
+
+def test_parse_deck_accepts_every_letter_of_the_prompt_scale():
+    deck = {'evaluated_questions': [{'question': f'Q{s}', 'score': s.lower(), 'reason': '', 'cited_paragraph': ''}
+                                    for s in 'ABCDEF']}
+    assert [item.score for item in parse_deck(json.dumps(deck)).evaluated_questions] == list('ABCDEF')
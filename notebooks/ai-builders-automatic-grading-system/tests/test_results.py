@@ -0,0 +1,85 @@
+import json
+import os
+
+import pytest
+
+from agent import graphs
+from agent.batch import run_cohort
+from agent.results import ResultsSink, iter_results, load_results, results_frame
+from benchmarks.common import load_cohort
+from conftest import DATA_DIR, upstream_calls
+
+GRADE = {'evaluated_questions': [{'question': 'Q1', 'score': 'A', 'reason': 'ok', 'cited_paragraph': 'P0'}]}
+
+
+def one_shot():
+    return graphs.one_shot_graph(checkpointer="none", single_pass=True)
+
+
+def test_sink_counts_only_successful_results_as_done(tmp_path):
+    path = os.path.join(tmp_path, 'grades.jsonl')
+    sink = ResultsSink(path)
+    sink.write('lesson_1/s1', GRADE)
+    sink.write('lesson_1/s2', {'ERROR': "RuntimeError()"})
+    sink.write(3, GRADE)
+    reopened = ResultsSink(path)
+    assert 'lesson_1/s1' in reopened and 3 in reopened
+    assert 'lesson_1/s2' not in reopened
+    assert reopened.load(['lesson_1/s1', 'lesson_1/s2']) == {'lesson_1/s1': GRADE, 'lesson_1/s2': {'ERROR': "RuntimeError()"}}
+
+
+def test_truncated_line_is_skipped_and_not_glued_to_the_next(tmp_path):
+    path = os.path.join(tmp_path, 'grades.jsonl')
+    with open(path, 'w') as f:
+        f.write(json.dumps({'key': 's1', 'result': GRADE}) + '\n')
+        f.write(json.dumps({'key': 's2', 'result': GRADE})[:25])
+    sink = ResultsSink(path)
+    assert 's1' in sink and 's2' not in sink
+    sink.write('s2', GRADE)
+    assert [key for key, _ in iter_results(path)] == ['s1', 's2']
+    assert load_results(path) == {'s1': GRADE, 's2': GRADE}
+
+
+def test_results_frame_keeps_the_last_result_per_key(tmp_path):
+    path = os.path.join(tmp_path, 'grades.jsonl')
+    sink = ResultsSink(path)
+    sink.write('lesson_2/s1', {'evaluated_questions': [{'question': 'Q1', 'score': 'C'}]})
+    sink.write('lesson_2/s1', GRADE)
+    sink.write('s2', {'ERROR': "x"})
+    frame = results_frame(path, columns=['lesson', 'student_id', 'score'])
+    assert frame.to_dict('records') == [{'lesson': 'lesson_2', 'student_id': 's1', 'score': 'A'}]
+
+
+def test_cohort_resumes_from_the_sink(tmp_path, fake_models):
+    path = os.path.join(tmp_path, 'grades.jsonl')
+    students = dict(list(load_cohort(DATA_DIR).items())[:6])
+    half = dict(list(students.items())[:3])
+    first = run_cohort(half, one_shot, sink=ResultsSink(path))
+    calls = upstream_calls(fake_models)
+    results = run_cohort(students, one_shot, sink=ResultsSink(path))
+    #Only the three students missing from the file were graded again.
+    assert upstream_calls(fake_models) - calls == calls
+    assert list(results) == list(students)
+    assert {key: results[key] for key in half} == first
+    assert set(ResultsSink(path).done) == set(students)
+
+
+def test_cohort_with_sink_needs_dict_input(tmp_path):
+    with pytest.raises(ValueError):
+        run_cohort([{}], one_shot, sink=ResultsSink(os.path.join(tmp_path, 'grades.jsonl')))
+
+
+def test_cohort_can_write_to_the_sink_only(tmp_path, fake_models):
+    path = os.path.join(tmp_path, 'grades.jsonl')
+    students = dict(list(load_cohort(DATA_DIR).items())[:6])
+    run_cohort(dict(list(students.items())[:2]), one_shot, sink=ResultsSink(path))
+    counts = run_cohort(students, one_shot, sink=ResultsSink(path), return_results=False)
+    assert counts == {'graded': 4, 'failed': 0, 'skipped': 2}
+    frame = results_frame(path, columns=['key', 'question'])
+    assert sorted(set(frame['key'])) == sorted(students)
+    assert len(frame) == sum(len(state['user_input']['open_questions']) for state in students.values())
+
+
+def test_sink_only_mode_needs_a_sink():
+    with pytest.raises(ValueError):
+        run_cohort({'s1': {}}, one_shot, return_results=False)
@@ -0,0 +1,46 @@
+import pytest
+from langchain_core.documents import Document
+
+from agent.retrievers import BM25Retriever, Retriever, split_paragraphs, tokenize
+
+DOCUMENTS = [
+    Document(page_content="Pointers in C++ hold the address of another variable.", metadata={'start_index': 0}),
+    Document(page_content="A vector grows its buffer when it runs out of capacity.", metadata={'start_index': 60}),
+    Document(page_content="References are aliases and cannot be reseated like pointers.", metadata={'start_index': 120}),
+]
+
+
+def test_retriever_is_abstract():
+    with pytest.raises(TypeError):
+        Retriever()
+
+
+def test_tokenize_keeps_cpp():
+    assert tokenize("Why use C++ vectors?") == ['why', 'use', 'c++', 'vectors']
+
+
+def test_bm25_ranks_matching_paragraphs_first():
+    retriever = BM25Retriever(DOCUMENTS)
+    results = retriever.search_many(["what address do pointers hold", "vector capacity buffer"], k=2)
+    assert [d.metadata['start_index'] for d in results[0]] == [0, 120]
+    assert results[1][0].metadata['start_index'] == 60
+    assert results[0][0].metadata['score'] >= results[0][1].metadata['score'] > 0
+
+
+def test_bm25_edge_cases():
+    retriever = BM25Retriever(DOCUMENTS)
+    assert retriever.search_many([]) == []
+    assert len(retriever.search("pointers", k=10)) == len(DOCUMENTS)
+    #Unknown words score zero everywhere instead of failing.
+    assert all(d.metadata['score'] == 0 for d in retriever.search("quaternion", k=3))
+
+
+def test_split_paragraphs_merges_short_blocks():
+    lesson = "Heading\n\n" + "x" * 250 + "\n\n" + "y" * 250 + "\n\nEnd."
+    documents = split_paragraphs(lesson)
+    assert len(documents) == 2
+    assert documents[0].page_content.startswith("Heading")
+    assert documents[-1].page_content.endswith("End.")
+    for document in documents:
+        start = document.metadata['start_index']
+        assert lesson[start:start + len(document.page_content)] == document.page_content
@@ -0,0 +1,70 @@
+import json
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from agent import graphs
+from agent.nodes import MAX_REFLECTION_STEPS, REFLECTION_MESSAGE_NAME, route_reflection
+from agent.prompts import NO_FEEDBACK_REPLY
+from conftest import upstream_calls
+
+QUESTIONS = [{'question': 'What is a pointer?'}, {'question': 'What is a reference?'}]
+
+
+def evaluation(*questions):
+    return json.dumps({'evaluated_questions': [
+        {'question': q, 'score': 'B', 'reason': 'ok', 'cited_paragraph': 'P0'} for q in questions
+    ]})
+
+
+def state(message, steps=0):
+    return {'user_input': {'open_questions': QUESTIONS}, 'reflection_steps': steps,
+            'messages': [HumanMessage(content="Grade"), message]}
+
+
+def feedback(text):
+    return AIMessage(content=text, name=REFLECTION_MESSAGE_NAME)
+
+
+def test_complete_evaluation_goes_to_reflection_until_the_step_cap():
+    message = AIMessage(content=evaluation('What is a pointer?', 'What is a reference?'))
+    assert route_reflection(state(message)) == 'call_reflection'
+    assert route_reflection(state(message, steps=MAX_REFLECTION_STEPS)) == 'format_cks'
+
+
+def test_partial_or_broken_evaluations_are_left_to_the_supervisor():
+    assert route_reflection(state(AIMessage(content=evaluation('What is a pointer?')))) is None
+    assert route_reflection(state(AIMessage(content="Here is my evaluation: {"))) is None
+    assert route_reflection(state(AIMessage(content="  "))) is None
+    tool_call = AIMessage(content="", tool_calls=[{'name': 'query_lesson', 'args': {'question': 'q'}, 'id': 'call_0'}])
+    assert route_reflection(state(tool_call)) is None
+    assert route_reflection(state(HumanMessage(content=evaluation('What is a pointer?', 'What is a reference?')))) is None
+
+
+@pytest.mark.parametrize('text', [NO_FEEDBACK_REPLY, f" {NO_FEEDBACK_REPLY.lower()}.\n"])
+def test_exact_no_feedback_reply_finishes(text):
+    assert route_reflection(state(feedback(text))) == 'format_cks'
+
+
+@pytest.mark.parametrize('text', [
+    "I don’t have any feedback to include in any question so far.",
+    "No further feedback on question 1; however question 2 deserves a C.",
+    "Question 2 should be a C: the answer confuses references with pointers.",
+])
+def test_free_text_feedback_is_left_to_the_supervisor(text):
+    assert route_reflection(state(feedback(text))) is None
+
+
+def test_local_routing_grades_like_the_llm_supervisor(fake_models):
+    from benchmarks.common import load_cohort
+    from conftest import DATA_DIR
+
+    exec_state = next(iter(load_cohort(DATA_DIR).values()))
+    results = {}
+    for routing in graphs.ROUTING_MODES:
+        graph = graphs.one_shot_with_reflection_graph(checkpointer="none", routing=routing)
+        before = upstream_calls(fake_models)
+        final = graph.invoke(exec_state, {'recursion_limit': 20})
+        results[routing] = (final['current_knowledge_state'], upstream_calls(fake_models) - before)
+    assert results['local'][0] == results['llm'][0]
+    assert results['local'][1] < results['llm'][1]
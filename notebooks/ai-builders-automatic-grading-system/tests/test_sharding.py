@@ -0,0 +1,52 @@
+import pytest
+
+from agent import graphs
+from agent.batch import run_cohort
+from agent.nodes import merge_shards, shard_questions
+from benchmarks.common import load_cohort
+from conftest import DATA_DIR
+
+
+def question(text, *concepts):
+    return {'question': text, 'concepts_evaluated': list(concepts)}
+
+
+def test_shard_questions_keeps_shared_concepts_together():
+    questions = [question('Q0', 'a'), question('Q1', 'b'), question('Q2', 'a'), question('Q3', 'c'), question('Q4', 'b')]
+    shards = shard_questions(questions, 2)
+    assert sorted(i for shard in shards for i in shard) == list(range(5))
+    assert all(len(shard) <= 2 for shard in shards)
+    assert [0, 2] in shards and [1, 4] in shards
+
+
+def test_shard_questions_splits_groups_larger_than_a_shard():
+    questions = [question(f'Q{i}', 'a') for i in range(5)]
+    assert shard_questions(questions, 2) == [[0, 1], [2, 3], [4]]
+    assert shard_questions([], 2) == []
+
+
+def test_merge_shards_restores_submission_order():
+    state = {
+        'user_input': {'open_questions': [question('First  question'), question('Second'), question('Third')]},
+        'shard_results': [
+            {'shard_index': 1, 'evaluated_questions': [{'question': 'Third', 'score': 'B'}]},
+            {'shard_index': 0, 'evaluated_questions': [{'question': 'Second', 'score': 'C'},
+                                                       {'question': 'First question', 'score': 'A'}]},
+        ],
+    }
+    merged = merge_shards(state)['current_knowledge_state']['evaluated_questions']
+    assert [item['score'] for item in merged] == ['A', 'C', 'B']
+
+
+def test_sharded_graph_grades_every_question_in_order(fake_models):
+    students = dict(list(load_cohort(DATA_DIR).items())[:4])
+    results = run_cohort(students, lambda: graphs.sharded_one_shot_graph(checkpointer="none", shard_size=2))
+    for key, state in students.items():
+        graded = [item['question'] for item in results[key]['evaluated_questions']]
+        assert graded == [q['question'] for q in state['user_input']['open_questions']]
+
+
+@pytest.mark.parametrize('shard_size', [0, -1, 1.5])
+def test_sharded_graph_rejects_invalid_shard_size(shard_size):
+    with pytest.raises(ValueError, match="shard_size"):
+        graphs.sharded_one_shot_graph(checkpointer="none", shard_size=shard_size)
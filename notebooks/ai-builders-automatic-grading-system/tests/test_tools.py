@@ -0,0 +1,91 @@
+import json
+import os
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from agent import nodes
+from agent.fakes import FakeChatModel
+from agent.models import set_chat_model_factory
+from agent.nodes import tool_node_eval
+from agent.tools import batch_query_lesson
+from conftest import DATA_DIR, upstream_calls
+
+QUESTIONS = ["What is a pointer?", "  what is a   POINTER? ", "How does a vector grow?", "What is a pointer?"]
+
+
+@pytest.fixture
+def lesson_doc():
+    with open(os.path.join(DATA_DIR, 'lesson1.txt')) as f:
+        return f.read()
+
+
+@pytest.fixture
+def echo_models():
+    """Fake models whose answers quote the end of the prompt, i.e. the question they were asked."""
+    created = []
+
+    def factory(model):
+        created.append(FakeChatModel(model_name=model, reply_chars=120))
+        return created[-1]
+
+    set_chat_model_factory(factory)
+    yield created
+    set_chat_model_factory(None)
+
+
+def answered(result) -> str:
+    return result['messages'].partition(' Answer: ')[2]
+
+
+def tool_state(lesson_doc, calls):
+    return {'lesson_doc': lesson_doc, 'messages': [
+        HumanMessage(content="Grade"),
+        AIMessage(content="", tool_calls=[{'name': name, 'args': args, 'id': call_id} for call_id, name, args in calls]),
+    ]}
+
+
+def test_duplicates_are_answered_once(lesson_doc, echo_models):
+    results = batch_query_lesson(QUESTIONS, lesson_doc, retriever="bm25")
+    assert upstream_calls(echo_models) == 2
+    assert [r['messages'].partition(' Answer: ')[0] for r in results] == [f"Question: {q}" for q in QUESTIONS]
+    assert answered(results[0]) == answered(results[1]) == answered(results[3])
+    assert "What is a pointer?" in answered(results[0])
+    assert "How does a vector grow?" in answered(results[2])
+    assert all(r['paragraphs'] for r in results)
+
+
+def test_answers_go_back_to_their_tool_call(lesson_doc, echo_models):
+    calls = [(f"call_{i}", 'query_lesson', {'question': q}) for i, q in enumerate(reversed(QUESTIONS))]
+    messages = tool_node_eval(tool_state(lesson_doc, calls), {'configurable': {}}, retriever="bm25")['messages']
+    assert [m.tool_call_id for m in messages] == [call_id for call_id, _, _ in calls]
+    for message, (_, _, args) in zip(messages, calls):
+        result = json.loads(message.content)
+        assert message.status == 'success'
+        assert result['messages'].startswith(f"Question: {args['question']} Answer: ")
+    assert "How does a vector grow?" in answered(json.loads(messages[1].content))
+    assert upstream_calls(echo_models) == 2
+
+
+def test_batch_failure_reports_one_error_per_call(lesson_doc, monkeypatch, fake_models):
+    def fail(*args, **kwargs):
+        raise RuntimeError("index unavailable")
+
+    monkeypatch.setattr(nodes, 'batch_query_lesson', fail)
+    calls = [(f"call_{i}", 'query_lesson', {'question': q}) for i, q in enumerate(QUESTIONS[:3])]
+    messages = tool_node_eval(tool_state(lesson_doc, calls), {'configurable': {}}, retriever="bm25")['messages']
+    assert [m.tool_call_id for m in messages] == ["call_0", "call_1", "call_2"]
+    assert all(m.status == 'error' and "index unavailable" in m.content for m in messages)
+
+
+def test_mixed_tool_calls_fall_back_to_the_tool_node(lesson_doc, monkeypatch, fake_models):
+    def unexpected(*args, **kwargs):
+        raise AssertionError("batched path used for a mixed turn")
+
+    monkeypatch.setattr(nodes, 'batch_query_lesson', unexpected)
+    calls = [("call_0", 'query_lesson', {'question': QUESTIONS[0]}), ("call_1", 'other_tool', {})]
+    messages = tool_node_eval(tool_state(lesson_doc, calls), {'configurable': {}}, retriever="bm25")['messages']
+    by_id = {m.tool_call_id: m for m in messages}
+    assert set(by_id) == {"call_0", "call_1"}
+    assert json.loads(by_id["call_0"].content)['messages'].startswith(f"Question: {QUESTIONS[0]}")
+    assert by_id["call_1"].status == 'error'
@@ -0,0 +1,83 @@
+import io
+import json
+
+import pytest
+
+from agent import precompute
+from agent.worker import GradingWorker
+from benchmarks.common import load_cohort
+from conftest import DATA_DIR
+
+
+def request(key, state, **fields):
+    return {'id': key, 'lesson': key.split('/')[0], 'open_questions': state['user_input']['open_questions'], **fields}
+
+
+@pytest.fixture
+def students():
+    return list(load_cohort(DATA_DIR).items())[:3]
+
+
+@pytest.fixture
+def worker(tmp_path, monkeypatch, fake_models):
+    monkeypatch.setattr(precompute, 'QUESTION_CONTEXT_DIR', str(tmp_path))
+    worker = GradingWorker(("one_shot", "precomputed_rag"), data_dir=DATA_DIR, retriever="bm25")
+    worker.warm()
+    return worker
+
+
+def serve(worker, lines):
+    out = io.StringIO()
+    worker.serve(lines, out, concurrency=2)
+    return {response['id']: response for response in map(json.loads, out.getvalue().splitlines())}
+
+
+def test_serve_grades_requests(worker, students):
+    responses = serve(worker, [json.dumps(request(key, state, options={'single_pass': True})) for key, state in students])
+    assert set(responses) == {key for key, _ in students}
+    for key, state in students:
+        graded = responses[key]['current_knowledge_state']['evaluated_questions']
+        assert len(graded) == len(state['user_input']['open_questions'])
+
+
+def test_serve_reports_errors_per_request(worker, students):
+    key, state = students[0]
+    out = io.StringIO()
+    worker.serve(["[1]\n", '"s"\n'], out)
+    errors = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [(r['id'], r['error'].startswith('ValueError')) for r in errors] == [(None, True), (None, True)]
+
+    responses = serve(worker, [
+        "{not json",
+        json.dumps({**request(key, state), 'id': 'lesson', 'lesson': 99}),
+        json.dumps({**request(key, state), 'id': 'option', 'options': {'temperature': 1}}),
+        json.dumps({**request(key, state), 'id': 'graph', 'graph': 'no_such_graph'}),
+        "",
+        json.dumps(request(key, state)),
+    ])
+    assert set(responses) == {None, 'lesson', 'option', 'graph', key}
+    assert responses[None]['error'].startswith('JSONDecodeError')
+    assert "Unknown lesson 99" in responses['lesson']['error']
+    assert "Unknown graph options ['temperature']" in responses['option']['error']
+    assert "Unknown graph 'no_such_graph'" in responses['graph']['error']
+    assert 'current_knowledge_state' in responses[key] and 'error' not in responses[key]
+
+
+def test_precomputed_rag_requests_get_their_question_context(worker, students):
+    key, state = students[0]
+    exec_state = worker.exec_state(request(key, state, graph="precomputed_rag"))
+    questions = state['user_input']['open_questions']
+    assert set(exec_state['question_context']) == {str(q['id']) for q in questions}
+    assert all(entry['chunks'] for entry in exec_state['question_context'].values())
+    assert 'question_context' not in worker.exec_state(request(key, state))
+
+    response = worker.grade(request(key, state, graph="precomputed_rag"))
+    assert 'error' not in response
+    assert len(response['current_knowledge_state']['evaluated_questions']) == len(questions)
+
+
+def test_precomputed_rag_needs_a_question_bank(worker, students):
+    key, state = students[0]
+    worker.lessons['7'] = worker.lessons[key.split('/')[0].split('_')[1]]
+    with pytest.raises(ValueError, match="No precomputed question context"):
+        worker.exec_state({**request(key, state, graph="precomputed_rag"), 'lesson': 7})